@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能测试
+用法:
+  python benchmark.py pixmap [--pdf 文件] [--pages 页数]
+  python benchmark.py suite [--quick] [--save-baseline] [--baseline 文件]
+
+suite 生成固定随机种子的测试素材（不同尺寸和留白比例的图片、文字PDF和扫描PDF、
+几千组标签文字），在单独的子进程中逐项测量吞吐量、内存峰值和输出大小，
+并与保存的基线比较，超出容差时以退出码1结束
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from crop_engine import allow_large_images, find_content_box, is_croppable, PDF_WHITE_THRESHOLD
+from pdf_crop_tool import crop_page_image, insert_page_image
+
+# 测试素材的随机种子，保证每次生成的内容相同
+SEED = 20240601
+# 默认基线文件
+BASELINE_FILE = 'benchmark_baseline.json'
+BASELINE_VERSION = 1
+# 与基线比较时允许的变化：吞吐量下降、内存峰值增加、输出变大的比例
+THROUGHPUT_TOLERANCE = 0.10
+MEMORY_TOLERANCE = 0.20
+OUTPUT_TOLERANCE = 0.02
+
+# 图片素材：(宽, 高) × 每边留白比例；最后一个尺寸超过 HUGE_IMAGE_PIXELS，走大图路径
+SUITE_IMAGE_SIZES = [(1200, 900), (3000, 2000), (8000, 7000)]
+SUITE_IMAGE_MARGINS = [0.05, 0.25]
+SUITE_TEXT_PAGES = 40
+SUITE_SCAN_PAGES = 20
+SUITE_LABEL_GROUPS = 3000
+# --quick 时的素材规模
+QUICK_IMAGE_SIZES = [(1200, 900), (3000, 2000)]
+QUICK_TEXT_PAGES = 10
+QUICK_SCAN_PAGES = 5
+QUICK_LABEL_GROUPS = 500
+
+
+def make_sample_pdf(path, pages=20):
+    """生成带文字和图形的测试PDF，四周留白"""
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((90, 120), f"Sample page {i + 1}", fontsize=28)
+        for line in range(20):
+            page.insert_text((90, 170 + line * 24), "The quick brown fox jumps over the lazy dog " * 2,
+                             fontsize=10)
+        page.draw_rect(fitz.Rect(90, 680, 500, 760), color=(0.2, 0.2, 0.6), width=2)
+    doc.save(path)
+    doc.close()
+
+
+def legacy_crop_page(page, new_pdf):
+    """改造前的单页流程：PNG编码、解码、裁剪、再PNG编码、插入时再解码"""
+    pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
+    img_data = pix.tobytes("png")
+    with Image.open(BytesIO(img_data)) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        box = find_content_box(np.asarray(img), PDF_WHITE_THRESHOLD)
+        if is_croppable(box):
+            left, top, right, bottom = box
+            cropped = img.crop((left, top, right + 1, bottom + 1))
+        else:
+            cropped = img
+        output_stream = BytesIO()
+        cropped.save(output_stream, format='PNG', dpi=(300, 300))
+        new_page = new_pdf.new_page(width=cropped.width, height=cropped.height)
+        new_page.insert_image(fitz.Rect(0, 0, cropped.width, cropped.height),
+                              stream=output_stream.getvalue())
+
+
+def bench_pixmap(pdf_path=None, pages=20):
+    """对比PNG往返流程与像素缓冲区直通流程的单页耗时"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if pdf_path is None:
+            pdf_path = os.path.join(temp_dir, 'sample.pdf')
+            make_sample_pdf(pdf_path, pages)
+
+        document = fitz.open(pdf_path)
+        total = min(pages, len(document))
+        results = {}
+        for name in ('PNG往返', '像素直通'):
+            new_pdf = fitz.open()
+            start = time.perf_counter()
+            for page_num in range(total):
+                if name == 'PNG往返':
+                    legacy_crop_page(document[page_num], new_pdf)
+                else:
+                    insert_page_image(new_pdf, *crop_page_image(document[page_num]))
+            elapsed = time.perf_counter() - start
+            output_size = len(new_pdf.tobytes(garbage=3, deflate=True))
+            new_pdf.close()
+            results[name] = (elapsed / total * 1000, output_size)
+        document.close()
+
+    print(f"{'流程':<8}{'每页耗时(ms)':>14}{'输出大小(字节)':>16}")
+    for name, (per_page_ms, output_size) in results.items():
+        print(f"{name:<8}{per_page_ms:>14.1f}{output_size:>16}")
+    before, after = results['PNG往返'][0], results['像素直通'][0]
+    print(f"加速: {before / after:.1f}x（共 {total} 页）")
+    return results
+
+
+def make_sample_image(path, size, margin, rng):
+    """生成四周按比例留白的测试图片，内容为平滑的随机色块，接近照片的压缩率"""
+    width, height = size
+    left, top = int(width * margin), int(height * margin)
+    content_w, content_h = width - 2 * left, height - 2 * top
+    coarse = rng.integers(0, 200, size=(max(content_h // 32, 2), max(content_w // 32, 2), 3), dtype=np.uint8)
+    content = Image.fromarray(coarse).resize((content_w, content_h), Image.BILINEAR)
+    img = Image.new('RGB', size, 'white')
+    img.paste(content, (left, top))
+    img.save(path)
+
+
+def make_scan_pdf(path, pages, rng):
+    """生成扫描件式的PDF：每页一张带轻微噪点的灰度JPEG，中间是深色的文字行"""
+    doc = fitz.open()
+    width, height = 1240, 1754
+    for _ in range(pages):
+        pixels = rng.integers(240, 256, size=(height, width), dtype=np.uint8)
+        for row in range(220, 1500, 48):
+            line_width = int(rng.integers(600, 1000))
+            pixels[row:row + 22, 150:150 + line_width] = rng.integers(0, 90, size=(22, line_width), dtype=np.uint8)
+        stream = BytesIO()
+        Image.fromarray(pixels, 'L').save(stream, format='JPEG', quality=85)
+        page = doc.new_page(width=595, height=842)
+        page.insert_image(page.rect, stream=stream.getvalue())
+    doc.save(path)
+    doc.close()
+
+
+def make_label_text(groups, rng):
+    """生成标签文字：每组1到4行，中文、字母和数字混合，行长不一"""
+    words = ['货号', '数量', '规格', '批次', '仓位', '客户', 'Carton', 'SKU', 'Lot', 'Qty']
+    result = []
+    for _ in range(groups):
+        lines = []
+        for _ in range(int(rng.integers(1, 5))):
+            word = words[int(rng.integers(len(words)))]
+            code = '-'.join(str(int(n)) for n in rng.integers(0, 10000, size=int(rng.integers(1, 6))))
+            lines.append(f"{word}: {code}")
+        result.append('\n'.join(lines))
+    return '\n\n'.join(result)
+
+
+def make_corpus(corpus_dir, quick=False):
+    """在 corpus_dir 中生成全部测试素材"""
+    rng = np.random.default_rng(SEED)
+    image_dir = os.path.join(corpus_dir, 'images')
+    os.makedirs(image_dir, exist_ok=True)
+    for width, height in (QUICK_IMAGE_SIZES if quick else SUITE_IMAGE_SIZES):
+        for margin in SUITE_IMAGE_MARGINS:
+            make_sample_image(os.path.join(image_dir, f'{width}x{height}_{int(margin * 100)}.png'),
+                              (width, height), margin, rng)
+    make_sample_pdf(os.path.join(corpus_dir, 'text.pdf'), QUICK_TEXT_PAGES if quick else SUITE_TEXT_PAGES)
+    make_scan_pdf(os.path.join(corpus_dir, 'scan.pdf'), QUICK_SCAN_PAGES if quick else SUITE_SCAN_PAGES, rng)
+    with open(os.path.join(corpus_dir, 'labels.txt'), 'w', encoding='utf-8') as f:
+        f.write(make_label_text(QUICK_LABEL_GROUPS if quick else SUITE_LABEL_GROUPS, rng))
+
+
+def peak_memory_mb():
+    """当前进程的内存峰值（MB）"""
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_memory_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为KB
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _windows_peak_memory_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+    return counters.PeakWorkingSetSize / (1024 * 1024)
+
+
+def _suite_images(corpus_dir, output_dir):
+    from crop_images_to_pdf import image_file_to_pdf
+    image_dir = os.path.join(corpus_dir, 'images')
+    outputs = []
+    for name in sorted(os.listdir(image_dir)):
+        output = os.path.join(output_dir, os.path.splitext(name)[0] + '.pdf')
+        image_file_to_pdf(os.path.join(image_dir, name), output)
+        outputs.append(output)
+    return len(outputs), outputs
+
+
+def _suite_pdf(source, mode):
+    def run(corpus_dir, output_dir):
+        from pdf_crop_tool import crop_pdf_pages
+        output = os.path.join(output_dir, f'{source}_{mode}.pdf')
+        if not crop_pdf_pages(os.path.join(corpus_dir, f'{source}.pdf'), output, mode, log=lambda message: None):
+            raise RuntimeError(f"{source}.pdf 处理失败")
+        return _page_count(output), [output]
+    return run
+
+
+def _suite_labels(corpus_dir, output_dir):
+    from label_engine import create_label_pdf, parse_label_groups
+    with open(os.path.join(corpus_dir, 'labels.txt'), 'r', encoding='utf-8') as f:
+        groups = parse_label_groups(f.read())
+    output = os.path.join(output_dir, 'labels.pdf')
+    create_label_pdf(groups, output)
+    return len(groups), [output]
+
+
+def _page_count(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return len(doc)
+
+
+# 测试项: (计数单位, 函数)；函数返回 (处理数量, 输出文件列表)
+SUITE_CASES = {
+    'images': ('images/s', _suite_images),
+    'pdf_text_raster': ('pages/s', _suite_pdf('text', 'raster')),
+    'pdf_text_vector': ('pages/s', _suite_pdf('text', 'vector')),
+    'pdf_scan_raster': ('pages/s', _suite_pdf('scan', 'raster')),
+    'labels': ('groups/s', _suite_labels),
+}
+
+
+def _run_case_in_worker(name, corpus_dir, repeat):
+    """在新的子进程中运行一个测试项，内存峰值不受其他测试项影响；吞吐量取最快的一次"""
+    unit, run = SUITE_CASES[name]
+    best = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as output_dir:
+            start = time.perf_counter()
+            count, outputs = run(corpus_dir, output_dir)
+            elapsed = time.perf_counter() - start
+            output_bytes = sum(os.path.getsize(path) for path in outputs)
+        if best is None or elapsed < best[0]:
+            best = (elapsed, count, output_bytes)
+    elapsed, count, output_bytes = best
+    return {
+        'unit': unit,
+        'count': count,
+        'seconds': round(elapsed, 4),
+        'throughput': round(count / elapsed, 3),
+        'peak_mb': round(peak_memory_mb(), 1),
+        'output_bytes': output_bytes,
+    }
+
+
+def run_suite(corpus_dir, repeat=3, cases=None):
+    """逐项运行测试，每项使用新的子进程"""
+    results = {}
+    for name in cases or SUITE_CASES:
+        # 进程池只有一个进程，用完即关，保证每项的内存峰值单独统计
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results[name] = executor.submit(_run_case_in_worker, name, corpus_dir, repeat).result()
+        result = results[name]
+        print(f"{name:<18}{result['throughput']:>10.2f} {result['unit']:<9}{result['peak_mb']:>9.1f} MB"
+              f"{result['output_bytes']:>14}")
+    return results
+
+
+def compare_with_baseline(results, baseline):
+    """与基线比较，返回回退说明列表"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['throughput'] < base['throughput'] * (1 - THROUGHPUT_TOLERANCE):
+            regressions.append(f"{name}: 吞吐量 {base['throughput']} -> {result['throughput']} {result['unit']}")
+        if result['peak_mb'] > base['peak_mb'] * (1 + MEMORY_TOLERANCE):
+            regressions.append(f"{name}: 内存峰值 {base['peak_mb']} -> {result['peak_mb']} MB")
+        if result['output_bytes'] > base['output_bytes'] * (1 + OUTPUT_TOLERANCE):
+            regressions.append(f"{name}: 输出大小 {base['output_bytes']} -> {result['output_bytes']} 字节")
+    return regressions
+
+
+def bench_suite(quick=False, repeat=3, baseline_path=BASELINE_FILE, save_baseline=False, cases=None,
+                corpus_dir=None):
+    """运行完整测试并与基线比较，返回退出码"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus_dir = corpus_dir or temp_dir
+        print(f"生成测试素材: {corpus_dir}")
+        make_corpus(corpus_dir, quick)
+        print(f"{'测试项':<15}{'吞吐量':>13}{'':<7}{'内存峰值':>10}{'输出(字节)':>10}")
+        results = run_suite(corpus_dir, repeat, cases)
+
+    record = {
+        'version': BASELINE_VERSION,
+        'quick': quick,
+        'machine': platform.platform(),
+        'python': platform.python_version(),
+        'cases': results,
+    }
+    if save_baseline:
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=1)
+        print(f"已保存基线: {baseline_path}")
+        return 0
+
+    try:
+        with open(baseline_path, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        print(f"没有基线文件 {baseline_path}，加 --save-baseline 保存本次结果作为基线")
+        return 0
+    if baseline.get('version') != BASELINE_VERSION or baseline.get('quick') != quick:
+        print("基线的版本或素材规模与本次不同，无法比较")
+        return 0
+
+    regressions = compare_with_baseline(results, baseline['cases'])
+    if regressions:
+        print("性能回退:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print("与基线相比没有超出容差的回退")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="性能测试")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    pixmap_parser = subparsers.add_parser('pixmap', help="PDF裁剪单页流程：PNG往返 vs 像素直通")
+    pixmap_parser.add_argument('--pdf', help="测试用PDF，默认自动生成")
+    pixmap_parser.add_argument('--pages', type=int, default=20, help="测试页数")
+
+    suite_parser = subparsers.add_parser('suite', help="完整测试：图片、PDF、标签，并与基线比较")
+    suite_parser.add_argument('--quick', action='store_true', help="使用较小的素材，几秒内完成")
+    suite_parser.add_argument('--repeat', type=int, default=3, help="每项重复次数，取最快的一次")
+    suite_parser.add_argument('--case', action='append', choices=list(SUITE_CASES), help="只运行指定测试项，可重复")
+    suite_parser.add_argument('--baseline', default=BASELINE_FILE, help="基线文件")
+    suite_parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    suite_parser.add_argument('--corpus', help="测试素材保存位置，默认使用临时文件夹")
+
+    args = parser.parse_args()
+    # 测试素材中有超过Pillow默认限制的大图
+    allow_large_images()
+    if args.command == 'pixmap':
+        bench_pixmap(args.pdf, args.pages)
+    elif args.command == 'suite':
+        return bench_suite(args.quick, args.repeat, args.baseline, args.save_baseline, args.case, args.corpus)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
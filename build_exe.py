@@ -11,7 +11,8 @@ def install_dependencies():
         'pyinstaller',
         'reportlab', 
         'Pillow',
-        'PyMuPDF'  # 添加PDF处理库
+        'PyMuPDF',  # 添加PDF处理库
+        'numpy'  # 空白边界检测
     ]
     
     for package in required_packages:
@@ -31,7 +32,8 @@ def build_exe():
     scripts = [
         ('generate_pdf.py', '标签生成器'),
         ('crop_images_to_pdf.py', '图片裁剪转PDF'),
-        ('pdf_crop_tool.py', 'PDF空白裁剪工具')
+        ('pdf_crop_tool.py', 'PDF空白裁剪工具'),
+        ('tools_cli.py', '工具箱命令行')
     ]
     
     for script_file, exe_name in scripts:
@@ -96,6 +98,16 @@ def create_readme():
   2. 双击运行"PDF空白裁剪工具.exe"
   3. 程序会递归处理所有PDF并输出到"处理好的文件夹"
 
+## 工具箱命令行.exe
+- 功能：在命令行或脚本中运行以上三个工具，不等待按键，进度以JSON行输出
+- 使用方法：
+  1. 工具箱命令行.exe labels 1.txt -o output.pdf
+  2. 工具箱命令行.exe crop-pdf 要处理的文件夹 -o 处理好的文件夹 --workers 8
+  3. 工具箱命令行.exe images 图片文件夹 -o 输出文件夹（加 --merge 合并为一个PDF）
+  4. 工具箱命令行.exe watch 收件文件夹 -o 处理好的文件夹（持续监视，新文件到达后自动处理，Ctrl+C 停止）
+  5. 工具箱命令行.exe serve --port 8765（本机HTTP任务服务，接口见README）
+- 退出码：0 全部成功，1 有文件失败，2 参数错误，3 找不到输入
+
 ## 注意事项
 - 确保文件夹有读写权限
 - PDF处理需要较多时间，请耐心等待
@@ -113,7 +125,7 @@ def main():
     
     # 安装依赖
     if not install_dependencies():
-        print("依赖安装失败，请手动安装：pip install pyinstaller reportlab Pillow PyMuPDF")
+        print("依赖安装失败，请手动安装：pip install pyinstaller reportlab Pillow PyMuPDF numpy")
         return
     
     # 打包exe
@@ -123,6 +135,7 @@ def main():
         print("- 标签生成器.exe")
         print("- 图片裁剪转PDF.exe")
         print("- PDF空白裁剪工具.exe")
+        print("- 工具箱命令行.exe")
         
         # 创建说明文件
         create_readme()
@@ -139,7 +152,7 @@ def main():
     else:
         print("打包失败！")
         print("请检查:")
-        print("1. 是否已正确安装所有依赖: pip install pyinstaller reportlab Pillow PyMuPDF")
+        print("1. 是否已正确安装所有依赖: pip install pyinstaller reportlab Pillow PyMuPDF numpy")
         print("2. 是否有足够的磁盘空间")
         print("3. 是否有写入权限")
 
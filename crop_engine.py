@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+空白边界检测引擎
+图片裁剪、PDF裁剪和可视化界面共用的内容边界检测
+"""
+
+import math
+
+import numpy as np
+from PIL import Image
+
+# 图片裁剪使用的白色阈值
+IMAGE_WHITE_THRESHOLD = 250
+# PDF页面裁剪使用的白色阈值
+PDF_WHITE_THRESHOLD = 240
+
+# 检测模式: full 全图归约, pyramid 先缩小粗检再在边缘细化, auto 按图片大小自动选择
+DETECT_METHODS = ('auto', 'full', 'pyramid')
+# auto模式下超过该像素数时使用金字塔检测
+PYRAMID_MIN_PIXELS = 16_000_000
+# 粗检图的目标像素数
+PYRAMID_COARSE_PIXELS = 1_000_000
+# 细化时每次扫描的行/列数
+REFINE_BAND = 64
+
+# 允许打开的最大像素数，大幅扫描件（如 20000x30000）会超过Pillow默认的解压炸弹限制；
+# 由处理本机文件的程序调用 allow_large_images() 开启，HTTP任务服务等处理外部上传的图片时保留Pillow默认的限制
+MAX_IMAGE_PIXELS = 1_000_000_000
+
+# 超过该像素数的图片按大图处理，不生成全尺寸RGB缓冲区
+HUGE_IMAGE_PIXELS = 50_000_000
+# 大图逐条检测时每条的行数
+BAND_ROWS = 256
+# 超大JPEG检测时的缩小倍数（JPEG解码器支持1/2、1/4、1/8）
+JPEG_DRAFT_SCALE = 8
+
+
+def allow_large_images():
+    """把Pillow的解压炸弹限制放宽到 MAX_IMAGE_PIXELS，对整个进程有效，只在处理本机文件的程序中调用"""
+    if Image.MAX_IMAGE_PIXELS is not None and Image.MAX_IMAGE_PIXELS < MAX_IMAGE_PIXELS:
+        Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+def to_rgb(img):
+    """转换为RGB模式，透明图片先合成到白色背景上"""
+    if img.mode == 'RGBA':
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[3] if len(img.split()) == 4 else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def content_mask(pixels, white_threshold):
+    """任一通道低于阈值的像素视为内容"""
+    if pixels.ndim == 2:
+        return pixels < white_threshold
+    # 逐通道取最小值比沿通道轴归约快一个数量级
+    darkest = np.minimum(np.minimum(pixels[..., 0], pixels[..., 1]), pixels[..., 2])
+    return darkest < white_threshold
+
+
+def find_content_box(pixels, white_threshold, method='auto'):
+    """
+    查找内容边界
+    pixels 为 (高, 宽, 通道) 的uint8数组
+    返回 (左, 上, 右, 下)，均为包含端点的像素坐标；整页空白时返回None
+    """
+    if method == 'auto':
+        height, width = pixels.shape[:2]
+        method = 'pyramid' if height * width >= PYRAMID_MIN_PIXELS else 'full'
+    if method == 'full':
+        return _find_content_box_full(pixels, white_threshold)
+    if method == 'pyramid':
+        return _find_content_box_pyramid(pixels, white_threshold)
+    raise ValueError(f"未知的检测模式: {method}")
+
+
+def _find_content_box_full(pixels, white_threshold):
+    """对整幅图做一次归约"""
+    mask = content_mask(pixels, white_threshold)
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1])
+
+
+def _scan_rows(pixels, white_threshold, start, stop, col_start, col_stop, reverse=False):
+    """
+    在 [start, stop) 行范围内按带扫描，只看 [col_start, col_stop) 列
+    返回第一行（reverse时为最后一行）含内容的行号，没有则返回None
+    传入转置视图即可扫描列
+    """
+    if not reverse:
+        for y in range(start, stop, REFINE_BAND):
+            y_end = min(y + REFINE_BAND, stop)
+            band = content_mask(pixels[y:y_end, col_start:col_stop], white_threshold)
+            hits = np.flatnonzero(band.any(axis=1))
+            if hits.size:
+                return y + int(hits[0])
+    else:
+        for y_end in range(stop, start, -REFINE_BAND):
+            y = max(y_end - REFINE_BAND, start)
+            band = content_mask(pixels[y:y_end, col_start:col_stop], white_threshold)
+            hits = np.flatnonzero(band.any(axis=1))
+            if hits.size:
+                return y + int(hits[-1])
+    return None
+
+
+def _find_content_box_pyramid(pixels, white_threshold):
+    """
+    先在等间隔抽样的缩小图上找到近似边界，再在原图上只扫描边界外侧的空白带
+    抽样命中的像素一定是内容，所以真实边界只会在近似边界之外，结果与全图检测逐像素一致
+    内容区域内部的像素不会被读取
+    """
+    height, width = pixels.shape[:2]
+    step = int(math.sqrt(height * width / PYRAMID_COARSE_PIXELS))
+    if step <= 1:
+        return _find_content_box_full(pixels, white_threshold)
+    
+    coarse = _find_content_box_full(pixels[::step, ::step], white_threshold)
+    if coarse is None:
+        # 细线可能落在抽样点之间，只能退回全图检测
+        return _find_content_box_full(pixels, white_threshold)
+    coarse_left, coarse_top, coarse_right, coarse_bottom = (v * step for v in coarse)
+    
+    top = _scan_rows(pixels, white_threshold, 0, coarse_top, 0, width)
+    if top is None:
+        top = coarse_top
+    bottom = _scan_rows(pixels, white_threshold, coarse_bottom + 1, height, 0, width, reverse=True)
+    if bottom is None:
+        bottom = coarse_bottom
+    
+    # 列扫描只需覆盖上下边界之间的行
+    columns = pixels.swapaxes(0, 1)
+    left = _scan_rows(columns, white_threshold, 0, coarse_left, top, bottom + 1)
+    if left is None:
+        left = coarse_left
+    right = _scan_rows(columns, white_threshold, coarse_right + 1, width, top, bottom + 1, reverse=True)
+    if right is None:
+        right = coarse_right
+    return left, top, right, bottom
+
+
+def is_croppable(box):
+    """边界有效（宽高都大于一个像素）时才裁剪"""
+    if box is None:
+        return False
+    left, top, right, bottom = box
+    return left < right and top < bottom
+
+
+def image_bytes(size, mode):
+    """图片缓冲区的字节数"""
+    return size[0] * size[1] * Image.getmodebands(mode)
+
+
+def is_huge(img):
+    return img.width * img.height >= HUGE_IMAGE_PIXELS
+
+
+def raw_pixel_view(img):
+    """
+    未压缩且按行连续存放的图片（如未压缩TIFF）把文件直接映射为 (高, 宽[, 通道]) 数组，
+    不解码也不读入内存，只有实际访问到的行才由系统读入
+    不支持的格式返回None
+    """
+    if len(img.tile) != 1 or not getattr(img, 'filename', None):
+        return None
+    codec, extents, offset, args = img.tile[0]
+    if not isinstance(args, tuple):
+        args = (args,)
+    rawmode, stride, orientation = (args + (0, 1))[:3]
+    channels = {'RGB': 3, 'BGR': 3, 'L': 1}.get(rawmode)
+    width, height = img.size
+    if (codec != 'raw' or tuple(extents) != (0, 0, width, height) or channels is None
+            or img.mode != ('L' if channels == 1 else 'RGB')
+            or stride not in (0, width * channels) or orientation not in (1, -1)):
+        return None
+
+    shape = (height, width, channels) if channels == 3 else (height, width)
+    pixels = np.memmap(img.filename, dtype=np.uint8, mode='r', offset=offset, shape=shape)
+    if orientation == -1:
+        pixels = pixels[::-1]
+    if rawmode == 'BGR':
+        pixels = pixels[..., ::-1]
+    return pixels
+
+
+def find_content_box_banded(img, white_threshold):
+    """
+    逐条检测，每次只把 BAND_ROWS 行转换为RGB，结果与 crop_image 一致
+    Pillow无法按行解码压缩格式（PNG、LZW/Deflate压缩的TIFF等），图片仍以原始模式完整解码一次，
+    这里只避免生成全尺寸RGB缓冲区和透明图片的白色背景；内存不随图片大小增长的只有 raw_pixel_view 支持的格式
+    """
+    width, height = img.size
+    img.load()
+    top = bottom = None
+    columns = np.zeros(width, dtype=bool)
+    for y in range(0, height, BAND_ROWS):
+        band = to_rgb(img.crop((0, y, width, min(y + BAND_ROWS, height))))
+        mask = content_mask(np.asarray(band), white_threshold)
+        rows = np.flatnonzero(mask.any(axis=1))
+        if rows.size:
+            if top is None:
+                top = y + int(rows[0])
+            bottom = y + int(rows[-1])
+            columns |= mask.any(axis=0)
+    if top is None:
+        return None
+    cols = np.flatnonzero(columns)
+    return int(cols[0]), top, int(cols[-1]), bottom
+
+
+def find_content_box_reduced(img, white_threshold):
+    """
+    按JPEG解码器的缩小比例解码后检测，边界按比例放大并向外取整，不会切掉内容
+    缩小解码的每个像素是原图一块区域的平均值，孤立的单个浅色噪点可能检测不到，
+    只用于全尺寸解码代价过大的超大JPEG；调用后 img 变为缩小后的图片
+    返回 (边界, 缩小后的缓冲区字节数)
+    """
+    width, height = img.size
+    img.draft(img.mode, (width // JPEG_DRAFT_SCALE, height // JPEG_DRAFT_SCALE))
+    reduced = to_rgb(img)
+    box = find_content_box(np.asarray(reduced), white_threshold)
+    if box is None:
+        return None, image_bytes(reduced.size, reduced.mode) * 2
+
+    scale_x = width / reduced.width
+    scale_y = height / reduced.height
+    left, top, right, bottom = box
+    box = (
+        int(left * scale_x),
+        int(top * scale_y),
+        min(width - 1, math.ceil((right + 1) * scale_x) - 1),
+        min(height - 1, math.ceil((bottom + 1) * scale_y) - 1),
+    )
+    return box, image_bytes(reduced.size, reduced.mode) * 2
+
+
+def crop_large_image(img_path, white_threshold=IMAGE_WHITE_THRESHOLD):
+    """
+    裁剪超大图片，不生成全尺寸RGB缓冲区
+    未压缩图片映射文件后用金字塔检测，只复制裁剪区域，内存只与裁剪区域有关；
+    压缩图片无法按行解码，以原始模式完整解码后逐条检测，只把裁剪区域转换为RGB，
+    内存峰值至少是原始模式的全尺寸缓冲区（见 find_content_box_banded）
+    返回 (裁剪后的RGB图片, 检测到的边界, 估算的内存峰值字节数)
+    """
+    with Image.open(img_path) as img:
+        width, height = img.size
+        pixels = raw_pixel_view(img)
+        if pixels is not None:
+            box = find_content_box(pixels, white_threshold)
+            left, top, right, bottom = box if is_croppable(box) else (0, 0, width - 1, height - 1)
+            cropped = Image.fromarray(np.ascontiguousarray(pixels[top:bottom + 1, left:right + 1]))
+            peak = image_bytes(cropped.size, cropped.mode)
+        else:
+            box = find_content_box_banded(img, white_threshold)
+            # 完整解码的原始模式缓冲区
+            cropped = img
+            if is_croppable(box):
+                left, top, right, bottom = box
+                cropped = img.crop((left, top, right + 1, bottom + 1))
+            peak = image_bytes(img.size, img.mode)
+            if cropped is not img:
+                peak += image_bytes(cropped.size, cropped.mode)
+        
+        rgb = to_rgb(cropped)
+        if rgb is not cropped:
+            peak += image_bytes(rgb.size, rgb.mode)
+        return rgb, box, peak
+
+
+def crop_image(img, white_threshold=IMAGE_WHITE_THRESHOLD, method='auto'):
+    """
+    裁剪PIL图片的空白边缘
+    返回 (裁剪后的RGB图片, 检测到的边界)
+    """
+    img = to_rgb(img)
+    box = find_content_box(np.asarray(img), white_threshold, method)
+    if is_croppable(box):
+        left, top, right, bottom = box
+        return img.crop((left, top, right + 1, bottom + 1)), box
+    return img, box
@@ -2,138 +2,72 @@
 # -*- coding: utf-8 -*-
 
 import os
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
-from reportlab.pdfgen import canvas
-import tempfile
+from crop_engine import (crop_image, crop_large_image, find_content_box, find_content_box_reduced,
+                         image_bytes, is_croppable, is_huge, to_rgb, allow_large_images, IMAGE_WHITE_THRESHOLD,
+                         JPEG_DRAFT_SCALE)
+from pdf_writer import StreamingPdfWriter
+from output_profiles import encode_image, parse_profile
+from folder_manifest import file_digest
+from result_cache import ResultCache, content_key
+import stage_timer
+
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif'}
 
 def find_images_in_folder(folder_path):
     """扫描文件夹中的图片文件"""
-    image_extensions = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.gif'}
     image_files = []
     
     for filename in os.listdir(folder_path):
-        if os.path.splitext(filename.lower())[1] in image_extensions:
+        if os.path.splitext(filename.lower())[1] in IMAGE_EXTENSIONS:
             image_files.append(os.path.join(folder_path, filename))
     
     return sorted(image_files)
 
 def crop_whitespace(image_path):
-    """裁剪图片周围的空白区域"""
+    """裁剪图片周围的空白区域，超大图片不生成全尺寸RGB缓冲区"""
     try:
         # 打开图片
         img = Image.open(image_path)
         print(f"  原始尺寸: {img.size}")
         
-        # 转换为RGBA模式处理透明度
-        if img.mode == 'RGBA':
-            # 对于有透明度的图片，先转换为白色背景
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[3] if len(img.split()) == 4 else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # 获取图片像素数据
-        pixels = img.load()
-        width, height = img.size
-        
-        # 定义白色阈值
-        white_threshold = 250
-        
-        # 从四个方向找边界
-        # 找上边界
-        top = 0
-        for y in range(height):
-            found_content = False
-            for x in range(width):
-                r, g, b = pixels[x, y]
-                if r < white_threshold or g < white_threshold or b < white_threshold:
-                    found_content = True
-                    break
-            if found_content:
-                top = y
-                break
-        
-        # 找下边界
-        bottom = height - 1
-        for y in range(height - 1, -1, -1):
-            found_content = False
-            for x in range(width):
-                r, g, b = pixels[x, y]
-                if r < white_threshold or g < white_threshold or b < white_threshold:
-                    found_content = True
-                    break
-            if found_content:
-                bottom = y
-                break
-        
-        # 找左边界
-        left = 0
-        for x in range(width):
-            found_content = False
-            for y in range(height):
-                r, g, b = pixels[x, y]
-                if r < white_threshold or g < white_threshold or b < white_threshold:
-                    found_content = True
-                    break
-            if found_content:
-                left = x
-                break
-        
-        # 找右边界
-        right = width - 1
-        for x in range(width - 1, -1, -1):
-            found_content = False
-            for y in range(height):
-                r, g, b = pixels[x, y]
-                if r < white_threshold or g < white_threshold or b < white_threshold:
-                    found_content = True
-                    break
-            if found_content:
-                right = x
-                break
-        
+        # 检测内容边界并裁剪
+        if is_huge(img):
+            cropped, box, peak = crop_large_image(image_path, IMAGE_WHITE_THRESHOLD)
+            print(f"  内存峰值约 {format_megabytes(peak)}")
+        else:
+            cropped, box = crop_image(img, IMAGE_WHITE_THRESHOLD)
+        if box is None:
+            box = (0, 0, img.width - 1, img.height - 1)
+        left, top, right, bottom = box
         print(f"  检测到边界: 左={left}, 上={top}, 右={right}, 下={bottom}")
         
-        # 裁剪图片
-        if left < right and top < bottom:
-            cropped = img.crop((left, top, right + 1, bottom + 1))
+        if is_croppable(box):
             print(f"  裁剪后尺寸: {cropped.size}")
-            return cropped
         else:
             print("  未检测到有效边界，返回原图")
-            return img
+        return cropped
             
     except Exception as e:
         print(f"处理图片 {image_path} 时出错: {e}")
         return None
 
-def image_to_pdf(img_path, output_dir):
+def format_megabytes(size):
+    return f"{size / 1024 / 1024:.1f} MB"
+
+def image_to_pdf(img_path, output_dir, profile='lossless', cache=None):
     """将单张图片转换为PDF"""
     try:
-        cropped_img = crop_whitespace(img_path)
-        if cropped_img is None:
-            return False
-        
         # 生成PDF文件名（使用原图片名称）
         base_name = os.path.splitext(os.path.basename(img_path))[0]
         output_pdf = os.path.join(output_dir, f"{base_name}.pdf")
         
-        # 创建PDF
-        c = canvas.Canvas(output_pdf, pagesize=cropped_img.size)
-        
-        # 保存图片到临时文件
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-            cropped_img.save(temp_file.name, 'PNG')
-            
-            # 将图片添加到PDF
-            c.drawImage(temp_file.name, 0, 0, 
-                      width=cropped_img.size[0], 
-                      height=cropped_img.size[1])
-            c.save()
-            
-            # 删除临时文件
-            os.unlink(temp_file.name)
+        image_file_to_pdf(img_path, output_pdf, log=print, profile=profile, cache=cache)
         
         print(f"  ✓ 生成PDF: {base_name}.pdf")
         return True
@@ -142,14 +76,211 @@ def image_to_pdf(img_path, output_dir):
         print(f"  ✗ 处理失败: {e}")
         return False
 
+def image_settings(profile='lossless'):
+    """影响图片转PDF结果的处理设置"""
+    return {'threshold': IMAGE_WHITE_THRESHOLD, 'profile': parse_profile(profile)['name']}
+
+def image_file_to_pdf(img_path, output_pdf, log=None, profile='lossless', cache=None):
+    """
+    把一张图片裁剪后写成单页PDF，图片在内存中交给PDF写入，不经过临时文件
+    cache 为 ResultCache 时按图片内容和设置缓存生成的PDF
+    """
+    with stage_timer.stage(stage_timer.FILE_STAGE, file=os.path.basename(img_path)):
+        if cache is not None:
+            with stage_timer.stage('缓存查找'):
+                key = content_key('image_pdf', image_settings(profile), file_digest(img_path))
+                hit = cache.fetch_file(key, output_pdf)
+            if hit:
+                if log:
+                    log("  命中缓存，直接使用已有结果")
+                return
+        
+        page = prepare_image_page(img_path, log, profile)
+        with stage_timer.stage('写入页面'), StreamingPdfWriter(output_pdf) as writer:
+            writer.add_page(page)
+        
+        if cache is not None:
+            cache.store_file(key, output_pdf)
+
+def prepare_image_page(img_path, log=None, profile='lossless', cache=None):
+    """
+    打开并裁剪图片，返回交给 StreamingPdfWriter.add_page 的 (类型, 参数)
+    RGB和灰度JPEG不重新编码：原始DCT数据直接写入PDF，需要裁剪时只调整页面显示范围，
+    画质无损，输出大小与原图相当（按目标大小输出且原图超出目标时除外）；
+    其他图片裁剪后按输出配置编码
+    cache 为 ResultCache 时按图片内容缓存检测到的边界，命中时不再检测（JPEG直通时也不再解码）
+    超大图片（见 crop_engine.HUGE_IMAGE_PIXELS）不生成全尺寸RGB缓冲区：JPEG直通时按1/8缩小解码检测，
+    其他图片见 crop_engine.crop_large_image（只有未压缩图片不完整解码）；每张图片解码时在日志中报告估算的内存峰值
+    """
+    target_bytes = parse_profile(profile)['target_bytes']
+    box_key = None
+    cached_box = None
+    name = os.path.basename(img_path)
+    
+    with Image.open(img_path) as img:
+        if log:
+            log(f"  原始尺寸: {img.size}")
+        
+        width, height = img.size
+        passthrough = target_bytes is None or os.path.getsize(img_path) <= target_bytes
+        passthrough = img.format == 'JPEG' and img.mode in ('RGB', 'L') and passthrough
+        # 超大JPEG直通时在缩小解码的图上检测，边界是近似的，只用于直通（只调整页面显示范围），
+        # 与全尺寸检测的边界分开缓存；直通时两种边界都可以使用，优先使用全尺寸检测的
+        reduced = passthrough and is_huge(img)
+        if cache is not None:
+            with stage_timer.stage('缓存查找', file=name):
+                digest = file_digest(img_path)
+                box_key = content_key('image_box', {'threshold': IMAGE_WHITE_THRESHOLD, 'detect': 'full'}, digest)
+                cached_box = cache.fetch_value(box_key)
+                if cached_box is None and reduced:
+                    box_key = content_key('image_box', {'threshold': IMAGE_WHITE_THRESHOLD, 'detect': 'jpeg_draft',
+                                                        'scale': JPEG_DRAFT_SCALE}, digest)
+                    cached_box = cache.fetch_value(box_key)
+        
+        # 估算的内存峰值，命中缓存的JPEG直通不解码，为None
+        peak = None
+        if passthrough:
+            colors = 3 if img.mode == 'RGB' else 1
+            if cached_box is not None:
+                box = tuple(cached_box['box']) if cached_box['box'] else None
+            else:
+                with stage_timer.stage('解码检测', file=name):
+                    if reduced:
+                        box, peak = find_content_box_reduced(img, IMAGE_WHITE_THRESHOLD)
+                    else:
+                        # 解码缓冲区加上转为数组时的复制
+                        box = find_content_box(np.asarray(img), IMAGE_WHITE_THRESHOLD)
+                        peak = image_bytes(img.size, img.mode) * 2
+                if box_key is not None:
+                    cache.store_value(box_key, {'box': box})
+            if not is_croppable(box):
+                box = None
+            if log:
+                page_size = (box[2] - box[0] + 1, box[3] - box[1] + 1) if box else (width, height)
+                log(f"  JPEG直通，页面尺寸: {page_size}")
+                if peak is not None:
+                    log(f"  内存峰值约 {format_megabytes(peak)}")
+            with stage_timer.stage('读取文件', file=name), open(img_path, 'rb') as f:
+                jpeg_data = f.read()
+            return 'jpeg', (jpeg_data, width, height, colors, box)
+        
+        with stage_timer.stage('解码检测', file=name):
+            if cached_box is not None:
+                # 先裁剪再转换为RGB，只转换裁剪区域
+                box = tuple(cached_box['box']) if cached_box['box'] else None
+                cropped = img
+                if is_croppable(box):
+                    left, top, right, bottom = box
+                    cropped = img.crop((left, top, right + 1, bottom + 1))
+                peak = image_bytes(img.size, img.mode) + image_bytes(cropped.size, 'RGB')
+                cropped = to_rgb(cropped)
+            elif is_huge(img):
+                cropped, box, peak = crop_large_image(img_path, IMAGE_WHITE_THRESHOLD)
+            else:
+                cropped, box = crop_image(img, IMAGE_WHITE_THRESHOLD)
+                # 解码缓冲区、RGB转换、转为数组时的复制和裁剪结果
+                peak = image_bytes(img.size, img.mode) + image_bytes(img.size, 'RGB') * 2
+                if img.mode != 'RGB':
+                    peak += image_bytes(img.size, 'RGB')
+                peak += image_bytes(cropped.size, 'RGB')
+        if box_key is not None and cached_box is None:
+            cache.store_value(box_key, {'box': box})
+        if log:
+            log(f"  裁剪后尺寸: {cropped.size}")
+            log(f"  内存峰值约 {format_megabytes(peak)}")
+        with stage_timer.stage('编码', file=name):
+            kind, image_data = encode_image(cropped, profile)
+        if kind == 'jpeg':
+            return 'jpeg', (image_data, cropped.width, cropped.height, 3, None)
+        return 'png', (cropped.width, cropped.height, image_data)
+
+def images_to_single_pdf(img_paths, output_pdf, workers=None, log=print, profile='lossless',
+                         cache=None, progress=None):
+    """
+    将多张图片合并为一个PDF
+    多个线程同时解码、裁剪和编码，写入线程严格按给定顺序逐页写出；
+    同时在处理中的图片不超过 workers*2 张，写完的页面立即释放，
+    内存占用不随图片数量增长，也不产生临时文件
+    cache 为 ResultCache 时整组图片（按内容和顺序）命中则直接复制结果，
+    否则每张图片的边界仍可命中缓存
+    progress(已处理张数, 总张数) 在每张图片写入（或失败）后调用
+    返回成功写入的页数
+    """
+    workers = workers or os.cpu_count() or 1
+    total = len(img_paths)
+    
+    if cache is not None:
+        key = content_key('image_merge', image_settings(profile),
+                          *(file_digest(img_path) for img_path in img_paths))
+        if cache.fetch_file(key, output_pdf):
+            log("命中缓存，直接使用已有结果")
+            log(cache.summary())
+            return total
+    
+    with stage_timer.stage(stage_timer.FILE_STAGE, file=os.path.basename(output_pdf)):
+        page_count = _merge_images(img_paths, output_pdf, workers, log, profile, cache, progress)
+    
+    if cache is not None:
+        # 有图片失败时不缓存，下次重新处理
+        if page_count == total:
+            cache.store_file(key, output_pdf)
+        log(cache.summary())
+    return page_count
+
+def _merge_images(img_paths, output_pdf, workers, log, profile, cache, progress=None):
+    """按顺序把图片逐页写入PDF，返回写入的页数"""
+    total = len(img_paths)
+    pending = deque()
+    next_index = 0
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor, \
+            StreamingPdfWriter(output_pdf) as writer:
+        while next_index < total or pending:
+            # 补满缓冲区
+            while next_index < total and len(pending) < workers * 2:
+                # 每张图片的日志先缓存，写入时按顺序输出
+                messages = []
+                future = executor.submit(stage_timer.bind(prepare_image_page), img_paths[next_index],
+                                         messages.append, profile, cache)
+                pending.append((next_index, future, messages))
+                next_index += 1
+            
+            i, future, messages = pending.popleft()
+            log(f"处理 {i+1}/{total}: {os.path.basename(img_paths[i])}")
+            try:
+                page = future.result()
+                for message in messages:
+                    log(message)
+                with stage_timer.stage('写入页面', page=i):
+                    writer.add_page(page)
+            except Exception as e:
+                log(f"  处理失败: {e}")
+            if progress:
+                progress(i + 1, total)
+        
+        return writer.page_count
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="图片裁剪转PDF工具")
+    parser.add_argument('--profile', default='lossless',
+                        help="输出编码配置: lossless、jpeg:质量、target:每页大小（如 target:300k）")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="不使用结果缓存（默认按图片内容缓存生成的PDF）")
+    args = parser.parse_args()
+    allow_large_images()
+    try:
+        parse_profile(args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+    
     try:
         # 使用当前工作目录，而不是脚本所在目录
         current_dir = os.getcwd()
         
         print("=== 图片裁剪转PDF工具 ===")
         print(f"程序运行目录: {current_dir}")
+        print(f"输出配置: {args.profile}")
         
         print("正在扫描图片文件...")
         image_files = find_images_in_folder(current_dir)
@@ -178,14 +309,17 @@ def main():
         
         print("\n开始处理图片...")
         processed_count = 0
+        cache = None if args.no_cache else ResultCache()
         
         for i, img_path in enumerate(image_files):
             print(f"\n处理图片 {i+1}/{len(image_files)}: {os.path.basename(img_path)}")
-            if image_to_pdf(img_path, current_dir):
+            if image_to_pdf(img_path, current_dir, args.profile, cache):
                 processed_count += 1
         
         print(f"\n=== 处理完成 ===")
         print(f"成功处理: {processed_count}/{len(image_files)} 张图片")
+        if cache is not None:
+            print(cache.summary())
         
         if processed_count > 0:
             print(f"生成的PDF文件已保存在当前目录")
@@ -201,7 +335,7 @@ if __name__ == "__main__":
     # 检查依赖
     try:
         from PIL import Image
-        import reportlab
+        import numpy
     except ImportError as e:
         print("❌ 错误: 缺少必要组件")
         print("这是一个打包问题，请联系技术支持")
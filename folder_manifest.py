@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件夹增量同步清单
+记录每个输入文件的大小、修改时间、内容哈希和处理设置，保存在输出文件夹中，
+再次处理同一文件夹时跳过没有变化的文件
+"""
+
+import hashlib
+import json
+import os
+
+# 清单文件名，保存在输出文件夹根目录
+MANIFEST_NAME = '.crop_manifest.json'
+MANIFEST_VERSION = 1
+# 计算哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FolderManifest:
+    """
+    输出文件夹中的处理清单
+    键为输入文件相对输入文件夹的路径，settings 为影响输出结果的处理设置
+    """
+
+    def __init__(self, output_folder, settings, name=MANIFEST_NAME):
+        self.path = os.path.join(output_folder, name)
+        self.settings = settings
+        self.entries = {}
+        # 本次运行中已经算过的哈希，避免检查和记录时重复读取文件
+        # 键包含大小和修改时间，长时间运行时文件被改写后不会用到旧的哈希
+        self._digests = {}
+        self.load()
+
+    def load(self):
+        """读取已有清单，文件不存在或损坏时视为空清单"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == MANIFEST_VERSION:
+            self.entries = data.get('files', {})
+
+    def save(self):
+        """先写临时文件再替换，中途中断不会留下半个清单"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'files': self.entries}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+
+    def _digest(self, source_path, stat):
+        key = (source_path, stat.st_size, stat.st_mtime_ns)
+        if key not in self._digests:
+            self._digests[key] = file_digest(source_path)
+        return self._digests[key]
+
+    def is_current(self, rel_path, source_path, output_path):
+        """
+        判断输出是否已是最新
+        大小和修改时间都没变时直接认为未变化；修改时间变了但大小相同时再比较内容哈希
+        """
+        entry = self.entries.get(rel_path)
+        if entry is None or entry['settings'] != self.settings or not os.path.exists(output_path):
+            return False
+
+        stat = os.stat(source_path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        if self._digest(source_path, stat) != entry['sha256']:
+            return False
+        # 只是被复制或touch过，更新修改时间，下次不必再算哈希
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def snapshot(self, source_path):
+        """
+        处理前读取输入文件的大小、修改时间和内容哈希，处理成功后交给 record
+        处理期间文件被改写时，清单中记录的仍是处理前的版本，下次会重新处理
+        """
+        stat = os.stat(source_path)
+        return {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': self._digest(source_path, stat),
+        }
+
+    def record(self, rel_path, snapshot):
+        """记录一个处理成功的文件，snapshot 为处理前 snapshot() 的结果"""
+        self.entries[rel_path] = dict(snapshot, settings=self.settings)
+
+    def forget(self, rel_path):
+        self.entries.pop(rel_path, None)
+
+    def missing_sources(self, rel_paths):
+        """清单中有记录、但本次输入文件夹里已不存在的文件"""
+        present = set(rel_paths)
+        return [rel_path for rel_path in self.entries if rel_path not in present]
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视文件夹
+定时扫描输入文件夹，新出现或有变化的PDF和图片在大小稳定后交给常驻的工作进程处理，
+结果按相同的目录结构写入输出文件夹：PDF裁剪空白，图片裁剪后转为PDF
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdf_crop_tool
+import crop_images_to_pdf
+from crop_engine import allow_large_images
+from folder_manifest import FolderManifest
+from result_cache import ResultCache
+
+# 扫描间隔（秒）
+POLL_INTERVAL = 1.0
+# 文件大小和修改时间保持不变多久后才认为已写完（秒）
+STABLE_SECONDS = 2.0
+# 监视模式的处理清单，与文件夹增量处理的清单分开保存
+WATCH_MANIFEST_NAME = '.watch_manifest.json'
+
+# 工作进程中的结果缓存
+_worker_cache = None
+
+
+def _init_watch_worker(use_cache):
+    """工作进程初始化，依赖库在导入本模块时已加载；监视的是本机文件夹，允许超大图片"""
+    global _worker_cache
+    _worker_cache = ResultCache() if use_cache else None
+    allow_large_images()
+
+
+def _warm_up():
+    """空任务，用于启动时提前创建工作进程"""
+    return os.getpid()
+
+
+def _process_file(kind, source_path, output_path, mode, profile):
+    """
+    在工作进程中处理一个文件，先写临时文件再改名，输出文件夹中不会出现写了一半的PDF
+    返回 (是否成功, 日志列表, 秒数)
+    """
+    messages = []
+    start_time = time.perf_counter()
+    temp_path = output_path + '.tmp'
+    try:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if kind == 'pdf':
+            success = pdf_crop_tool.crop_pdf_pages(source_path, temp_path, mode, log=messages.append,
+                                                   profile=profile, cache=_worker_cache)
+        else:
+            crop_images_to_pdf.image_file_to_pdf(source_path, temp_path, log=messages.append,
+                                                 profile=profile, cache=_worker_cache)
+            success = True
+        if success:
+            os.replace(temp_path, output_path)
+    except Exception as e:
+        messages.append(f"  处理失败: {e}")
+        success = False
+    if not success and os.path.exists(temp_path):
+        os.remove(temp_path)
+    return success, messages, time.perf_counter() - start_time
+
+
+class FolderWatcher:
+    """
+    监视输入文件夹并处理新文件
+    on_result(相对路径, 状态, 处理秒数, 从发现到完成的秒数) 在每个文件处理完后调用，状态为 done 或 failed
+    处理过的文件记录在输出文件夹的清单中，重启后不会重复处理
+    """
+
+    def __init__(self, input_folder, output_folder, mode='raster', profile='lossless', workers=None,
+                 log=print, on_result=None, use_cache=True, poll_interval=POLL_INTERVAL,
+                 stable_seconds=STABLE_SECONDS):
+        self.input_folder = os.path.abspath(input_folder)
+        self.output_folder = os.path.abspath(output_folder)
+        self.mode = mode
+        self.profile = profile
+        self.workers = workers or os.cpu_count() or 1
+        self.log = log
+        self.on_result = on_result
+        self.use_cache = use_cache
+        self.poll_interval = poll_interval
+        self.stable_seconds = stable_seconds
+
+        settings = {
+            'pdf': pdf_crop_tool.crop_settings(mode, profile),
+            'image': crop_images_to_pdf.image_settings(profile),
+        }
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.manifest = FolderManifest(self.output_folder, settings, WATCH_MANIFEST_NAME)
+        # 相对路径 -> (大小, 修改时间, 第一次看到该状态的时间)
+        self.pending = {}
+        # 相对路径 -> 已处理（或处理失败）时的 (大小, 修改时间)，状态变化前不再处理
+        self.handled = {}
+        # 相对路径 -> (future, 大小, 修改时间, 发现时间, 处理前的文件状态)
+        self.running = {}
+        self.executor = None
+
+    def _create_executor(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_watch_worker,
+                                            initargs=(self.use_cache,))
+
+    def _restart_executor(self):
+        """工作进程意外退出（如损坏的文件让MuPDF崩溃）后进程池不能再用，关闭后重新创建"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self._create_executor()
+        self.log("工作进程意外退出，已重新创建工作进程")
+
+    def _submit(self, kind, source_path, output_path):
+        try:
+            return self.executor.submit(_process_file, kind, source_path, output_path, self.mode, self.profile)
+        except BrokenProcessPool:
+            self._restart_executor()
+            return self.executor.submit(_process_file, kind, source_path, output_path, self.mode, self.profile)
+
+    def start(self):
+        """创建工作进程并预热，首个文件到达时不必再等待进程启动和导入依赖库"""
+        self._create_executor()
+        for future in [self.executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+        self.log(f"开始监视: {self.input_folder}（{self.workers} 个工作进程）")
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        self.manifest.save()
+
+    def output_path(self, rel_path, kind):
+        """输出路径，图片换成同名PDF"""
+        if kind == 'image':
+            rel_path = os.path.splitext(rel_path)[0] + '.pdf'
+        return os.path.join(self.output_folder, rel_path)
+
+    def scan(self):
+        """列出输入文件夹中的PDF和图片，返回 {相对路径: (类型, 大小, 修改时间)}"""
+        found = {}
+        for root, dirs, files in os.walk(self.input_folder):
+            # 输出文件夹在输入文件夹内时跳过
+            dirs[:] = [d for d in dirs if os.path.join(root, d) != self.output_folder]
+            for file in files:
+                ext = os.path.splitext(file.lower())[1]
+                if ext == '.pdf':
+                    kind = 'pdf'
+                elif ext in crop_images_to_pdf.IMAGE_EXTENSIONS:
+                    kind = 'image'
+                else:
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found[os.path.relpath(path, self.input_folder)] = (kind, stat.st_size, stat.st_mtime_ns)
+        return found
+
+    def poll(self):
+        """扫描一次：收集已完成的任务，提交大小已稳定的新文件"""
+        self._collect()
+        now = time.monotonic()
+        found = self.scan()
+
+        for rel_path, (kind, size, mtime_ns) in found.items():
+            if rel_path in self.running or self.handled.get(rel_path) == (size, mtime_ns):
+                continue
+            seen = self.pending.get(rel_path)
+            if seen is None or seen[:2] != (size, mtime_ns):
+                # 新文件或仍在变化，重新计时
+                self.pending[rel_path] = (size, mtime_ns, seen[2] if seen else now, now)
+                continue
+            if now - seen[3] < self.stable_seconds:
+                continue
+
+            del self.pending[rel_path]
+            source_path = os.path.join(self.input_folder, rel_path)
+            output_path = self.output_path(rel_path, kind)
+            try:
+                if self.manifest.is_current(rel_path, source_path, output_path):
+                    self.handled[rel_path] = (size, mtime_ns)
+                    continue
+                snapshot = self.manifest.snapshot(source_path)
+            except OSError:
+                # 刚被删除或改名，下次扫描时再看
+                continue
+            self.log(f"处理: {rel_path}")
+            future = self._submit(kind, source_path, output_path)
+            self.running[rel_path] = (future, size, mtime_ns, seen[2], snapshot)
+
+        # 已被删除的文件不再等待
+        for rel_path in list(self.pending):
+            if rel_path not in found:
+                del self.pending[rel_path]
+
+    def _collect(self):
+        """
+        处理已完成的任务
+        有工作进程意外退出时进程池中所有处理中的文件都记为失败，重新创建进程池
+        """
+        broken = False
+        for rel_path, (future, size, mtime_ns, first_seen, snapshot) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[rel_path]
+            try:
+                success, messages, seconds = future.result()
+            except BrokenProcessPool:
+                broken = True
+                success, messages, seconds = False, ["  处理失败: 工作进程意外退出"], 0.0
+            except Exception as e:
+                success, messages, seconds = False, [f"  处理失败: {e}"], 0.0
+            self._finish(rel_path, size, mtime_ns, first_seen, snapshot, success, messages, seconds)
+
+        if broken:
+            for rel_path, (future, size, mtime_ns, first_seen, snapshot) in list(self.running.items()):
+                del self.running[rel_path]
+                future.cancel()
+                self._finish(rel_path, size, mtime_ns, first_seen, snapshot, False, ["  处理失败: 工作进程意外退出"],
+                             0.0)
+            self._restart_executor()
+
+    def _finish(self, rel_path, size, mtime_ns, first_seen, snapshot, success, messages, seconds):
+        """记录一个文件的处理结果"""
+        for message in messages:
+            self.log(message)
+        self.handled[rel_path] = (size, mtime_ns)
+        if success:
+            self.manifest.record(rel_path, snapshot)
+            self.manifest.save()
+        latency = time.monotonic() - first_seen
+        self.log(f"{'✓ 完成' if success else '✗ 失败'}: {rel_path}（处理 {seconds:.1f} 秒，"
+                 f"发现到完成 {latency:.1f} 秒）")
+        if self.on_result:
+            self.on_result(rel_path, 'done' if success else 'failed', seconds, latency)
+
+    def run(self, stop_event=None):
+        """一直运行到 stop_event 被设置或按下 Ctrl+C"""
+        stop_event = stop_event or threading.Event()
+        self.start()
+        try:
+            while not stop_event.is_set():
+                self.poll()
+                stop_event.wait(self.poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+            self.log("已停止监视")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字体注册
+每个进程中每个字体文件只解析一次，之后直接使用已注册的字体；
+解析出的字形宽度等信息另外保存在本地，下次启动时读取，不必再解析几十MB的 simsun.ttc/msyh.ttc
+可以在启动时用 preload() 在后台提前加载，第一个任务开始时字体已经就绪
+"""
+
+import os
+import pickle
+import threading
+import zlib
+from weakref import WeakKeyDictionary
+
+import reportlab
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, TTFontFace, TTEncoding
+
+from result_cache import DEFAULT_CACHE_DIR, content_key
+
+# 字体信息缓存目录，与结果缓存分开，不参与结果缓存的淘汰
+FONT_CACHE_DIR = os.path.join(os.path.dirname(DEFAULT_CACHE_DIR), 'fonts')
+# 缓存格式版本，格式变化时旧的缓存自动失效
+FONT_CACHE_VERSION = 1
+# 不保存的字段：字体文件内容（嵌入字体时需要，每次从字体文件读取）、读取位置和不能序列化的函数
+_FACE_SKIP = ('_ttf_data', '_pos', '_pdfScale')
+# TTFont 自身的这些字段在恢复时重新创建
+_FONT_SKIP = ('face', 'encoding', 'state')
+
+_lock = threading.Lock()
+# (字体名, 字体文件) -> TTFont，本进程中已注册的字体
+_fonts = {}
+
+
+def _cache_path(name, font_path, stat):
+    """
+    字体名、字体文件路径、大小、修改时间和 reportlab 版本都相同时才使用缓存
+    恢复的 TTFont 保留解析时的字体名，同一文件以不同名字加载时分别缓存
+    """
+    key = content_key('font', {'version': FONT_CACHE_VERSION, 'reportlab': reportlab.Version},
+                      name, os.path.abspath(font_path), str(stat.st_size), str(stat.st_mtime_ns))
+    return os.path.join(FONT_CACHE_DIR, key + '.font')
+
+
+def _pdf_scale(units_per_em):
+    """与 reportlab 解析字体时设置的 _pdfScale 相同"""
+    if units_per_em == 1000:
+        return lambda x: x
+    factor = 1000 / units_per_em
+    return lambda x: x * factor
+
+
+def _save_metrics(font, path):
+    """保存解析结果，写入失败时忽略（下次重新解析）"""
+    data = {
+        'font': {k: v for k, v in vars(font).items() if k not in _FONT_SKIP},
+        'face': {k: v for k, v in vars(font.face).items() if k not in _FACE_SKIP},
+    }
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)))
+        os.replace(temp_path, path)
+    except OSError:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def _load_metrics(font_path, path):
+    """由缓存的解析结果恢复 TTFont，没有缓存或缓存损坏时返回None"""
+    try:
+        with open(path, 'rb') as f:
+            data = pickle.loads(zlib.decompress(f.read()))
+        face = TTFontFace.__new__(TTFontFace)
+        face.__dict__.update(data['face'])
+        face.readFile(font_path)
+        face._pdfScale = _pdf_scale(face.unitsPerEm)
+        font = TTFont.__new__(TTFont)
+        font.__dict__.update(data['font'])
+        font.face = face
+        font.encoding = TTEncoding()
+        font.state = WeakKeyDictionary()
+        return font
+    except Exception:
+        return None
+
+
+def _parse(name, font_path, use_cache):
+    if not use_cache:
+        return TTFont(name, font_path)
+    path = _cache_path(name, font_path, os.stat(font_path))
+    font = _load_metrics(font_path, path)
+    if font is None:
+        font = TTFont(name, font_path)
+        _save_metrics(font, path)
+    return font
+
+
+def load_font(name, font_path, use_cache=True):
+    """
+    注册 TrueType 字体并返回 TTFont，同一进程中相同的字体名和文件只解析一次
+    多个线程同时加载时后来的等待先开始的完成；解析失败时抛出异常，与 TTFont 相同
+    """
+    with _lock:
+        font = _fonts.get((name, font_path))
+        if font is None:
+            font = _fonts[(name, font_path)] = _parse(name, font_path, use_cache)
+        # 同名字体可能已被换成其他文件，注册本身只是更新字典，每次都重新注册
+        pdfmetrics.registerFont(font)
+        return font
+
+
+def preload(fonts, on_done=None):
+    """
+    在后台线程中加载字体，fonts 为 [(字体名, 字体文件), ...]，按顺序加载到第一个成功的为止
+    on_done(字体名或None) 在加载结束后于后台线程中调用
+    """
+    def run():
+        loaded = None
+        for name, font_path in fonts:
+            if os.path.exists(font_path):
+                try:
+                    load_font(name, font_path)
+                    loaded = name
+                    break
+                except Exception:
+                    continue
+        if on_done:
+            on_done(loaded)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
@@ -2,12 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.colors import black
+import font_registry
+from label_engine import fit_font_size, iter_text_segments, MAX_FONT_SIZE, MIN_FONT_SIZE, FONT_SIZE_STEP
+from pdf_writer import StreamingTextPdfWriter
+
+# 数据文件超过这个大小（或加 --stream 参数）时逐组读取、逐页写出
+STREAM_THRESHOLD = 20 * 1024 * 1024
 
 def read_txt_file(filename):
     """读取txt文件并按组分割内容"""
@@ -18,71 +24,38 @@ def read_txt_file(filename):
     groups = content.strip().split('\n\n')
     return groups
 
-def calculate_optimal_font_size(canvas_obj, lines, font_name, page_width, page_height, margin):
+def calculate_optimal_font_size(lines, font_name, page_width, page_height, margin):
     """计算最优字体大小，使文本尽可能占满页面"""
     # 可用宽度和高度
     available_width = page_width - 2 * margin
     available_height = page_height - 2 * margin
     
-    # 从较大字体开始尝试，更激进地使用页面空间
-    for font_size in range(80, 12, -2):  # 从80号字体开始，递减到12号
-        line_height = font_size * 1.2  # 减少行间距，让文本更紧凑
-        total_height = len(lines) * line_height
-        
-        # 检查高度是否合适，使用95%的可用高度
-        if total_height > available_height * 0.95:
-            continue
-            
-        # 检查宽度是否合适
-        max_width = 0
-        for line in lines:
-            if line.strip():
-                text_width = canvas_obj.stringWidth(line, font_name, font_size)
-                max_width = max(max_width, text_width)
-        
-        # 如果最长行的宽度小于可用宽度的95%，这个字体大小合适
-        if max_width <= available_width * 0.95:
-            return font_size, line_height
+    # 从较大字体开始，找出总高度不超过95%可用高度的最大字号（只需计算，不必测量文字）
+    for max_size in range(MAX_FONT_SIZE, MIN_FONT_SIZE - FONT_SIZE_STEP, -FONT_SIZE_STEP):
+        if len(lines) * (max_size * 1.2) <= available_height * 0.95:
+            break
+    else:
+        # 如果没找到合适的，返回最小字体
+        return MIN_FONT_SIZE, MIN_FONT_SIZE * 1.2
     
-    # 如果没找到合适的，返回最小字体
-    return 14, 14 * 1.2
+    # 最长行的宽度不超过可用宽度的95%
+    font_size = fit_font_size(lines, font_name, available_width * 0.95, max_size)
+    return font_size, font_size * 1.2  # 减少行间距，让文本更紧凑
 
-def calculate_optimal_layout(canvas_obj, lines, font_name, page_width, margin):
+def calculate_optimal_layout(lines, font_name, page_width, margin):
     """计算最优布局，返回字体大小、行高和所需页面高度"""
     available_width = page_width - 2 * margin
     
-    # 从较大字体开始尝试
-    for font_size in range(80, 12, -2):
-        line_height = font_size * 1.1  # 进一步减少行间距
-        
-        # 检查宽度是否合适
-        max_width = 0
-        for line in lines:
-            if line.strip():
-                text_width = canvas_obj.stringWidth(line, font_name, font_size)
-                max_width = max(max_width, text_width)
-        
-        # 如果最长行的宽度小于可用宽度的95%，这个字体大小合适
-        if max_width <= available_width * 0.95:
-            # 计算所需的页面高度，增加顶部边距避免截断
-            total_text_height = len(lines) * line_height
-            required_height = total_text_height + margin * 2 + font_size * 0.3  # 增加顶部边距
-            return font_size, line_height, required_height
-    
-    # 如果没找到合适的，返回最小字体
-    font_size = 14
-    line_height = font_size * 1.1
+    # 最长行的宽度不超过可用宽度的95%，放不下时使用最小字体
+    font_size = fit_font_size(lines, font_name, available_width * 0.95)
+    line_height = font_size * 1.1  # 进一步减少行间距
+    # 计算所需的页面高度，增加顶部边距避免截断
     total_text_height = len(lines) * line_height
-    required_height = total_text_height + margin * 2 + font_size * 0.3
+    required_height = total_text_height + margin * 2 + font_size * 0.3  # 增加顶部边距
     return font_size, line_height, required_height
 
-def create_pdf(groups, output_filename):
-    """创建PDF文件"""
-    # 基础页面宽度保持1000像素
-    base_width = 1000
-    margin = 20  # 进一步减少页边距
-    
-    # 尝试设置中文字体
+def setup_font():
+    """注册中文字体，返回字体名，找不到时使用Helvetica"""
     font_name = 'Helvetica'  # 默认字体
     try:
         # Windows系统常见中文字体
@@ -95,7 +68,8 @@ def create_pdf(groups, output_filename):
         for font_path in font_paths:
             if os.path.exists(font_path):
                 try:
-                    pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
+                    # 解析结果缓存在本地，再次运行时不必重新解析字体文件
+                    font_registry.load_font('ChineseFont', font_path)
                     font_name = 'ChineseFont'
                     print(f"成功加载中文字体: {font_path}")
                     break
@@ -105,16 +79,23 @@ def create_pdf(groups, output_filename):
                     
     except Exception as e:
         print(f"字体设置失败，使用默认字体: {e}")
+    return font_name
+
+def create_pdf(groups, output_filename):
+    """创建PDF文件"""
+    # 基础页面宽度保持1000像素
+    base_width = 1000
+    margin = 20  # 进一步减少页边距
     
-    # 创建临时canvas用于测量
-    temp_canvas = canvas.Canvas("temp.pdf", pagesize=(base_width, 1000))
+    # 尝试设置中文字体
+    font_name = setup_font()
     
     # 预计算所有组的布局信息
     layouts = []
     for group in groups:
         lines = [line for line in group.strip().split('\n') if line.strip()]
         font_size, line_height, required_height = calculate_optimal_layout(
-            temp_canvas, lines, font_name, base_width, margin
+            lines, font_name, base_width, margin
         )
         layouts.append({
             'lines': lines,
@@ -123,13 +104,6 @@ def create_pdf(groups, output_filename):
             'page_height': max(required_height, 200)  # 稍微增加最小高度确保不截断
         })
     
-    # 删除临时canvas文件
-    try:
-        if os.path.exists("temp.pdf"):
-            os.remove("temp.pdf")
-    except:
-        pass
-    
     # 创建实际的PDF
     c = None
     
@@ -140,8 +114,9 @@ def create_pdf(groups, output_filename):
         if c is None:
             c = canvas.Canvas(output_filename, pagesize=page_size)
         else:
-            c.setPageSize(page_size)
+            # 先结束上一页再设置新页面的大小，否则上一页会用这一页的大小
             c.showPage()
+            c.setPageSize(page_size)
         
         # 设置字体
         c.setFont(font_name, layout['font_size'])
@@ -163,6 +138,54 @@ def create_pdf(groups, output_filename):
     else:
         print("没有内容可生成PDF")
 
+def iter_txt_groups(filename):
+    """逐组读取txt文件，结果与 read_txt_file 相同，不必把整个文件读入内存"""
+    pending = 0
+    started = False
+    with open(filename, 'r', encoding='utf-8') as file:
+        for group in iter_text_segments(file):
+            # 与 read_txt_file 一样去掉文件首尾的空白：开头的空组跳过，结尾的空组等后面有内容时才输出
+            if not group.strip():
+                if started:
+                    pending += 1
+                continue
+            for _ in range(pending):
+                yield ''
+            pending = 0
+            started = True
+            yield group
+
+def create_pdf_streaming(groups, output_filename):
+    """逐页写出PDF，groups 可以是 iter_txt_groups 逐组产出的迭代器，标签再多内存占用也基本不变"""
+    base_width = 1000
+    margin = 20
+    font_name = setup_font()
+    
+    writer = StreamingTextPdfWriter(output_filename, pdfmetrics.getFont(font_name))
+    try:
+        for group in groups:
+            lines = [line for line in group.strip().split('\n') if line.strip()]
+            font_size, line_height, required_height = calculate_optimal_layout(
+                lines, font_name, base_width, margin
+            )
+            page_height = int(max(required_height, 200))
+            start_y = page_height - margin - font_size * 0.8
+            writer.add_text_page(base_width, page_height, [
+                (margin, start_y - j * line_height, font_size, line) for j, line in enumerate(lines)
+            ])
+            if writer.page_count % 10000 == 0:
+                print(f"已生成 {writer.page_count} 页...")
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    
+    if writer.page_count:
+        print(f"PDF文件已生成: {output_filename}（{writer.page_count} 页）")
+    else:
+        print("没有内容可生成PDF")
+    return writer.page_count
+
 def main():
     """主函数"""
     try:
@@ -195,6 +218,17 @@ def main():
         
         print(f"✓ 找到数据文件: 1.txt")
         
+        # 大文件逐组读取、逐页写出，不把所有标签放在内存中
+        if '--stream' in sys.argv[1:] or os.path.getsize(input_file) > STREAM_THRESHOLD:
+            print("逐组读取数据并逐页生成PDF...")
+            if create_pdf_streaming(iter_txt_groups(input_file), output_file):
+                print(f"✓ PDF生成成功: output.pdf")
+            else:
+                print(f"\n❌ 数据文件为空或格式不正确")
+                print("请检查1.txt文件内容")
+            input("\n按回车键退出...")
+            return
+        
         # 读取并处理文件
         try:
             groups = read_txt_file(input_file)
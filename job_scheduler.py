@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务调度
+界面各页提交的任务进入同一个优先队列，由固定数量的任务线程按优先级执行，
+标签等短任务不必排在长时间的PDF批处理后面；需要多进程的任务共用一个常驻的进程池，
+进程在任务之间保持运行，不必每次重新启动和导入依赖库
+
+取消任务时设置任务的取消标记，处理代码在每页（或每个文件）完成后调用 job.check()，
+被取消时抛出 JobCancelled，已完成的部分按各工具原有的方式保留
+"""
+
+import os
+import heapq
+import contextvars
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# 优先级，数字越小越先执行
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+# 同时执行的任务数
+JOB_SLOTS = 2
+
+
+class JobCancelled(BaseException):
+    """任务被取消，继承 BaseException，处理代码中的 except Exception 不会把它当作普通错误吞掉"""
+
+
+def _warm_up():
+    """在工作进程中提前导入依赖库"""
+    import pdf_crop_tool
+    import crop_images_to_pdf
+    return os.getpid()
+
+
+class Job:
+    """一个排队或执行中的任务，status 为 queued、running、done、failed 或 cancelled"""
+
+    def __init__(self, job_id, name, fn, priority, on_done=None):
+        self.id = job_id
+        self.name = name
+        self.fn = fn
+        self.priority = priority
+        self.on_done = on_done
+        self.status = 'queued'
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        """已被取消时抛出 JobCancelled，处理代码在每页或每个文件完成后调用"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def progress(self, callback=None):
+        """包装进度回调，每次报告进度时先检查是否已被取消"""
+        def report(*args):
+            self.check()
+            if callback is not None:
+                callback(*args)
+        return report
+
+
+class JobScheduler:
+    """
+    任务调度器
+    fn(job) 在任务线程中执行，可以使用 scheduler.pool 并行处理；
+    on_done(job) 在任务结束（包括失败和取消）后于任务线程中调用
+    """
+
+    def __init__(self, slots=JOB_SLOTS, pool_workers=None):
+        self.slots = slots
+        self.pool_workers = pool_workers or os.cpu_count() or 1
+        self._queue = []
+        self._counter = itertools.count(1)
+        self._condition = threading.Condition()
+        self._running = set()
+        self._closed = False
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(slots)]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def pool(self):
+        """共用的进程池，第一次使用时创建；工作进程意外退出导致进程池不能再用时重新创建"""
+        with self._pool_lock:
+            if self._pool is not None and self._pool._broken:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.pool_workers)
+            return self._pool
+
+    def warm_up(self):
+        """在后台创建工作进程并导入依赖库，第一个任务不必等待进程启动"""
+        def warm():
+            pool = self.pool
+            for future in [pool.submit(_warm_up) for _ in range(self.pool_workers)]:
+                future.result()
+        threading.Thread(target=warm, daemon=True).start()
+
+    def submit(self, name, fn, priority=PRIORITY_NORMAL, on_done=None):
+        """提交任务，返回 Job"""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("任务调度器已关闭")
+            seq = next(self._counter)
+            job = Job(seq, name, fn, priority, on_done)
+            heapq.heappush(self._queue, (priority, seq, job))
+            self._condition.notify()
+        return job
+
+    def position(self, job):
+        """任务前面还有几个任务（包括执行中的），已开始执行时返回0"""
+        with self._condition:
+            if job.status != 'queued':
+                return 0
+            ahead = sum(1 for priority, seq, _ in self._queue if (priority, seq) < (job.priority, job.id))
+            return ahead + len(self._running)
+
+    def jobs(self):
+        """排队和执行中的任务"""
+        with self._condition:
+            return [job for _, _, job in sorted(self._queue)] + sorted(self._running, key=lambda job: job.id)
+
+    def cancel(self, job):
+        """取消任务：排队中的直接移出队列，执行中的在下一页（或下一个文件）后停止"""
+        with self._condition:
+            job.cancel_event.set()
+            for i, (_, _, queued) in enumerate(self._queue):
+                if queued is job:
+                    self._queue.pop(i)
+                    heapq.heapify(self._queue)
+                    break
+            else:
+                return
+            job.status = 'cancelled'
+        if job.on_done:
+            job.on_done(job)
+
+    def cancel_all(self, predicate=None):
+        """取消全部（或 predicate(job) 为真的）任务，返回取消的任务数"""
+        jobs = [job for job in self.jobs() if predicate is None or predicate(job)]
+        for job in jobs:
+            self.cancel(job)
+        return len(jobs)
+
+    def shutdown(self):
+        """取消所有任务并关闭进程池"""
+        self.cancel_all()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+                job.status = 'running'
+                self._running.add(job)
+            try:
+                job.check()
+                # 每个任务在新的上下文中执行，分阶段计时等按任务保存的状态不会带到同一线程的下一个任务
+                contextvars.Context().run(job.fn, job)
+                job.status = 'done'
+            except JobCancelled:
+                job.status = 'cancelled'
+            except Exception as e:
+                job.status = 'failed'
+                job.error = e
+            finally:
+                with self._condition:
+                    self._running.discard(job)
+            if job.on_done:
+                job.on_done(job)
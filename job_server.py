@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本机HTTP任务服务
+常驻的工作进程提前导入 fitz、reportlab、PIL 并加载字体，其他程序通过HTTP提交任务，
+不必每次启动exe；只监听本机地址
+
+接口（请求体为输入文件内容，成功时响应体为生成的PDF）:
+  POST /labels                            标签文本（UTF-8，空行分组）
+  POST /crop-pdf?mode=raster&profile=...  PDF文件
+  POST /image-pdf?profile=...             图片文件
+  GET  /status                            服务状态（JSON）
+
+失败时返回JSON: {"error": 错误信息, "log": 日志列表}
+排队任务已满时返回503，客户端稍后重试
+"""
+
+import os
+import sys
+import json
+import socket
+import time
+import shutil
+import tempfile
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import label_engine
+import pdf_crop_tool
+import crop_images_to_pdf
+from output_profiles import parse_profile
+from result_cache import ResultCache
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# 每个工作进程最多排队的任务数，超出时返回503
+QUEUE_PER_WORKER = 4
+# 上传和返回文件时每次读写的字节数
+CHUNK_SIZE = 1024 * 1024
+# 本机地址，服务只允许绑定这些地址
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+JOB_TOOLS = ('labels', 'crop-pdf', 'image-pdf')
+
+# 工作进程中的结果缓存
+_worker_cache = None
+
+
+def _init_job_worker(use_cache):
+    """工作进程初始化：创建缓存并提前注册标签字体"""
+    global _worker_cache
+    _worker_cache = ResultCache() if use_cache else None
+    label_engine.register_label_font()
+
+
+def _warm_up():
+    """空任务，用于启动时提前创建工作进程"""
+    return os.getpid()
+
+
+def _run_job(tool, input_path, output_path, options):
+    """在工作进程中执行一个任务，返回 (是否成功, 日志列表, 秒数)"""
+    messages = []
+    start_time = time.perf_counter()
+    try:
+        if tool == 'labels':
+            with open(input_path, 'r', encoding='utf-8') as f:
+                groups = label_engine.parse_label_groups(f.read())
+            if not groups:
+                raise ValueError("没有标签数据")
+            label_engine.create_label_pdf(groups, output_path, log=messages.append, cache=_worker_cache)
+            success = True
+        elif tool == 'crop-pdf':
+            success = pdf_crop_tool.crop_pdf_pages(input_path, output_path, options['mode'],
+                                                   log=messages.append, profile=options['profile'],
+                                                   cache=_worker_cache)
+        else:
+            crop_images_to_pdf.image_file_to_pdf(input_path, output_path, log=messages.append,
+                                                 profile=options['profile'], cache=_worker_cache)
+            success = True
+    except Exception as e:
+        messages.append(f"处理失败: {e}")
+        success = False
+    return success, messages, time.perf_counter() - start_time
+
+
+class JobService:
+    """工作进程池和排队计数，HTTP请求线程共用"""
+
+    def __init__(self, workers=None, use_cache=True, log=print):
+        self.workers = workers or os.cpu_count() or 1
+        self.log = log
+        self.max_queued = self.workers * QUEUE_PER_WORKER
+        self.use_cache = use_cache
+        self.executor = self._create_executor()
+        for future in [self.executor.submit(_warm_up) for _ in range(self.workers)]:
+            future.result()
+        self._lock = threading.Lock()
+        self._executor_lock = threading.Lock()
+        self.queued = 0
+        self.counts = {'done': 0, 'failed': 0, 'rejected': 0, 'restarts': 0}
+
+    def _create_executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_job_worker,
+                                   initargs=(self.use_cache,))
+
+    def _replace_executor(self, broken):
+        """
+        工作进程意外退出（崩溃或被结束）后进程池不能再用，关闭后重新创建
+        多个请求同时发现时只重新创建一次
+        """
+        with self._executor_lock:
+            if self.executor is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self._create_executor()
+            with self._lock:
+                self.counts['restarts'] += 1
+        self.log("工作进程意外退出，已重新创建工作进程")
+
+    def acquire(self):
+        """占用一个排队位置，已满时返回False"""
+        with self._lock:
+            if self.queued >= self.max_queued:
+                self.counts['rejected'] += 1
+                return False
+            self.queued += 1
+            return True
+
+    def run(self, tool, input_path, output_path, options):
+        """提交任务并等待结果，调用前需要 acquire"""
+        executor = self.executor
+        start_time = time.perf_counter()
+        try:
+            result = executor.submit(_run_job, tool, input_path, output_path, options).result()
+        except BrokenProcessPool:
+            # 这个任务记为失败，之后的任务使用新的进程池
+            self._replace_executor(executor)
+            result = (False, ["处理失败: 工作进程意外退出"], time.perf_counter() - start_time)
+        finally:
+            with self._lock:
+                self.queued -= 1
+        with self._lock:
+            self.counts['done' if result[0] else 'failed'] += 1
+        return result
+
+    def status(self):
+        with self._lock:
+            return {'workers': self.workers, 'queued': self.queued, 'max_queued': self.max_queued,
+                    **self.counts}
+
+    def close(self):
+        with self._executor_lock:
+            self.executor.shutdown(cancel_futures=True)
+
+
+class IPv6HTTPServer(ThreadingHTTPServer):
+    """监听IPv6地址（::1）的服务，ThreadingHTTPServer 只支持IPv4"""
+
+    address_family = socket.AF_INET6
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """每个请求在单独的线程中处理，实际工作交给 server.service 的工作进程"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        self.server.service.log(f"{self.address_string()} {format % args}")
+
+    def send_json(self, code, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/status':
+            self.send_json(200, self.server.service.status())
+        else:
+            self.send_json(404, {'error': f"未知路径: {self.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        tool = url.path.strip('/')
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        # 先把请求体读完，出错时连接仍可继续使用
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.send_json(411, {'error': "需要 Content-Length"})
+            return
+
+        with tempfile.TemporaryDirectory(prefix='job_') as work_dir:
+            input_path = os.path.join(work_dir, 'input' + self._input_suffix(tool, query))
+            self._receive(input_path, length)
+
+            if tool not in JOB_TOOLS:
+                self.send_json(404, {'error': f"未知任务: {tool}"})
+                return
+            try:
+                options = self._parse_options(tool, query)
+            except ValueError as e:
+                self.send_json(400, {'error': str(e)})
+                return
+
+            service = self.server.service
+            if not service.acquire():
+                self.send_json(503, {'error': "排队任务已满，请稍后重试"})
+                return
+            output_path = os.path.join(work_dir, 'output.pdf')
+            success, messages, seconds = service.run(tool, input_path, output_path, options)
+            if not success or not os.path.exists(output_path):
+                self.send_json(500, {'error': "处理失败", 'log': messages})
+                return
+            self._send_file(output_path, seconds)
+
+    def _input_suffix(self, tool, query):
+        """图片按原文件名的扩展名保存，便于识别格式"""
+        if tool == 'image-pdf':
+            return os.path.splitext(query.get('name', ''))[1].lower() or '.img'
+        return '.txt' if tool == 'labels' else '.pdf'
+
+    def _parse_options(self, tool, query):
+        profile = query.get('profile', 'lossless')
+        parse_profile(profile)
+        mode = query.get('mode', 'raster')
+        if tool == 'crop-pdf' and mode not in pdf_crop_tool.PDF_CROP_MODES:
+            raise ValueError(f"未知裁剪模式: {mode}")
+        return {'mode': mode, 'profile': profile}
+
+    def _receive(self, path, length):
+        """分块读取请求体写入文件，大文件不必整个放在内存中"""
+        with open(path, 'wb') as f:
+            remaining = length
+            while remaining > 0:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+
+    def _send_file(self, path, seconds):
+        """分块返回生成的PDF"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/pdf')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('X-Job-Seconds', f"{seconds:.3f}")
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=None, use_cache=True, log=print):
+    """创建服务，port 为0时自动选择空闲端口（server.server_address 中可查到）"""
+    if host not in LOCAL_HOSTS:
+        raise ValueError(f"只能监听本机地址: {host}")
+    service = JobService(workers, use_cache, log)
+    try:
+        server_class = IPv6HTTPServer if ':' in host else ThreadingHTTPServer
+        server = server_class((host, port), JobRequestHandler)
+    except OSError:
+        service.close()
+        raise
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def server_url(server):
+    """服务的访问地址，IPv6地址加方括号"""
+    host, port = server.server_address[:2]
+    if ':' in host:
+        host = f"[{host}]"
+    return f"http://{host}:{port}/"
+
+
+def serve(server, log=print):
+    """运行服务直到按下 Ctrl+C，退出时关闭工作进程"""
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+        log("任务服务已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本机HTTP任务服务：标签生成、PDF裁剪、图片转PDF")
+    parser.add_argument('--host', default=DEFAULT_HOST, choices=LOCAL_HOSTS, help="监听地址（仅限本机）")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="端口")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="常驻工作进程数")
+    parser.add_argument('--no-cache', action='store_true', help="不使用结果缓存")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("并行数必须大于0")
+    server = create_server(args.host, args.port, args.workers, not args.no_cache)
+    print(f"任务服务已启动: {server_url(server)}（{args.workers} 个工作进程）")
+    serve(server)
+
+
+if __name__ == "__main__":
+    # 打包后的exe使用多进程时需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标签PDF生成
+可视化界面和命令行共用：每组文字一页，页面宽度固定，字号尽量大，页面高度随行数变化
+"""
+
+import os
+
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfmetrics
+
+from result_cache import content_key, text_digest
+from pdf_writer import StreamingTextPdfWriter
+import font_registry
+import stage_timer
+
+# 页面宽度和页边距
+BASE_WIDTH = 1000
+MARGIN = 20
+# 尝试的字号范围（从大到小，步长2），都放不下时使用最小字号
+MAX_FONT_SIZE = 80
+MIN_FONT_SIZE = 14
+FONT_SIZE_STEP = 2
+# 最长一行不超过可用宽度的比例
+WIDTH_RATIO = 0.95
+# 逐组读取标签文件时每次读取的字符数
+READ_CHUNK = 1024 * 1024
+# 排版方式的版本，排版结果变化时加1，已缓存的旧结果随之失效
+LAYOUT_VERSION = 2
+
+# 按顺序尝试的中文字体
+FONT_PATHS = [
+    'C:/Windows/Fonts/simsun.ttc',
+    'C:/Windows/Fonts/simhei.ttf',
+    'C:/Windows/Fonts/msyh.ttc',
+]
+LABEL_FONT_NAME = 'ChineseFont'
+
+
+def parse_label_groups(content):
+    """按空行分组，去掉空组"""
+    return [g.strip() for g in content.split('\n\n') if g.strip()]
+
+
+def iter_text_segments(f, chunk_size=READ_CHUNK):
+    """逐块读取文本文件，依次产出与 f.read().split('\\n\\n') 相同的各段，不必把整个文件读入内存"""
+    rest = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        parts = (rest + chunk).split('\n\n')
+        # 最后一段可能还没读完，与下一块拼接后再分
+        rest = parts.pop()
+        yield from parts
+    yield rest
+
+
+def iter_label_groups(f):
+    """逐组读取标签文件，结果与 parse_label_groups(f.read()) 相同"""
+    for segment in iter_text_segments(f):
+        group = segment.strip()
+        if group:
+            yield group
+
+
+def iter_label_file(path):
+    """逐组读取UTF-8标签文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from iter_label_groups(f)
+
+
+def register_label_font(log=None):
+    """
+    注册第一个可用的中文字体，返回字体名；都不可用时使用Helvetica
+    字体由 font_registry 加载，同一进程中只解析一次
+    """
+    for font_path in FONT_PATHS:
+        if os.path.exists(font_path):
+            try:
+                font_registry.load_font(LABEL_FONT_NAME, font_path)
+                if log:
+                    log(f"加载字体: {os.path.basename(font_path)}")
+                return LABEL_FONT_NAME
+            except:
+                continue
+    return 'Helvetica'
+
+
+def preload_label_font():
+    """在后台提前加载标签字体，启动界面或服务时调用"""
+    return font_registry.preload([(LABEL_FONT_NAME, font_path) for font_path in FONT_PATHS])
+
+
+def label_cache_key(groups):
+    """标签PDF的缓存键，字体不同结果也不同"""
+    settings = {
+        'fonts': [path for path in FONT_PATHS if os.path.exists(path)],
+        'base_width': BASE_WIDTH,
+        'margin': MARGIN,
+        'layout': LAYOUT_VERSION,
+    }
+    return content_key('labels', settings, text_digest('\n\n'.join(groups)))
+
+
+def layout_label_page(lines, font_name, page_width=BASE_WIDTH, margin=MARGIN):
+    """
+    一组标签的页面布局，返回 ((页面宽, 页面高), 字号, [(x, y, 文字), ...])
+    字号尽量大，页面高度随行数变化，不低于200
+    """
+    font_size, line_height, required_height = calculate_optimal_layout(lines, font_name, page_width, margin)
+    page_height = int(max(required_height, 200))
+    start_y = page_height - margin - font_size * 0.8
+    placed = [(margin, start_y - j * line_height, line) for j, line in enumerate(lines)]
+    return (page_width, page_height), font_size, placed
+
+
+def create_label_pdf(groups, output_filename, log=None, cache=None, progress=None):
+    """
+    创建PDF文件，cache 为 ResultCache 时相同内容和字体直接使用缓存的PDF
+    progress(已完成页数, 总页数) 在每页绘制后调用
+    """
+    if cache is not None:
+        # 注册字体前查找，命中时连字体都不必加载
+        key = label_cache_key(groups)
+        if cache.fetch_file(key, output_filename):
+            if log:
+                log("命中缓存，直接使用已有结果")
+            return
+
+    # 设置中文字体
+    with stage_timer.stage('加载字体'):
+        font_name = register_label_font(log)
+
+    c = None
+    for i, group in enumerate(groups):
+        lines = [line for line in group.strip().split('\n') if line.strip()]
+        with stage_timer.stage('排版', page=i):
+            page_size, font_size, placed = layout_label_page(lines, font_name)
+
+        if c is None:
+            c = canvas.Canvas(output_filename, pagesize=page_size)
+        else:
+            # 先结束上一页再设置新页面的大小，否则上一页会用这一页的大小
+            c.showPage()
+            c.setPageSize(page_size)
+
+        with stage_timer.stage('绘制', page=i):
+            c.setFont(font_name, font_size)
+            for x, y, line in placed:
+                c.drawString(x, y, line)
+        if progress:
+            progress(i + 1, len(groups))
+
+    if c:
+        with stage_timer.stage('保存'):
+            c.save()
+        if cache is not None:
+            cache.store_file(key, output_filename)
+
+
+def create_label_pdf_streaming(groups, output_filename, log=None, progress=None):
+    """
+    逐页写出标签PDF，groups 可以是 iter_label_file 等逐组产出的迭代器，
+    每组排版后立即写入文件，标签再多内存占用也基本不变；不使用结果缓存
+    progress(已完成页数, None) 在每页写出后调用（总页数事先未知）
+    返回页数，出错或被取消时删除写了一半的文件
+    """
+    with stage_timer.stage('加载字体'):
+        font_name = register_label_font(log)
+
+    writer = StreamingTextPdfWriter(output_filename, pdfmetrics.getFont(font_name))
+    try:
+        for i, group in enumerate(groups):
+            lines = [line for line in group.strip().split('\n') if line.strip()]
+            with stage_timer.stage('排版', page=i):
+                (page_width, page_height), font_size, placed = layout_label_page(lines, font_name)
+            with stage_timer.stage('绘制', page=i):
+                writer.add_text_page(page_width, page_height,
+                                     [(x, y, font_size, line) for x, y, line in placed])
+            if progress:
+                progress(i + 1, None)
+        with stage_timer.stage('保存'):
+            writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.page_count
+
+
+def fit_font_size(lines, font_name, max_width, max_size=MAX_FONT_SIZE):
+    """
+    最长一行不超过 max_width 的最大字号（MIN_FONT_SIZE 到 max_size 之间的偶数），都放不下时返回 MIN_FONT_SIZE
+    文字宽度与字号成正比，每行只按1号字测量一次，由最长一行直接算出字号，
+    再用实际字号复核最长的一行，结果与逐个字号测量完全相同
+    """
+    widest, unit_width = None, 0.0
+    for line in lines:
+        if line.strip():
+            width = pdfmetrics.stringWidth(line, font_name, 1)
+            if width > unit_width:
+                widest, unit_width = line, width
+    if widest is None:
+        return max_size
+
+    def fits(size):
+        return pdfmetrics.stringWidth(widest, font_name, size) <= max_width
+
+    steps = (max_size - MIN_FONT_SIZE) // FONT_SIZE_STEP
+    estimate = int((max_width / unit_width - MIN_FONT_SIZE) // FONT_SIZE_STEP)
+    font_size = MIN_FONT_SIZE + max(0, min(steps, estimate)) * FONT_SIZE_STEP
+    # 浮点误差可能让估算差一档，向两边复核
+    while font_size < max_size and fits(font_size + FONT_SIZE_STEP):
+        font_size += FONT_SIZE_STEP
+    while font_size > MIN_FONT_SIZE and not fits(font_size):
+        font_size -= FONT_SIZE_STEP
+    return font_size
+
+
+def calculate_optimal_layout(lines, font_name, page_width, margin):
+    """计算最优布局，返回 (字号, 行高, 所需页面高度)"""
+    available_width = page_width - 2 * margin
+    font_size = fit_font_size(lines, font_name, available_width * WIDTH_RATIO)
+    line_height = font_size * 1.1
+    total_text_height = len(lines) * line_height
+    required_height = total_text_height + margin * 2 + font_size * 0.3
+    return font_size, line_height, required_height
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+输出编码配置
+裁剪后的页面按配置编码：无损PNG、指定质量的JPEG，或按每页目标大小自动选择JPEG质量
+"""
+
+from io import BytesIO
+
+# 界面中可选的预设配置
+PRESET_PROFILES = [
+    ('lossless', '无损 PNG（默认）'),
+    ('jpeg:90', 'JPEG 高质量 (90)'),
+    ('jpeg:75', 'JPEG 标准 (75)'),
+    ('target:500k', '每页不超过 500KB（自动选择质量）'),
+    ('target:200k', '每页不超过 200KB（自动选择质量）'),
+]
+
+# 所有配置保存PDF时都清理无用对象并压缩未压缩的流
+SAVE_OPTIONS = {'garbage': 3, 'deflate': True}
+
+# 按目标大小搜索时的JPEG质量范围
+MIN_JPEG_QUALITY = 10
+MAX_JPEG_QUALITY = 95
+
+
+def parse_size(text):
+    """解析 500k、2m、123456 这样的大小"""
+    text = text.strip().lower()
+    units = {'k': 1024, 'm': 1024 * 1024}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def parse_profile(spec):
+    """
+    解析配置字符串
+    lossless      无损PNG
+    jpeg:质量      指定质量的JPEG (1-95)
+    target:大小    每页不超过该大小，PNG已满足时用PNG，否则自动选择JPEG质量，例如 target:300k
+    """
+    spec = (spec or 'lossless').strip().lower()
+    profile = {'name': spec, 'format': 'PNG', 'quality': None, 'target_bytes': None,
+               'save_options': dict(SAVE_OPTIONS)}
+    try:
+        if spec == 'lossless':
+            return profile
+        kind, _, value = spec.partition(':')
+        if kind == 'jpeg':
+            quality = int(value)
+            if not 1 <= quality <= 95:
+                raise ValueError
+            profile.update(format='JPEG', quality=quality)
+            return profile
+        if kind == 'target':
+            profile.update(format='JPEG', target_bytes=parse_size(value))
+            return profile
+    except ValueError:
+        pass
+    raise ValueError(f"未知的输出配置: {spec}")
+
+
+def _encode_jpeg(img, quality, dpi):
+    output_stream = BytesIO()
+    options = {'quality': quality}
+    if dpi:
+        options['dpi'] = dpi
+    img.save(output_stream, format='JPEG', **options)
+    return output_stream.getvalue()
+
+
+def encode_image(img, spec='lossless', dpi=None):
+    """
+    按配置在内存中编码图片
+    返回 (类型, 数据)，类型为 png 或 jpeg
+    """
+    profile = parse_profile(spec)
+
+    if profile['format'] == 'PNG' or profile['target_bytes'] is not None:
+        output_stream = BytesIO()
+        options = {'dpi': dpi} if dpi else {}
+        img.save(output_stream, format='PNG', **options)
+        png_data = output_stream.getvalue()
+        if profile['format'] == 'PNG':
+            return 'png', png_data
+        # 无损编码已经满足目标大小时不必有损压缩（文字页面通常如此）
+        if len(png_data) <= profile['target_bytes']:
+            return 'png', png_data
+
+    if profile['target_bytes'] is None:
+        return 'jpeg', _encode_jpeg(img, profile['quality'], dpi)
+
+    # 二分查找不超过目标大小的最高质量
+    low, high = MIN_JPEG_QUALITY, MAX_JPEG_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode_jpeg(img, quality, dpi)
+        if len(data) <= profile['target_bytes']:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    if best is not None:
+        return 'jpeg', best
+
+    # 都超过目标大小时取最低质量JPEG和PNG中较小的一个
+    smallest = _encode_jpeg(img, MIN_JPEG_QUALITY, dpi)
+    if len(png_data) <= len(smallest):
+        return 'png', png_data
+    return 'jpeg', smallest
@@ -2,11 +2,47 @@
 # -*- coding: utf-8 -*-
 
 import os
+import argparse
 import shutil
+import time
+import multiprocessing
+import zlib
+from collections import deque, OrderedDict
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 import fitz  # PyMuPDF
+import numpy as np
 from PIL import Image, ImageChops
 import tempfile
+from crop_engine import find_content_box, is_croppable, PDF_WHITE_THRESHOLD
+from output_profiles import encode_image, parse_profile, SAVE_OPTIONS
+from folder_manifest import FolderManifest, file_digest
+from result_cache import ResultCache, content_key
+from pdf_writer import ResumablePdfWriter
+import stage_timer
+
+# PDF裁剪模式: raster 渲染为图片后裁剪, clip 先低分辨率探测再只渲染内容区域,
+# vector 只调整页面框并保留文字层和矢量内容
+PDF_CROP_MODES = ('raster', 'clip', 'vector')
+
+# 页面渲染的缩放倍数，放大以提高质量
+RENDER_SCALE = 2.0
+# clip模式探测渲染的缩放倍数
+PROBE_SCALE = 0.5
+# 探测时向外扩展的像素数，防止低分辨率下边缘内容被抗锯齿冲淡
+PROBE_PADDING = 2
+
+# 页数达到该值时逐页写出并记录进度，内存占用不随页数增长，中断后可以继续
+STREAMING_MIN_PAGES = 500
+# 逐页写出时未完成的输出文件和进度文件的后缀
+PARTIAL_SUFFIX = '.part'
+PROGRESS_SUFFIX = '.progress'
+# 逐页写出时原始像素的压缩级别
+STREAM_COMPRESS_LEVEL = 6
+# 使用共用进程池时每个进程保留的已打开文档数
+SHARED_DOCUMENTS = 2
 
 def find_pdf_files(folder_path):
     """递归查找所有PDF文件"""
@@ -17,8 +53,197 @@ def find_pdf_files(folder_path):
                 pdf_files.append(os.path.join(root, file))
     return pdf_files
 
-def crop_pdf_pages(input_pdf_path, output_pdf_path):
-    """裁剪PDF每一页的空白区域"""
+def crop_page_image(page, mode='raster', profile='lossless'):
+    """
+    渲染并裁剪单个页面
+    渲染得到的像素缓冲区直接交给边界检测，不经过PNG编码再解码
+    返回 (宽, 高, 类型, 数据)：无损配置时类型为 raw，数据为裁剪区域的原始RGB像素，
+    由 insert_page_image 直接生成PDF图片；其他配置为按输出配置编码的 png/jpeg 数据
+    """
+    # 将页面转换为图片
+    mat = fitz.Matrix(RENDER_SCALE, RENDER_SCALE)
+    clip = None
+    if mode == 'clip':
+        # 只渲染低分辨率探测到的内容区域
+        with stage_timer.stage('探测', page=page.number):
+            clip = probe_content_clip(page)
+    with stage_timer.stage('渲染', page=page.number):
+        pix = page.get_pixmap(matrix=mat, clip=clip)
+    
+    # 像素缓冲区的零拷贝视图
+    pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    
+    # 检测内容边界，裁剪只是取视图的切片
+    with stage_timer.stage('边界检测', page=page.number):
+        box = find_content_box(pixels, PDF_WHITE_THRESHOLD)
+    if clip is not None and not is_croppable(box):
+        # 探测把浅于白色阈值的像素也算作内容，只有这类内容时栅格模式保留整页，这里同样渲染整页
+        with stage_timer.stage('渲染', page=page.number):
+            pix = page.get_pixmap(matrix=mat)
+        pixels = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        with stage_timer.stage('边界检测', page=page.number):
+            box = find_content_box(pixels, PDF_WHITE_THRESHOLD)
+    if is_croppable(box):
+        left, top, right, bottom = box
+        pixels = pixels[top:bottom + 1, left:right + 1]
+    height, width = pixels.shape[:2]
+    
+    with stage_timer.stage('编码', page=page.number):
+        if parse_profile(profile)['format'] == 'PNG':
+            # 裁剪区域只复制这一次，压缩交给PDF写入
+            return width, height, 'raw', pixels.tobytes()
+        
+        # 有损配置仍需图片编码器
+        cropped = Image.frombuffer('RGB', (width, height), pixels.tobytes(), 'raw', 'RGB', 0, 1)
+        kind, image_data = encode_image(cropped, profile, dpi=(300, 300))
+        return width, height, kind, image_data
+
+def insert_page_image(pdf, width, height, kind, image_data):
+    """在文档末尾添加一页并插入 crop_page_image 的结果"""
+    img_rect = fitz.Rect(0, 0, width, height)
+    with stage_timer.stage('插入页面', page=len(pdf)):
+        new_page = pdf.new_page(width=width, height=height)
+        if kind == 'raw':
+            new_page.insert_image(img_rect, pixmap=fitz.Pixmap(fitz.csRGB, width, height, image_data, 0))
+        else:
+            new_page.insert_image(img_rect, stream=image_data)
+
+# 页面并行时每个工作进程各自打开的文档
+_worker_document = None
+_worker_mode = None
+_worker_profile = None
+
+def _init_page_worker(input_pdf_path, mode, profile, timing=False):
+    """工作进程初始化：打开自己的文档句柄，timing 为主进程是否在分阶段计时"""
+    global _worker_document, _worker_mode, _worker_profile
+    _worker_document = fitz.open(input_pdf_path)
+    _worker_mode = mode
+    _worker_profile = profile
+    stage_timer.init_worker(timing)
+
+def _crop_page_in_worker(page_num):
+    """在工作进程中裁剪一页，返回 (裁剪结果, 计时记录)"""
+    return crop_page_image(_worker_document[page_num], _worker_mode, _worker_profile), stage_timer.take()
+
+def encode_stream_page(page, mode='raster', profile='lossless'):
+    """裁剪单页并压缩为 StreamingPdfWriter.add_page 的 (类型, 参数)"""
+    width, height, kind, image_data = crop_page_image(page, mode, profile)
+    if kind == 'raw':
+        with stage_timer.stage('压缩', page=page.number):
+            return 'flate', (width, height, zlib.compress(image_data, STREAM_COMPRESS_LEVEL))
+    if kind == 'jpeg':
+        return 'jpeg', (image_data, width, height)
+    return 'png', (width, height, image_data)
+
+def _stream_page_in_worker(page_num):
+    """在工作进程中裁剪并压缩一页，返回 (结果, 计时记录)"""
+    return encode_stream_page(_worker_document[page_num], _worker_mode, _worker_profile), stage_timer.take()
+
+# 共用进程池中每个进程最近打开的文档，键为 (路径, 修改时间)
+_shared_documents = OrderedDict()
+
+def _shared_document(input_pdf_path):
+    """共用进程池的任务不经过初始化函数，按路径打开文档并保留最近用过的几个"""
+    key = (input_pdf_path, os.stat(input_pdf_path).st_mtime_ns)
+    document = _shared_documents.pop(key, None) or fitz.open(input_pdf_path)
+    _shared_documents[key] = document
+    while len(_shared_documents) > SHARED_DOCUMENTS:
+        _shared_documents.popitem(last=False)[1].close()
+    return document
+
+def _crop_page_task(input_pdf_path, mode, profile, timing, page_num):
+    """在共用进程池中裁剪一页，返回 (裁剪结果, 计时记录)"""
+    stage_timer.init_worker(timing)
+    page = _shared_document(input_pdf_path)[page_num]
+    return crop_page_image(page, mode, profile), stage_timer.take()
+
+def _stream_page_task(input_pdf_path, mode, profile, timing, page_num):
+    """在共用进程池中裁剪并压缩一页，返回 (结果, 计时记录)"""
+    stage_timer.init_worker(timing)
+    page = _shared_document(input_pdf_path)[page_num]
+    return encode_stream_page(page, mode, profile), stage_timer.take()
+
+def _bounded_map(executor, fn, items, window):
+    """
+    与 executor.map 相同，但同时提交的任务不超过 window 个，结果按顺序产出
+    提前关闭（如任务被取消）时取消还没开始的任务
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+def _page_count(pdf_path):
+    """读取页数，打不开时返回0（由后续处理报告错误）"""
+    try:
+        with fitz.open(pdf_path) as pdf_document:
+            return len(pdf_document)
+    except Exception:
+        return 0
+
+def crop_pdf_pages(input_pdf_path, output_pdf_path, mode='raster', log=print, workers=1,
+                   profile='lossless', cache=None, streaming=None, progress=None, executor=None):
+    """
+    裁剪PDF每一页的空白区域
+    workers 大于1时按页并行，由多个进程渲染、检测和编码，再按页码顺序写入输出文档
+    profile 为输出编码配置，见 output_profiles.parse_profile
+    cache 为 ResultCache 时先按文件内容和设置查找缓存，命中则直接复制已有结果
+    streaming 为True时逐页写出（见 crop_pdf_pages_streaming），为None时页数达到
+    STREAMING_MIN_PAGES 才逐页写出
+    progress(已完成页数, 总页数) 在每页完成后调用，抛出异常即可在该页之后停止
+    executor 为常驻的进程池时按页并行使用它，不再为这个文件单独启动进程
+    其他错误时返回False；按页并行的进程池中有工作进程意外退出时抛出 BrokenProcessPool，
+    此时进程池已不能再用，由调用方决定是否换进程池重试
+    """
+    if mode not in PDF_CROP_MODES:
+        raise ValueError(f"未知的裁剪模式: {mode}")
+    
+    with stage_timer.stage(stage_timer.FILE_STAGE, file=os.path.basename(input_pdf_path)):
+        return _crop_pdf_pages(input_pdf_path, output_pdf_path, mode, log, workers, profile, cache, streaming,
+                               progress, executor)
+
+def _crop_pdf_pages(input_pdf_path, output_pdf_path, mode, log, workers, profile, cache, streaming, progress,
+                    executor):
+    """crop_pdf_pages 的实现，整体计入该文件的耗时"""
+    if cache is not None:
+        with stage_timer.stage('缓存查找'):
+            key = pdf_cache_key(input_pdf_path, mode, profile)
+            hit = cache.fetch_file(key, output_pdf_path)
+        if hit:
+            log("    命中缓存，直接使用已有结果")
+            return True
+    
+    save_options = parse_profile(profile)['save_options']
+    if mode == 'vector':
+        success = crop_pdf_pages_vector(input_pdf_path, output_pdf_path, log, save_options, progress)
+    elif streaming or (streaming is None and _page_count(input_pdf_path) >= STREAMING_MIN_PAGES):
+        success = crop_pdf_pages_streaming(input_pdf_path, output_pdf_path, mode, log, workers, profile,
+                                           progress, executor)
+    else:
+        success = crop_pdf_pages_raster(input_pdf_path, output_pdf_path, mode, log, workers,
+                                        profile, save_options, progress, executor)
+    
+    if success and cache is not None:
+        cache.store_file(key, output_pdf_path)
+    return success
+
+def pdf_cache_key(input_pdf_path, mode='raster', profile='lossless'):
+    """PDF裁剪结果的缓存键"""
+    return content_key('pdf_crop', crop_settings(mode, profile), file_digest(input_pdf_path))
+
+def crop_pdf_pages_raster(input_pdf_path, output_pdf_path, mode='raster', log=print, workers=1,
+                          profile='lossless', save_options=None, progress=None, executor=None):
+    """渲染为图片后裁剪（raster/clip模式）"""
+    save_options = save_options or SAVE_OPTIONS
+    own_executor = None
+    results = None
     try:
         # 打开PDF文档
         pdf_document = fitz.open(input_pdf_path)
@@ -27,118 +252,51 @@ def crop_pdf_pages(input_pdf_path, output_pdf_path):
         new_pdf = fitz.open()
         
         total_pages = len(pdf_document)
-        print(f"    处理 {total_pages} 页...")
+        if not total_pages:
+            log("    ❌ PDF没有页面，跳过")
+            pdf_document.close()
+            new_pdf.close()
+            return False
+        start_time = time.perf_counter()
+        workers = max(1, min(workers, total_pages))
+        if workers > 1:
+            log(f"    处理 {total_pages} 页（{workers} 个进程并行）...")
+            if executor is None:
+                own_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                                                   initargs=(input_pdf_path, mode, profile, stage_timer.is_enabled()))
+                results = own_executor.map(_crop_page_in_worker, range(total_pages),
+                                           chunksize=max(1, min(8, total_pages // (workers * 4))))
+            else:
+                task = partial(_crop_page_task, input_pdf_path, mode, profile, stage_timer.is_enabled())
+                results = _bounded_map(executor, task, range(total_pages), workers * 2)
+        else:
+            log(f"    处理 {total_pages} 页...")
+            results = ((crop_page_image(pdf_document[page_num], mode, profile), None)
+                       for page_num in range(total_pages))
         
-        for page_num in range(total_pages):
-            page = pdf_document[page_num]
-            
-            # 将页面转换为图片
-            mat = fitz.Matrix(2.0, 2.0)  # 放大倍数，提高质量
-            pix = page.get_pixmap(matrix=mat)
-            
-            # 使用内存缓冲区而不是临时文件
-            img_data = pix.tobytes("png")
-            
-            # 转换为PIL图像
-            from io import BytesIO
-            img_stream = BytesIO(img_data)
-            
-            with Image.open(img_stream) as img:
-                # 转换为RGB模式
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # 获取图片像素数据并裁剪
-                pixels = img.load()
-                width, height = img.size
-                
-                # 定义白色阈值
-                white_threshold = 240
-                
-                # 找边界
-                # 找上边界
-                top = 0
-                for y in range(height):
-                    found_content = False
-                    for x in range(width):
-                        r, g, b = pixels[x, y]
-                        if r < white_threshold or g < white_threshold or b < white_threshold:
-                            found_content = True
-                            break
-                    if found_content:
-                        top = y
-                        break
-                
-                # 找下边界
-                bottom = height - 1
-                for y in range(height - 1, -1, -1):
-                    found_content = False
-                    for x in range(width):
-                        r, g, b = pixels[x, y]
-                        if r < white_threshold or g < white_threshold or b < white_threshold:
-                            found_content = True
-                            break
-                    if found_content:
-                        bottom = y
-                        break
-                
-                # 找左边界
-                left = 0
-                for x in range(width):
-                    found_content = False
-                    for y in range(height):
-                        r, g, b = pixels[x, y]
-                        if r < white_threshold or g < white_threshold or b < white_threshold:
-                            found_content = True
-                            break
-                    if found_content:
-                        left = x
-                        break
-                
-                # 找右边界
-                right = width - 1
-                for x in range(width - 1, -1, -1):
-                    found_content = False
-                    for y in range(height):
-                        r, g, b = pixels[x, y]
-                        if r < white_threshold or g < white_threshold or b < white_threshold:
-                            found_content = True
-                            break
-                    if found_content:
-                        right = x
-                        break
-                
-                # 裁剪图片
-                if left < right and top < bottom:
-                    cropped = img.crop((left, top, right + 1, bottom + 1))
-                else:
-                    cropped = img
-                
-                # 转换为RGB模式（如果还不是）
-                if cropped.mode != 'RGB':
-                    cropped = cropped.convert('RGB')
-                
-                # 保存裁剪后的图片到内存
-                output_stream = BytesIO()
-                cropped.save(output_stream, format='PNG', dpi=(300, 300))
-                output_stream.seek(0)
-                
-                # 创建新页面并插入图片
-                img_rect = fitz.Rect(0, 0, cropped.width, cropped.height)
-                new_page = new_pdf.new_page(width=cropped.width, height=cropped.height)
-                new_page.insert_image(img_rect, stream=output_stream.getvalue())
+        # map按提交顺序返回结果，页面顺序与原文档一致
+        for page_num, (page_image, records) in enumerate(results):
+            stage_timer.merge(records)
+            # 创建新页面并插入图片
+            insert_page_image(new_pdf, *page_image)
             
-            print(f"    完成第 {page_num + 1}/{total_pages} 页")
+            log(f"    完成第 {page_num + 1}/{total_pages} 页")
+            if progress:
+                progress(page_num + 1, total_pages)
+        
+        elapsed = time.perf_counter() - start_time
+        if total_pages and elapsed > 0:
+            log(f"    共 {total_pages} 页，用时 {elapsed:.1f} 秒，{total_pages / elapsed:.1f} 页/秒")
         
         # 保存新PDF
-        new_pdf.save(output_pdf_path)
+        with stage_timer.stage('保存'):
+            new_pdf.save(output_pdf_path, **save_options)
         new_pdf.close()
         pdf_document.close()
         
         return True
         
     except Exception as e:
-        print(f"    ❌ 处理PDF失败: {e}")
         # 确保文件被正确关闭
         try:
             if 'new_pdf' in locals():
@@ -147,45 +305,439 @@ def crop_pdf_pages(input_pdf_path, output_pdf_path):
                 pdf_document.close()
         except:
             pass
+        if isinstance(e, BrokenProcessPool):
+            # 进程池不能再用，由 crop_pdf_files 换进程池后重新处理这个文件
+            raise
+        log(f"    ❌ 处理PDF失败: {e}")
+        return False
+    finally:
+        if hasattr(results, 'close'):
+            results.close()
+        if own_executor is not None:
+            own_executor.shutdown(cancel_futures=True)
+
+def crop_pdf_pages_streaming(input_pdf_path, output_pdf_path, mode='raster', log=print, workers=1,
+                             profile='lossless', progress=None, executor=None):
+    """
+    逐页写出的raster/clip裁剪，用于页数很多的PDF
+    每页裁剪压缩后立即写入磁盘，同时在处理中的页面不超过 workers*2 页，内存占用不随页数增长；
+    输出先写到 .part 文件，每写完一页在 .progress 文件中记录进度，全部完成后才改为正式文件名。
+    中断后再次处理同一文件（大小、修改时间和设置都不变）时从上次完成的页面之后继续
+    """
+    partial_path = output_pdf_path + PARTIAL_SUFFIX
+    stat = os.stat(input_pdf_path)
+    header = {
+        'input_size': stat.st_size,
+        'input_mtime_ns': stat.st_mtime_ns,
+        'settings': crop_settings(mode, profile),
+    }
+    
+    own_executor = None
+    results = None
+    writer = None
+    pdf_document = None
+    try:
+        pdf_document = fitz.open(input_pdf_path)
+        total_pages = len(pdf_document)
+        if not total_pages:
+            # 没有页面时不创建 .part 和进度文件
+            log("    ❌ PDF没有页面，跳过")
+            return False
+        
+        writer = ResumablePdfWriter(partial_path, output_pdf_path + PROGRESS_SUFFIX, header)
+        start_page = writer.resume()
+        if start_page:
+            log(f"    上次已完成 {start_page}/{total_pages} 页，从第 {start_page + 1} 页继续")
+        
+        page_nums = range(start_page, total_pages)
+        start_time = time.perf_counter()
+        workers = max(1, min(workers, len(page_nums)))
+        if workers > 1:
+            log(f"    处理 {total_pages} 页（逐页写出，{workers} 个进程并行）...")
+            if executor is None:
+                own_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                                                   initargs=(input_pdf_path, mode, profile, stage_timer.is_enabled()))
+                results = _bounded_map(own_executor, _stream_page_in_worker, page_nums, workers * 2)
+            else:
+                task = partial(_stream_page_task, input_pdf_path, mode, profile, stage_timer.is_enabled())
+                results = _bounded_map(executor, task, page_nums, workers * 2)
+        else:
+            log(f"    处理 {total_pages} 页（逐页写出）...")
+            results = ((encode_stream_page(pdf_document[page_num], mode, profile), None)
+                       for page_num in page_nums)
+        
+        for page_num, (page, records) in zip(page_nums, results):
+            stage_timer.merge(records)
+            with stage_timer.stage('写入页面', page=page_num):
+                writer.add_page(page)
+            log(f"    完成第 {page_num + 1}/{total_pages} 页")
+            if progress:
+                progress(page_num + 1, total_pages)
+        
+        elapsed = time.perf_counter() - start_time
+        if page_nums and elapsed > 0:
+            log(f"    共 {len(page_nums)} 页，用时 {elapsed:.1f} 秒，{len(page_nums) / elapsed:.1f} 页/秒")
+        
+        with stage_timer.stage('保存'):
+            writer.close()
+        os.replace(partial_path, output_pdf_path)
+        return True
+        
+    except BrokenProcessPool:
+        # 进程池不能再用，由 crop_pdf_files 换进程池后从已完成的页面之后继续
+        if writer is not None:
+            writer.abort()
+        raise
+    except Exception as e:
+        if writer is not None:
+            writer.abort()
+        log(f"    ❌ 处理PDF失败: {e}（已完成的页面已保存，再次处理时继续）")
+        return False
+    except BaseException:
+        # 被取消或中断时同样保留已完成的页面
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        if hasattr(results, 'close'):
+            results.close()
+        if own_executor is not None:
+            own_executor.shutdown(cancel_futures=True)
+        if pdf_document is not None:
+            pdf_document.close()
+
+def probe_content_clip(page):
+    """
+    低分辨率渲染页面并检测内容区域，返回页面坐标下的裁剪范围
+    探测时任何非纯白像素都算内容，最终边界由高分辨率渲染后再精确检测
+    空白页返回None（渲染整页）
+    """
+    pix = page.get_pixmap(matrix=fitz.Matrix(PROBE_SCALE, PROBE_SCALE))
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    box = find_content_box(pixels, 255)
+    if box is None:
+        return None
+    left, top, right, bottom = box
+    clip = fitz.Rect(left - PROBE_PADDING, top - PROBE_PADDING,
+                     right + 1 + PROBE_PADDING, bottom + 1 + PROBE_PADDING) / PROBE_SCALE
+    return clip & page.rect
+
+def _is_white(color):
+    """颜色各分量都不低于白色阈值时视为白色，与栅格裁剪的判定一致"""
+    return all(c * 255 >= PDF_WHITE_THRESHOLD for c in color)
+
+def find_page_content_rect(page):
+    """
+    根据页面自身的文字、图形和图片几何信息计算内容区域，不渲染任何像素
+    返回以CropBox左上角为原点的未旋转坐标，空白页或内容区域过小（见 is_croppable）时返回None
+    """
+    content = fitz.Rect()
+    
+    # 文字（跳过空白字符和白色文字）
+    text = page.get_text('dict', flags=fitz.TEXTFLAGS_TEXT)
+    for block in text['blocks']:
+        for line in block.get('lines', []):
+            for span in line['spans']:
+                if not span['text'].strip():
+                    continue
+                color = span['color']
+                rgb = ((color >> 16) & 255, (color >> 8) & 255, color & 255)
+                if min(rgb) >= PDF_WHITE_THRESHOLD:
+                    continue
+                content |= fitz.Rect(span['bbox'])
+    
+    # 图形（只有白色填充的路径，例如页面底色，不算内容）
+    for path in page.get_drawings():
+        rect = fitz.Rect(path['rect'])
+        if path.get('color') is not None and not _is_white(path['color']):
+            half_width = (path.get('width') or 1) / 2
+            content |= rect + (-half_width, -half_width, half_width, half_width)
+        elif path.get('fill') is not None and not _is_white(path['fill']):
+            content |= rect
+    
+    # 图片
+    for info in page.get_image_info():
+        content |= fitz.Rect(info['bbox'])
+    
+    content &= fitz.Rect(0, 0, page.cropbox.width, page.cropbox.height)
+    # 与栅格裁剪相同，宽高都超过一个单位（这里为1pt）才裁剪，只有细线或单个点的页面保留原样
+    if content.is_empty or not is_croppable((content.x0, content.y0, content.x1 - 1, content.y1 - 1)):
+        return None
+    return content
+
+def crop_pdf_pages_vector(input_pdf_path, output_pdf_path, log=print, save_options=None, progress=None):
+    """只调整每页的CropBox/MediaBox，保留文字层和矢量内容"""
+    try:
+        pdf_document = fitz.open(input_pdf_path)
+        
+        total_pages = len(pdf_document)
+        log(f"    处理 {total_pages} 页（矢量模式）...")
+        
+        for page_num in range(total_pages):
+            page = pdf_document[page_num]
+            
+            with stage_timer.stage('分析内容', page=page_num):
+                content = find_page_content_rect(page)
+            if content is not None:
+                # 内容坐标以CropBox左上角为原点，转换为MediaBox坐标后设置
+                origin = page.cropbox.tl
+                page.set_cropbox(content + (origin.x, origin.y, origin.x, origin.y))
+                # MediaBox与CropBox保持一致，只认MediaBox的打印程序也能得到裁剪结果
+                crop_box = pdf_document.xref_get_key(page.xref, 'CropBox')[1]
+                pdf_document.xref_set_key(page.xref, 'MediaBox', crop_box)
+            
+            log(f"    完成第 {page_num + 1}/{total_pages} 页")
+            if progress:
+                progress(page_num + 1, total_pages)
+        
+        with stage_timer.stage('保存'):
+            pdf_document.save(output_pdf_path, **(save_options or SAVE_OPTIONS))
+        pdf_document.close()
+        
+        return True
+        
+    except Exception as e:
+        log(f"    ❌ 处理PDF失败: {e}")
+        try:
+            if 'pdf_document' in locals():
+                pdf_document.close()
+        except:
+            pass
         return False
 
-def process_folder(input_folder, output_folder):
-    """处理整个文件夹"""
+def _crop_file_in_worker(job):
+    """在工作进程中裁剪一个PDF，日志和计时记录先缓存起来交给主进程按顺序输出"""
+    input_pdf_path, output_pdf_path, mode, profile, timing = job
+    stage_timer.init_worker(timing)
+    messages = []
+    start_time = time.perf_counter()
+    success = crop_pdf_pages(input_pdf_path, output_pdf_path, mode, log=messages.append, profile=profile)
+    return success, messages, time.perf_counter() - start_time, stage_timer.take()
+
+def crop_pdf_files(jobs, mode='raster', workers=1, page_workers=1, log=print, profile='lossless',
+                   cache=None, page_progress=None, executor=None):
+    """
+    批量裁剪PDF，jobs 为 [(输入路径, 输出路径, 显示名称), ...]
+    workers 大于1时多个文件同时处理（此时每个文件内不再按页并行），
+    每个文件的日志缓存后按输入顺序整体输出，保证日志顺序固定
+    cache 为 ResultCache 时命中缓存的文件不再处理，全部完成后输出命中统计
+    page_progress 见 crop_pdf_pages 的 progress，只在逐个文件处理时调用
+    executor 为常驻的进程池时多个文件（或单个文件的多页）在其中并行，同时处理的文件不超过 workers 个
+    按输入顺序依次产出 (是否成功, 该文件的处理秒数)
+    """
+    total = len(jobs)
+    if workers <= 1 or total <= 1:
+        for i, (input_pdf_path, output_pdf_path, name) in enumerate(jobs):
+            log(f"处理文件 {i+1}/{total}: {name}")
+            start_time = time.perf_counter()
+            try:
+                success = crop_pdf_pages(input_pdf_path, output_pdf_path, mode, log=log,
+                                         workers=page_workers, profile=profile, cache=cache,
+                                         progress=page_progress, executor=executor)
+            except BrokenProcessPool:
+                # 按页并行的进程池不能再用（共用的进程池也可能被同时执行的其他任务弄坏）：
+                # 这个文件在单独创建的进程池中重新处理一次，之后的文件也各自创建进程池
+                log("    工作进程意外退出，重新处理这个文件")
+                executor = None
+                try:
+                    success = crop_pdf_pages(input_pdf_path, output_pdf_path, mode, log=log,
+                                             workers=page_workers, profile=profile, cache=cache,
+                                             progress=page_progress)
+                except BrokenProcessPool:
+                    log("    ❌ 处理PDF失败: 工作进程意外退出")
+                    success = False
+            yield success, time.perf_counter() - start_time
+        if cache is not None:
+            log(cache.summary())
+        return
+    
+    # 缓存在主进程中查找和写入，命中的文件不交给工作进程
+    keys = [None] * total
+    cached = [False] * total
+    lookup_seconds = [0.0] * total
+    if cache is not None:
+        for i, (input_pdf_path, output_pdf_path, _) in enumerate(jobs):
+            start_time = time.perf_counter()
+            with stage_timer.stage('缓存查找', file=os.path.basename(input_pdf_path)):
+                keys[i] = pdf_cache_key(input_pdf_path, mode, profile)
+                cached[i] = cache.fetch_file(keys[i], output_pdf_path)
+            lookup_seconds[i] = time.perf_counter() - start_time
+    tasks = [(input_pdf_path, output_pdf_path, mode, profile, stage_timer.is_enabled())
+             for (input_pdf_path, output_pdf_path, _), hit in zip(jobs, cached) if not hit]
+    
+    own_executor = None
+    if executor is None:
+        own_executor = ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks))))
+        results = own_executor.map(_crop_file_in_worker, tasks)
+    else:
+        results = _bounded_map(executor, _crop_file_in_worker, tasks, workers)
+    # 已取得结果的文件数
+    finished = 0
+    try:
+        for i, (_, output_pdf_path, name) in enumerate(jobs):
+            log(f"处理文件 {i+1}/{total}: {name}")
+            if cached[i]:
+                log("    命中缓存，直接使用已有结果")
+                yield True, lookup_seconds[i]
+                continue
+            try:
+                result = next(results)
+            except BrokenProcessPool:
+                # 工作进程意外退出（崩溃或被结束）时进程池不能再用，共用的进程池由调度器重新创建。
+                # 正在等待的文件不一定是让进程崩溃的那个（提交时才发现进程池已坏时一定不是），
+                # 先在新的进程池中单独重新处理这个文件，再次崩溃才记为失败；其余文件之后继续并行处理
+                results.close()
+                if own_executor is not None:
+                    own_executor.shutdown(wait=False, cancel_futures=True)
+                own_executor = ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks) - finished)))
+                try:
+                    result = own_executor.submit(_crop_file_in_worker, tasks[finished]).result()
+                except BrokenProcessPool:
+                    result = None
+                    own_executor.shutdown(wait=False, cancel_futures=True)
+                    own_executor = ProcessPoolExecutor(max_workers=max(1, min(workers, len(tasks) - finished)))
+                results = own_executor.map(_crop_file_in_worker, tasks[finished + 1:])
+                if result is None:
+                    finished += 1
+                    log("    ❌ 处理PDF失败: 工作进程意外退出")
+                    yield False, lookup_seconds[i]
+                    continue
+            finished += 1
+            success, messages, seconds, records = result
+            stage_timer.merge(records)
+            for message in messages:
+                log(message)
+            if success and cache is not None:
+                cache.store_file(keys[i], output_pdf_path)
+            yield success, lookup_seconds[i] + seconds
+    finally:
+        # 提前结束（如任务被取消）时取消还没开始的文件
+        results.close()
+        if own_executor is not None:
+            own_executor.shutdown()
+    
+    if cache is not None:
+        log(cache.summary())
+
+def crop_settings(mode='raster', profile='lossless'):
+    """影响输出结果的处理设置，设置变化后已有的输出需要重新生成"""
+    return {
+        'mode': mode,
+        'profile': parse_profile(profile)['name'],
+        'threshold': PDF_WHITE_THRESHOLD,
+        'scale': RENDER_SCALE,
+    }
+
+def sync_pdf_folder(input_folder, output_folder, pdf_files, mode='raster', workers=1, page_workers=1,
+                    log=print, profile='lossless', incremental=False, prune=False, cache=None,
+                    page_progress=None, executor=None):
+    """
+    裁剪 pdf_files 中的文件到输出文件夹，保持相对输入文件夹的目录结构
+    incremental 为True时根据输出文件夹中的清单跳过大小、修改时间（或内容）和设置都没变的文件；
+    prune 为True时再删除源文件已不存在的输出，只删除清单中记录过的文件
+    cache、page_progress、executor 见 crop_pdf_files
+    按顺序产出 (相对路径, 状态, 处理秒数)，状态为 done、failed、skipped 或 removed
+    """
+    manifest = FolderManifest(output_folder, crop_settings(mode, profile)) if incremental else None
+    
+    jobs = []
+    # 每个文件处理前的状态，处理成功后记入清单
+    snapshots = []
+    for pdf_path in pdf_files:
+        rel_path = os.path.relpath(pdf_path, input_folder)
+        output_pdf_path = os.path.join(output_folder, rel_path)
+        if manifest is not None:
+            if manifest.is_current(rel_path, pdf_path, output_pdf_path):
+                yield rel_path, 'skipped', 0.0
+                continue
+            snapshots.append(manifest.snapshot(pdf_path))
+        os.makedirs(os.path.dirname(output_pdf_path), exist_ok=True)
+        jobs.append((pdf_path, output_pdf_path, rel_path))
+    
+    # 结果放在zip的第一个位置，保证生成器最后输出的汇总信息能执行到
+    results = crop_pdf_files(jobs, mode, workers, page_workers, log=log, profile=profile, cache=cache,
+                             page_progress=page_progress, executor=executor)
+    if manifest is None:
+        for (success, seconds), (_, _, rel_path) in zip(results, jobs):
+            yield rel_path, 'done' if success else 'failed', seconds
+        return
+    
+    try:
+        for count, ((success, seconds), (_, _, rel_path), snapshot) in enumerate(
+                zip(results, jobs, snapshots), 1):
+            if success:
+                manifest.record(rel_path, snapshot)
+            else:
+                manifest.forget(rel_path)
+            # 定期保存，中途中断时已完成的文件下次仍可跳过
+            if count % 100 == 0:
+                manifest.save()
+            yield rel_path, 'done' if success else 'failed', seconds
+        
+        if prune:
+            for rel_path in manifest.missing_sources(
+                    os.path.relpath(pdf_path, input_folder) for pdf_path in pdf_files):
+                output_pdf_path = os.path.join(output_folder, rel_path)
+                if os.path.exists(output_pdf_path):
+                    os.remove(output_pdf_path)
+                manifest.forget(rel_path)
+                yield rel_path, 'removed', 0.0
+    finally:
+        manifest.save()
+
+def process_folder(input_folder, output_folder, mode='raster', workers=1, page_workers=1,
+                   profile='lossless', incremental=False, prune=False, cache=None):
+    """处理整个文件夹，workers 为同时处理的文件数，incremental/prune/cache 见 sync_pdf_folder"""
     # 确保输出文件夹存在
     os.makedirs(output_folder, exist_ok=True)
     
     # 查找所有PDF文件
     pdf_files = find_pdf_files(input_folder)
     
-    if not pdf_files:
+    if not pdf_files and not prune:
         print(f"在 {input_folder} 中没有找到PDF文件")
         return 0
     
     print(f"找到 {len(pdf_files)} 个PDF文件")
-    processed_count = 0
     
-    for i, pdf_path in enumerate(pdf_files):
-        print(f"\n处理文件 {i+1}/{len(pdf_files)}: {os.path.relpath(pdf_path, input_folder)}")
-        
-        # 计算相对路径
-        rel_path = os.path.relpath(pdf_path, input_folder)
-        output_pdf_path = os.path.join(output_folder, rel_path)
-        
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_pdf_path)
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 处理PDF
-        if crop_pdf_pages(pdf_path, output_pdf_path):
-            print(f"  ✓ 处理完成: {os.path.basename(pdf_path)}")
+    processed_count = 0
+    skipped_count = 0
+    for rel_path, status, _ in sync_pdf_folder(input_folder, output_folder, pdf_files, mode, workers,
+                                            page_workers, profile=profile,
+                                            incremental=incremental, prune=prune, cache=cache):
+        if status == 'done':
+            print(f"  ✓ 处理完成: {os.path.basename(rel_path)}")
             processed_count += 1
-        else:
-            print(f"  ❌ 处理失败: {os.path.basename(pdf_path)}")
+        elif status == 'failed':
+            print(f"  ❌ 处理失败: {os.path.basename(rel_path)}")
+        elif status == 'skipped':
+            skipped_count += 1
+        elif status == 'removed':
+            print(f"  🗑 源文件已删除，移除输出: {rel_path}")
     
+    if incremental:
+        print(f"未变化跳过: {skipped_count} 个PDF文件")
     return processed_count
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="PDF空白裁剪工具")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="同时处理的文件数（默认为CPU核数）")
+    parser.add_argument('--profile', default='lossless',
+                        help="输出编码配置: lossless、jpeg:质量、target:每页大小（如 target:300k）")
+    parser.add_argument('--incremental', action='store_true',
+                        help="增量处理：跳过上次处理后没有变化的文件")
+    parser.add_argument('--prune', action='store_true',
+                        help="增量处理时删除源文件已不存在的输出")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="不使用结果缓存（默认按文件内容缓存裁剪结果）")
+    args = parser.parse_args()
+    try:
+        parse_profile(args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+    
     try:
         current_dir = os.getcwd()
         input_folder = os.path.join(current_dir, "要处理的文件夹")
@@ -195,6 +747,10 @@ def main():
         print(f"程序运行目录: {current_dir}")
         print(f"输入文件夹: 要处理的文件夹")
         print(f"输出文件夹: 处理好的文件夹")
+        print(f"并行文件数: {args.workers}")
+        print(f"输出配置: {args.profile}")
+        if args.incremental:
+            print("增量处理: 是" + ("（删除源文件已不存在的输出）" if args.prune else ""))
         
         # 检查输入文件夹是否存在
         if not os.path.exists(input_folder):
@@ -225,7 +781,10 @@ def main():
         
         # 处理文件夹
         print(f"\n开始处理PDF文件...")
-        processed_count = process_folder(input_folder, output_folder)
+        processed_count = process_folder(input_folder, output_folder, workers=args.workers,
+                                         profile=args.profile, incremental=args.incremental,
+                                         prune=args.incremental and args.prune,
+                                         cache=None if args.no_cache else ResultCache())
         
         print(f"\n=== 处理完成 ===")
         print(f"成功处理: {processed_count} 个PDF文件")
@@ -242,6 +801,9 @@ def main():
     input("\n按回车键退出...")
 
 if __name__ == "__main__":
+    # 打包后的exe使用多进程时需要
+    multiprocessing.freeze_support()
+    
     # 检查依赖
     try:
         import fitz  # PyMuPDF
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+逐页写出的图片和文字PDF
+每页写完立即落盘，内存中只保留各对象的偏移量，页数再多内存占用也基本不变
+"""
+
+import json
+import os
+import struct
+import zlib
+from array import array
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def png_image_stream(png_data):
+    """
+    从PNG数据中取出压缩后的像素流，直接作为PDF的FlateDecode图片使用，无需解码
+    返回 (图片字典, 流数据)
+    """
+    if not png_data.startswith(PNG_SIGNATURE):
+        raise ValueError("不是PNG数据")
+
+    pos = len(PNG_SIGNATURE)
+    header = None
+    idat = []
+    while pos < len(png_data):
+        length, chunk_type = struct.unpack('>I4s', png_data[pos:pos + 8])
+        chunk = png_data[pos + 8:pos + 8 + length]
+        if chunk_type == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif chunk_type == b'IDAT':
+            idat.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+        pos += 12 + length
+
+    width, height, bit_depth, color_type, _, _, interlace = header
+    colors = {0: 1, 2: 3}.get(color_type)
+    if colors is None or interlace:
+        raise ValueError(f"不支持的PNG格式: 颜色类型={color_type}, 隔行={interlace}")
+
+    info = {
+        'Width': width,
+        'Height': height,
+        'ColorSpace': '/DeviceRGB' if colors == 3 else '/DeviceGray',
+        'BitsPerComponent': bit_depth,
+        'Filter': '/FlateDecode',
+        'DecodeParms': f'<< /Predictor 15 /Colors {colors} /BitsPerComponent {bit_depth} /Columns {width} >>',
+    }
+    return info, b''.join(idat)
+
+
+class StreamingPdfWriter:
+    """
+    逐页写出图片PDF
+    第一页写入时才创建文件，没有写入任何页面时不生成文件
+    """
+
+    # 页面树对象固定为2号，所有页面写完后才能写出
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.file = None
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        """正常结束时写完文件；出错或被取消时调用 abort，不留下看起来完整的半个PDF"""
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def page_count(self):
+        return len(self.page_ids)
+
+    def _open(self):
+        self.file = open(self.output_path, 'wb')
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _allocate(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def _write_object(self, obj_id, body, stream=None):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(f'{obj_id} 0 obj\n'.encode('ascii'))
+        self.file.write(body.encode('ascii'))
+        if stream is not None:
+            self.file.write(b'\nstream\n')
+            self.file.write(stream)
+            self.file.write(b'\nendstream')
+        self.file.write(b'\nendobj\n')
+
+    def add_image_page(self, width, height, info, data, offset=(0, 0)):
+        """
+        添加一页，页面大小为 width x height，图片按1像素=1点放置
+        info 为图片字典（不含Length），data 为已编码的流数据
+        offset 为图片左下角相对页面的位置，图片超出页面的部分不显示
+        """
+        if self.file is None:
+            self._open()
+
+        image_id = self._allocate()
+        entries = ''.join(f' /{key} {value}' for key, value in info.items())
+        self._write_object(
+            image_id,
+            f'<< /Type /XObject /Subtype /Image{entries} /Length {len(data)} >>',
+            data
+        )
+
+        content = f'q {info["Width"]} 0 0 {info["Height"]} {offset[0]} {offset[1]} cm /Im0 Do Q'.encode('ascii')
+        content_id = self._allocate()
+        self._write_object(content_id, f'<< /Length {len(content)} >>', content)
+
+        page_id = self._allocate()
+        self._write_object(
+            page_id,
+            f'<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {width} {height}]'
+            f' /Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>'
+        )
+        self.page_ids.append(page_id)
+        self.file.flush()
+
+    def add_png_page(self, width, height, png_data):
+        """添加一页PNG图片，压缩数据原样写入"""
+        info, data = png_image_stream(png_data)
+        self.add_image_page(width, height, info, data)
+
+    def add_jpeg_page(self, jpeg_data, width, height, colors=3, box=None):
+        """
+        添加一页JPEG图片，DCT数据原样写入，不重新编码
+        box 为 (左, 上, 右, 下) 时页面只显示该区域，图片数据本身保持不变
+        """
+        info = {
+            'Width': width,
+            'Height': height,
+            'ColorSpace': '/DeviceRGB' if colors == 3 else '/DeviceGray',
+            'BitsPerComponent': 8,
+            'Filter': '/DCTDecode',
+        }
+        if box is None:
+            box = (0, 0, width - 1, height - 1)
+        left, top, right, bottom = box
+        self.add_image_page(right - left + 1, bottom - top + 1, info, jpeg_data,
+                            offset=(-left, bottom + 1 - height))
+
+    def add_flate_page(self, width, height, data, colors=3):
+        """添加一页已用zlib压缩的原始像素（每像素 colors 字节，无行过滤）"""
+        info = {
+            'Width': width,
+            'Height': height,
+            'ColorSpace': '/DeviceRGB' if colors == 3 else '/DeviceGray',
+            'BitsPerComponent': 8,
+            'Filter': '/FlateDecode',
+        }
+        self.add_image_page(width, height, info, data)
+
+    def add_page(self, page):
+        """添加由 (类型, 参数) 描述的页面，类型为 png、jpeg 或 flate"""
+        kind, args = page
+        if kind == 'jpeg':
+            self.add_jpeg_page(*args)
+        elif kind == 'flate':
+            self.add_flate_page(*args)
+        else:
+            self.add_png_page(*args)
+
+    def close(self):
+        """写出页面树和交叉引用表"""
+        if self.file is None:
+            return
+
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self._write_object(self.PAGES_ID, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+        self._write_object(self.CATALOG_ID, f'<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>')
+
+        xref_offset = self.file.tell()
+        self.file.write(f'xref\n0 {self.next_id}\n'.encode('ascii'))
+        self.file.write(b'0000000000 65535 f \n')
+        for obj_id in range(1, self.next_id):
+            self.file.write(f'{self.offsets[obj_id]:010d} 00000 n \n'.encode('ascii'))
+        self.file.write(
+            f'trailer\n<< /Size {self.next_id} /Root {self.CATALOG_ID} 0 R >>\n'
+            f'startxref\n{xref_offset}\n%%EOF\n'.encode('ascii')
+        )
+        self.file.close()
+        self.file = None
+
+    def abort(self):
+        """出错或被取消时删除写了一半的文件"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            try:
+                os.remove(self.output_path)
+            except OSError:
+                pass
+
+
+class ResumablePdfWriter(StreamingPdfWriter):
+    """
+    可断点续写的 StreamingPdfWriter
+    每写完一页就在进度文件中追加一行，记录该页各对象的偏移量和写完后的文件长度；
+    中断后用相同的 header 再次打开时，截掉最后一页写了一半的内容，从下一页继续写
+    header 用来识别是否为同一个任务（输入文件、处理设置等），不一致时从头开始
+    """
+
+    def __init__(self, output_path, journal_path, header):
+        super().__init__(output_path)
+        self.journal_path = journal_path
+        self.header = header
+        self.journal = None
+
+    def _read_journal(self):
+        """读取进度文件，最后一行可能只写了一半，遇到无法解析的行就停止"""
+        records = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+        except OSError:
+            pass
+        return records
+
+    def resume(self):
+        """
+        恢复上次的进度，返回已完成的页数
+        没有可用的进度时从头开始，返回0
+        """
+        records = self._read_journal()
+        pages = records[1:] if records and records[0].get('header') == self.header else []
+        if pages and os.path.exists(self.output_path):
+            # 进度记录在页面数据落盘之后写入，文件长度不会小于记录的长度
+            file_size = os.path.getsize(self.output_path)
+            while pages and pages[-1]['size'] > file_size:
+                pages.pop()
+        else:
+            pages = []
+
+        if not pages:
+            self.journal = open(self.journal_path, 'w', encoding='utf-8')
+            self._append_journal({'header': self.header})
+            return 0
+
+        for record in pages:
+            self.offsets.update((obj_id, offset) for obj_id, offset in record['objects'])
+            self.page_ids.append(record['page'])
+        self.next_id = max(self.offsets) + 1
+        self.file = open(self.output_path, 'r+b')
+        self.file.truncate(pages[-1]['size'])
+        self.file.seek(pages[-1]['size'])
+        # 重写进度文件，去掉截断的记录
+        self.journal = open(self.journal_path, 'w', encoding='utf-8')
+        self._append_journal({'header': self.header})
+        for record in pages:
+            self._append_journal(record)
+        return len(pages)
+
+    def _append_journal(self, record):
+        self.journal.write(json.dumps(record) + '\n')
+        self.journal.flush()
+
+    def add_image_page(self, width, height, info, data, offset=(0, 0)):
+        if self.journal is None:
+            self.resume()
+        first_id = self.next_id
+        super().add_image_page(width, height, info, data, offset)
+        self._append_journal({
+            'page': self.page_ids[-1],
+            'objects': [[obj_id, self.offsets[obj_id]] for obj_id in range(first_id, self.next_id)],
+            'size': self.file.tell(),
+        })
+
+    def close(self):
+        """写完整个文件后删除进度文件"""
+        super().close()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        try:
+            os.remove(self.journal_path)
+        except OSError:
+            pass
+
+    def abort(self):
+        """出错时只关闭文件，保留已写入的页面和进度，下次继续"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+
+def _pdf_number(value):
+    """PDF中的数字，整数不带小数点，小数最多保留4位"""
+    if value == int(value):
+        return str(int(value))
+    return f'{value:.4f}'.rstrip('0')
+
+
+def _pdf_name(name):
+    """PDF名称对象，非常规字符按 #xx 转义"""
+    if isinstance(name, str):
+        name = name.encode('utf-8')
+    return '/' + ''.join(chr(b) if 33 <= b <= 126 and chr(b) not in '()<>[]{}/%#' else f'#{b:02X}'
+                         for b in name)
+
+
+class _OffsetTable:
+    """按对象号保存偏移量的紧凑数组，代替 StreamingPdfWriter 中的字典，页数再多也只占每个对象8字节"""
+
+    def __init__(self):
+        self.values = array('q')
+
+    def __setitem__(self, obj_id, offset):
+        if obj_id >= len(self.values):
+            self.values.extend([0] * (obj_id + 1 - len(self.values)))
+        self.values[obj_id] = offset
+
+    def __getitem__(self, obj_id):
+        return self.values[obj_id]
+
+
+class StreamingTextPdfWriter(StreamingPdfWriter):
+    """
+    逐页写出文字PDF（标签），每页写完立即落盘
+    font 为 pdfmetrics 中注册的字体：TrueType 字体与 reportlab 相同，按每256个字符一组嵌入子集，
+    用到的字符在全部页面写完后统一嵌入；其他字体按PDF标准字体（WinAnsi编码）引用，
+    编码中没有的字符显示为"?"
+    """
+
+    def __init__(self, output_path, font, compress=True):
+        super().__init__(output_path)
+        self.font = font
+        self.compress = compress
+        self.offsets = _OffsetTable()
+        self.page_ids = array('q')
+        self.dynamic = bool(getattr(font, '_dynamicFont', False))
+        # 子集号（标准字体为0）-> 字体对象号，第一次用到时分配，close 时写出
+        self.font_ids = {}
+
+    def _text_runs(self, text):
+        """把一行文字拆成 [(子集号, 编码后的字节), ...]"""
+        if self.dynamic:
+            runs = self.font.splitString(text, self)
+        else:
+            runs = [(0, text.encode('cp1252', errors='replace'))]
+        for subset, _ in runs:
+            if subset not in self.font_ids:
+                self.font_ids[subset] = self._allocate()
+        return runs
+
+    def add_text_page(self, width, height, lines):
+        """添加一页，lines 为 [(x, y, 字号, 文字), ...]，坐标以页面左下角为原点"""
+        if self.file is None:
+            self._open()
+
+        used = set()
+        parts = []
+        for x, y, size, text in lines:
+            parts.append(f'BT 1 0 0 1 {_pdf_number(x)} {_pdf_number(y)} Tm')
+            for subset, data in self._text_runs(text):
+                used.add(subset)
+                parts.append(f'/F1+{subset} {_pdf_number(size)} Tf <{data.hex()}> Tj')
+            parts.append('ET')
+        content = '\n'.join(parts).encode('ascii')
+        if self.compress:
+            content = zlib.compress(content)
+            content_dict = f'<< /Length {len(content)} /Filter /FlateDecode >>'
+        else:
+            content_dict = f'<< /Length {len(content)} >>'
+        content_id = self._allocate()
+        self._write_object(content_id, content_dict, content)
+
+        fonts = ' '.join(f'/F1+{subset} {self.font_ids[subset]} 0 R' for subset in sorted(used))
+        page_id = self._allocate()
+        self._write_object(
+            page_id,
+            f'<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {_pdf_number(width)} {_pdf_number(height)}]'
+            f' /Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>'
+        )
+        self.page_ids.append(page_id)
+
+    def _write_stream(self, body, data):
+        """写出一个压缩流对象，返回对象号"""
+        obj_id = self._allocate()
+        data = zlib.compress(data)
+        self._write_object(obj_id, f'<< /Length {len(data)} /Filter /FlateDecode{body} >>', data)
+        return obj_id
+
+    def _write_fonts(self):
+        """写出各页用到的字体，TrueType 字体的子集在这里生成"""
+        if not self.dynamic:
+            for font_id in self.font_ids.values():
+                self._write_object(font_id, f'<< /Type /Font /Subtype /Type1 /BaseFont {_pdf_name(self.font.fontName)}'
+                                            f' /Encoding /WinAnsiEncoding >>')
+            return
+
+        from reportlab.pdfbase.ttfonts import SUBSETN, makeToUnicodeCMap, FF_SYMBOLIC, FF_NONSYMBOLIC
+        face = self.font.face
+        subsets = self.font.state[self].subsets
+        for subset, font_id in sorted(self.font_ids.items()):
+            codes = subsets[subset]
+            base_font = b''.join((SUBSETN(subset), b'+', face.name, face.subfontNameX))
+            font_data = face.makeSubset(codes)
+            font_file_id = self._write_stream(f' /Length1 {len(font_data)}', font_data)
+            descriptor_id = self._allocate()
+            bbox = ' '.join(_pdf_number(v) for v in face.bbox)
+            flags = (face.flags & ~FF_NONSYMBOLIC) | FF_SYMBOLIC
+            self._write_object(
+                descriptor_id,
+                f'<< /Type /FontDescriptor /Ascent {_pdf_number(face.ascent)} /CapHeight {_pdf_number(face.capHeight)}'
+                f' /Descent {_pdf_number(face.descent)} /Flags {flags} /FontBBox [{bbox}]'
+                f' /FontName {_pdf_name(base_font)} /ItalicAngle {_pdf_number(face.italicAngle)}'
+                f' /StemV {_pdf_number(face.stemV)} /FontFile2 {font_file_id} 0 R'
+                f' /MissingWidth {_pdf_number(face.defaultWidth)} >>'
+            )
+            cmap = makeToUnicodeCMap(base_font.decode('latin-1'), codes)
+            cmap_id = self._write_stream('', cmap.encode('latin-1'))
+            widths = ' '.join(_pdf_number(face.getCharWidth(code)) for code in codes)
+            self._write_object(
+                font_id,
+                f'<< /Type /Font /Subtype /TrueType /BaseFont {_pdf_name(base_font)} /FirstChar 0'
+                f' /LastChar {len(codes) - 1} /Widths [{widths}] /FontDescriptor {descriptor_id} 0 R'
+                f' /ToUnicode {cmap_id} 0 R >>'
+            )
+        del self.font.state[self]
+
+    def close(self):
+        """写出字体、页面树和交叉引用表"""
+        if self.file is not None:
+            self._write_fonts()
+        super().close()
+
+    def abort(self):
+        """出错或被取消时删除写了一半的文件"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            try:
+                os.remove(self.output_path)
+            except OSError:
+                pass
+        if self.dynamic:
+            self.font.state.pop(self, None)
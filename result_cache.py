@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+处理结果缓存
+以输入内容的哈希加上处理设置为键，把生成的PDF或检测到的边界保存在本地，
+同样的内容换了文件名或文件夹再次提交时直接取出结果，不再处理
+缓存总大小超过上限时按最近使用时间淘汰
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+# 默认缓存目录
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), '.cache'),
+    '多功能工具箱', 'cache'
+)
+# 默认缓存大小上限
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def text_digest(text):
+    """计算文本内容的SHA-256"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def content_key(tool, settings, *digests):
+    """由工具名、处理设置和输入内容哈希组成缓存键"""
+    payload = json.dumps([tool, settings, digests], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    本地结果缓存，可在多个线程中共用
+    每个实例各自统计命中和未命中次数，通常每个任务创建一个实例
+    """
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # 缓存目录当前总大小，第一次写入时才统计
+        self._total_bytes = None
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key[:2], key + suffix)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _touch(self, path):
+        """更新修改时间，作为最近使用时间"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def fetch_file(self, key, output_path):
+        """命中时把缓存的文件复制到 output_path 并返回True"""
+        path = self._path(key, '.pdf')
+        try:
+            shutil.copyfile(path, output_path)
+        except OSError:
+            self._count(False)
+            return False
+        self._touch(path)
+        self._count(True)
+        return True
+
+    def store_file(self, key, source_path):
+        """把生成好的文件存入缓存"""
+        path = self._path(key, '.pdf')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(source_path, temp_path)
+        self._add(path, temp_path)
+
+    def fetch_value(self, key):
+        """命中时返回缓存的值，否则返回None"""
+        path = self._path(key, '.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            self._count(False)
+            return None
+        self._touch(path)
+        self._count(True)
+        return value
+
+    def store_value(self, key, value):
+        """把可JSON序列化的值存入缓存"""
+        path = self._path(key, '.json')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f)
+        self._add(path, temp_path)
+
+    def _add(self, path, temp_path):
+        """写完临时文件后替换到位，并在超过上限时淘汰"""
+        size = os.path.getsize(temp_path)
+        with self._lock:
+            # 替换已有的条目时减去旧文件的大小
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            os.replace(temp_path, path)
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._total_bytes += size - old_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        """列出缓存中的 (最近使用时间, 大小, 路径)"""
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for file in files:
+                if file.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """按最近使用时间从旧到新删除，直到总大小不超过上限"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total_bytes = total
+
+    def summary(self):
+        return f"缓存: 命中 {self.hits} 次，未命中 {self.misses} 次"
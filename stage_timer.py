@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段计时
+记录各处理阶段（渲染、边界检测、编码、插入页面、保存等）每页、每个文件的耗时，
+任务结束时汇总为表格写入日志，也可以导出为Chrome跟踪格式（chrome://tracing、
+https://ui.perfetto.dev 可以打开）离线分析
+
+默认关闭，关闭时 stage() 返回共用的空上下文，几乎没有开销；
+记录保存在上下文变量中，同时执行的多个任务（各在自己的线程中）各自开关、各自记录，互不影响；
+任务交给线程池的函数用 bind() 包装后沿用任务的记录（线程池中的线程不继承上下文）；
+工作进程用 take() 取出本进程的记录随结果返回，主进程用 merge() 合并
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import partial
+
+# 每个文件的整体耗时使用的阶段名，汇总时单独列出
+FILE_STAGE = '文件'
+# 汇总时列出的最慢文件数
+SLOWEST_FILES = 5
+
+_NULL_STAGE = nullcontext()
+# 开启时为当前任务的记录列表，每条为 (阶段名, 开始纳秒, 耗时纳秒, 进程号, 线程号, 参数)
+_records = contextvars.ContextVar('stage_records', default=None)
+
+
+class _Stage:
+    __slots__ = ('records', 'name', 'args', 'start')
+
+    def __init__(self, records, name, args):
+        self.records = records
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.records.append((self.name, self.start, time.perf_counter_ns() - self.start,
+                             os.getpid(), threading.get_ident(), self.args))
+        return False
+
+
+def enable():
+    """当前任务开始记录，已在记录时保留已有记录"""
+    if _records.get() is None:
+        _records.set([])
+
+
+def disable():
+    """当前任务停止记录，返回当前任务的全部记录"""
+    records = _records.get()
+    _records.set(None)
+    return records or []
+
+
+def is_enabled():
+    return _records.get() is not None
+
+
+def bind(fn):
+    """包装交给线程池的函数，在其他线程中执行时记录到当前任务中；未开启时原样返回"""
+    if _records.get() is None:
+        return fn
+    return partial(contextvars.copy_context().run, fn)
+
+
+def init_worker(enabled):
+    """工作进程初始化（或共用进程池中每个任务开始时），与主进程保持相同的开关状态"""
+    if enabled:
+        enable()
+    else:
+        disable()
+
+
+def stage(name, **args):
+    """
+    记录一个阶段的上下文管理器，args 为附加信息（如 file、page），导出时写入跟踪事件
+    用法: with stage_timer.stage('渲染', page=3): ...
+    """
+    records = _records.get()
+    if records is None:
+        return _NULL_STAGE
+    return _Stage(records, name, args)
+
+
+def take():
+    """取出并清空本进程已有的记录，工作进程把它随结果一起返回"""
+    current = _records.get()
+    if current is None:
+        return []
+    records = current[:]
+    del current[:len(records)]
+    return records
+
+
+def merge(records):
+    """合并工作进程返回的记录"""
+    current = _records.get()
+    if current is not None and records:
+        current.extend(records)
+
+
+def summarize(records):
+    """
+    按阶段汇总，返回 (阶段列表, 文件列表)
+    阶段列表按总耗时从多到少排列，每项为 {stage, count, total, mean, max, share}（秒）；
+    文件列表为最慢的 SLOWEST_FILES 个文件 [(文件名, 秒数), ...]
+    """
+    totals = {}
+    files = []
+    for name, _, duration, _, _, args in records:
+        seconds = duration / 1e9
+        if name == FILE_STAGE:
+            files.append((args.get('file', ''), seconds))
+            continue
+        count, total, longest = totals.get(name, (0, 0.0, 0.0))
+        totals[name] = (count + 1, total + seconds, max(longest, seconds))
+
+    grand_total = sum(total for _, total, _ in totals.values()) or 1.0
+    stages = [
+        {'stage': name, 'count': count, 'total': total, 'mean': total / count, 'max': longest,
+         'share': total / grand_total}
+        for name, (count, total, longest) in totals.items()
+    ]
+    stages.sort(key=lambda item: item['total'], reverse=True)
+    files.sort(key=lambda item: item[1], reverse=True)
+    return stages, files[:SLOWEST_FILES]
+
+
+def _pad(text, width, left=False):
+    """按显示宽度补齐空格，中文字符占两格"""
+    text = str(text)
+    padding = ' ' * max(0, width - sum(2 if ord(c) > 0x2E80 else 1 for c in text))
+    return text + padding if left else padding + text
+
+
+def summary_lines(records):
+    """汇总表格，每行一个字符串，可直接逐行写入日志"""
+    stages, files = summarize(records)
+    if not stages:
+        return ["各阶段耗时: 没有记录"]
+    columns = [('阶段', 10), ('次数', 8), ('总计(秒)', 10), ('平均(ms)', 10), ('最长(ms)', 10), ('占比', 8)]
+    lines = ["各阶段耗时:", '  ' + ''.join(_pad(title, width, i == 0) for i, (title, width) in enumerate(columns))]
+    for item in stages:
+        values = [item['stage'], item['count'], f"{item['total']:.3f}", f"{item['mean'] * 1000:.1f}",
+                  f"{item['max'] * 1000:.1f}", f"{item['share']:.1%}"]
+        lines.append('  ' + ''.join(_pad(value, width, i == 0)
+                                    for i, (value, (_, width)) in enumerate(zip(values, columns))))
+    if len(files) > 1:
+        lines.append("最慢的文件:")
+        for file, seconds in files:
+            lines.append(f"  {seconds:8.2f} 秒  {file}")
+    return lines
+
+
+def write_chrome_trace(records, path):
+    """导出为Chrome跟踪格式（Trace Event Format）的JSON文件，时间单位为微秒"""
+    origin = min((record[1] for record in records), default=0)
+    events = []
+    for name, start, duration, pid, tid, args in records:
+        events.append({
+            'name': name,
+            'ph': 'X',
+            'ts': (start - origin) / 1000,
+            'dur': duration / 1000,
+            'pid': pid,
+            'tid': tid,
+            'args': args,
+        })
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""crop_engine：全图归约、金字塔检测与逐像素扫描的边界一致"""
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import crop_engine
+
+
+def _naive_box(pixels, white_threshold):
+    """逐像素判断，作为对照"""
+    ys, xs = np.nonzero((pixels < white_threshold).any(axis=2))
+    if ys.size == 0:
+        return None
+    return int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())
+
+
+def _page(height, width, dots):
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    for y, x, value in dots:
+        pixels[y, x] = value
+    return pixels
+
+
+CASES = [
+    # 单个像素，抽样会漏掉，只能靠细化找到
+    (_page(3001, 2003, [(1500, 1001, (0, 0, 0))]), 250),
+    # 贴着四条边的孤立像素
+    (_page(1500, 2500, [(0, 1200, (0, 0, 0)), (1499, 7, (0, 0, 0)), (700, 0, (0, 0, 0)), (3, 2499, (0, 0, 0))]), 250),
+    # 只有一个通道刚好低于阈值
+    (_page(2048, 2048, [(17, 1999, (255, 249, 255)), (2030, 40, (255, 255, 249))]), 250),
+    # 浅色像素高于阈值，不算内容
+    (_page(1024, 1024, [(500, 500, (250, 250, 250))]), 250),
+]
+
+
+@pytest.mark.parametrize('pixels, white_threshold', CASES)
+def test_methods_match_naive_scan(pixels, white_threshold):
+    expected = _naive_box(pixels, white_threshold)
+    for method in crop_engine.DETECT_METHODS:
+        assert crop_engine.find_content_box(pixels, white_threshold, method) == expected
+
+
+def test_methods_match_naive_scan_on_random_content():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        height, width = rng.integers(300, 1500, size=2)
+        pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+        for _ in range(rng.integers(1, 6)):
+            y, x = rng.integers(0, height), rng.integers(0, width)
+            h, w = rng.integers(1, 40, size=2)
+            pixels[y:y + h, x:x + w] = rng.integers(0, 250)
+        expected = _naive_box(pixels, 250)
+        for method in crop_engine.DETECT_METHODS:
+            assert crop_engine.find_content_box(pixels, 250, method) == expected
+
+
+@pytest.mark.parametrize('suffix', ['.png', '.tif'])
+def test_large_image_path_matches_crop_image(tmp_path, suffix):
+    pixels = _page(900, 700, [(100, 50, (0, 0, 0)), (299, 399, (10, 10, 10))])
+    path = str(tmp_path / ('page' + suffix))
+    Image.fromarray(pixels).save(path)
+
+    cropped, box, _ = crop_engine.crop_large_image(path)
+    expected, expected_box = crop_engine.crop_image(Image.fromarray(pixels))
+    assert box == expected_box == (50, 100, 399, 299)
+    assert np.array_equal(np.asarray(cropped), np.asarray(expected))
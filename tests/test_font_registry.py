@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""font_registry：同一字体文件以不同字体名加载"""
+
+import os
+
+import reportlab
+from reportlab.pdfbase import pdfmetrics
+
+import font_registry
+
+FONT_PATH = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+
+
+def test_same_file_under_two_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(font_registry, 'FONT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(font_registry, '_fonts', {})
+    first = font_registry.load_font('RegistryTestFirst', FONT_PATH)
+    assert first.fontName == 'RegistryTestFirst'
+
+    # 模拟新的进程：本进程中已注册的字体清空，缓存文件保留
+    for name in ('RegistryTestSecond', 'RegistryTestFirst'):
+        monkeypatch.setattr(font_registry, '_fonts', {})
+        font = font_registry.load_font(name, FONT_PATH)
+        assert font.fontName == name
+        # reportlab 把同一字体文件的第二个名字指向先注册的字体，这里只要求能按名字取到
+        assert pdfmetrics.getFont(name).face.name == font.face.name
+        assert font.stringWidth('Hello', 12) == first.stringWidth('Hello', 12)
+    assert len(os.listdir(tmp_path)) == 2
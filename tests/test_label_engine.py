@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""label_engine：逐页写出与一次生成的标签PDF内容一致"""
+
+import io
+import os
+
+import fitz
+import reportlab
+
+import font_registry
+import label_engine
+
+FONT_PATH = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+
+CONTENT = 'Order 1024\nWidget A\n\n\n\nShort\n\nA much longer line that needs a smaller font size\nx\ny\nz\n\n'
+
+
+def _pages(path):
+    with fitz.open(path) as doc:
+        return [(page.rect, [word[4] for word in page.get_text('words')],
+                 sorted({span['size'] for block in page.get_text('dict')['blocks']
+                         for line in block['lines'] for span in line['spans']}))
+                for page in doc]
+
+
+def test_streaming_matches_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(label_engine, 'FONT_PATHS', [FONT_PATH])
+    monkeypatch.setattr(font_registry, 'FONT_CACHE_DIR', str(tmp_path / 'fonts'))
+    groups = label_engine.parse_label_groups(CONTENT)
+    label_file = str(tmp_path / 'labels.txt')
+    with open(label_file, 'w', encoding='utf-8') as f:
+        f.write(CONTENT)
+
+    in_memory = str(tmp_path / 'in_memory.pdf')
+    streaming = str(tmp_path / 'streaming.pdf')
+    label_engine.create_label_pdf(groups, in_memory)
+    assert label_engine.create_label_pdf_streaming(label_engine.iter_label_file(label_file), streaming) == 3
+
+    expected = _pages(in_memory)
+    assert [words for _, words, _ in expected][0] == ['Order', '1024', 'Widget', 'A']
+    assert _pages(streaming) == expected
+
+
+def test_iter_label_groups_across_chunks():
+    # 空行分隔符落在两块之间时也要正确分组
+    for chunk_size in (1, 2, 3, 7, 1024):
+        segments = label_engine.iter_text_segments(io.StringIO(CONTENT), chunk_size)
+        assert [s.strip() for s in segments if s.strip()] == label_engine.parse_label_groups(CONTENT)
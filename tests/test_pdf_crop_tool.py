@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""pdf_crop_tool：clip模式与栅格模式结果一致，矢量模式的内容区域，逐页写出的断点续写"""
+
+import os
+
+import fitz
+import pytest
+
+import pdf_crop_tool
+
+
+def _make_pdf(path, fill):
+    doc = fitz.open()
+    page = doc.new_page(width=595, height=842)
+    page.draw_rect(fitz.Rect(100, 200, 300, 400), color=None, fill=fill)
+    doc.save(path)
+    doc.close()
+
+
+def _crop(tmp_path, source, mode):
+    output = str(tmp_path / f'{mode}.pdf')
+    assert pdf_crop_tool.crop_pdf_pages(source, output, mode, log=lambda message: None)
+    with fitz.open(output) as doc:
+        page = doc[0]
+        return page.rect, page.get_pixmap().samples
+
+
+def _assert_clip_matches_raster(tmp_path, fill):
+    source = str(tmp_path / 'input.pdf')
+    _make_pdf(source, fill)
+    assert _crop(tmp_path, source, 'clip') == _crop(tmp_path, source, 'raster')
+
+
+def test_clip_matches_raster_on_faint_only_page(tmp_path):
+    # 浅于白色阈值（240）的内容：探测能看到，精确检测不算内容，两种模式都应保留整页
+    _assert_clip_matches_raster(tmp_path, (0.97, 0.97, 0.97))
+
+
+def test_clip_matches_raster(tmp_path):
+    _assert_clip_matches_raster(tmp_path, (0, 0, 0))
+
+
+def test_vector_keeps_pages_with_only_a_hairline_or_point(tmp_path):
+    source = str(tmp_path / 'input.pdf')
+    doc = fitz.open()
+    doc.new_page(width=595, height=842).draw_line((100, 300), (400, 300), width=0)
+    doc.new_page(width=595, height=842).draw_rect((200, 500, 200.5, 500.5), color=None, fill=(0, 0, 0))
+    doc.save(source)
+    doc.close()
+    output = str(tmp_path / 'vector.pdf')
+    assert pdf_crop_tool.crop_pdf_pages(source, output, 'vector', log=lambda message: None)
+    with fitz.open(output) as result:
+        assert [page.rect for page in result] == [fitz.Rect(0, 0, 595, 842)] * 2
+
+
+def test_vector_crops_to_content(tmp_path):
+    source = str(tmp_path / 'input.pdf')
+    _make_pdf(source, (0, 0, 0))
+    output = str(tmp_path / 'vector.pdf')
+    assert pdf_crop_tool.crop_pdf_pages(source, output, 'vector', log=lambda message: None)
+    with fitz.open(output) as result:
+        assert result[0].rect == fitz.Rect(0, 0, 200, 200)
+
+
+def test_streaming_resumes_after_interruption(tmp_path):
+    source = str(tmp_path / 'input.pdf')
+    doc = fitz.open()
+    for i in range(4):
+        doc.new_page(width=200, height=200).draw_rect(fitz.Rect(20, 20, 60 + 20 * i, 60), color=None, fill=(0, 0, 0))
+    doc.save(source)
+    doc.close()
+    output = str(tmp_path / 'output.pdf')
+
+    def stop_after_second_page(done, total):
+        if done == 2:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        pdf_crop_tool.crop_pdf_pages(source, output, streaming=True, log=lambda message: None,
+                                     progress=stop_after_second_page)
+    assert not os.path.exists(output)
+
+    messages = []
+    assert pdf_crop_tool.crop_pdf_pages(source, output, streaming=True, log=messages.append)
+    assert any('从第 3 页继续' in message for message in messages)
+    assert not os.path.exists(output + pdf_crop_tool.PARTIAL_SUFFIX)
+    assert not os.path.exists(output + pdf_crop_tool.PROGRESS_SUFFIX)
+
+    expected = str(tmp_path / 'expected.pdf')
+    assert pdf_crop_tool.crop_pdf_pages(source, expected, streaming=True, log=lambda message: None)
+    with fitz.open(output) as resumed, fitz.open(expected) as fresh:
+        assert [page.rect for page in resumed] == [page.rect for page in fresh]
+        assert [page.get_pixmap().samples for page in resumed] == [page.get_pixmap().samples for page in fresh]
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""pdf_writer：ResumablePdfWriter 中断后从进度文件继续"""
+
+import os
+import zlib
+
+import fitz
+
+from pdf_writer import ResumablePdfWriter
+
+HEADER = {'input_size': 1, 'settings': 'test'}
+
+
+def _add_gray_page(writer, value):
+    writer.add_flate_page(2, 2, zlib.compress(bytes([value]) * 4), colors=1)
+
+
+def _page_values(path):
+    with fitz.open(path) as doc:
+        # 交叉引用表正确，不需要修复就能打开
+        assert not doc.is_repaired
+        return [doc[i].get_pixmap().samples[0] for i in range(len(doc))]
+
+
+def test_resume_after_interruption(tmp_path):
+    output = str(tmp_path / 'out.pdf.part')
+    journal = str(tmp_path / 'out.pdf.progress')
+
+    writer = ResumablePdfWriter(output, journal, HEADER)
+    assert writer.resume() == 0
+    _add_gray_page(writer, 10)
+    _add_gray_page(writer, 20)
+    writer.abort()
+    # 模拟第三页写到一半时中断：文件末尾有残缺的对象，进度文件最后一行不完整
+    with open(output, 'ab') as f:
+        f.write(b'9 0 obj\n<< /Type /XObj')
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write('{"page": 9, "obj')
+
+    writer = ResumablePdfWriter(output, journal, HEADER)
+    assert writer.resume() == 2
+    _add_gray_page(writer, 30)
+    writer.close()
+
+    assert _page_values(output) == [10, 20, 30]
+    assert not os.path.exists(journal)
+
+
+def test_restart_when_header_changes(tmp_path):
+    output = str(tmp_path / 'out.pdf.part')
+    journal = str(tmp_path / 'out.pdf.progress')
+
+    writer = ResumablePdfWriter(output, journal, HEADER)
+    _add_gray_page(writer, 10)
+    writer.abort()
+
+    writer = ResumablePdfWriter(output, journal, dict(HEADER, settings='other'))
+    assert writer.resume() == 0
+    _add_gray_page(writer, 40)
+    writer.close()
+
+    assert _page_values(output) == [40]
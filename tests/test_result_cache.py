@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""result_cache：超过上限时按最近使用时间淘汰，覆盖同一条目不重复计算大小"""
+
+import os
+
+from result_cache import ResultCache
+
+
+def _cache_files(directory):
+    return sorted(file for _, _, files in os.walk(directory) for file in files)
+
+
+def _set_used(cache, key, suffix, timestamp):
+    path = cache._path(key, suffix)
+    os.utime(path, (timestamp, timestamp))
+
+
+def test_evicts_least_recently_used(tmp_path):
+    source = str(tmp_path / 'source.pdf')
+    with open(source, 'wb') as f:
+        f.write(b'x' * 100)
+    cache_dir = str(tmp_path / 'cache')
+    cache = ResultCache(cache_dir, max_bytes=250)
+
+    cache.store_file('aa01', source)
+    cache.store_file('bb02', source)
+    _set_used(cache, 'aa01', '.pdf', 1000)
+    _set_used(cache, 'bb02', '.pdf', 2000)
+    # 取出较早的条目后它成为最近使用的，写入第三个条目时淘汰另一个
+    assert cache.fetch_file('aa01', str(tmp_path / 'copy.pdf'))
+    cache.store_file('cc03', source)
+
+    assert _cache_files(cache_dir) == ['aa01.pdf', 'cc03.pdf']
+    assert cache._total_bytes == 200
+    assert not cache.fetch_file('bb02', str(tmp_path / 'copy.pdf'))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_overwrite_counts_size_once(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=10_000)
+    for i in range(5):
+        cache.store_value('aa01', {'box': [0, 0, i, i]})
+    cache.store_value('bb02', {'box': None})
+
+    actual = sum(os.path.getsize(os.path.join(root, file))
+                 for root, _, files in os.walk(str(tmp_path)) for file in files)
+    assert cache._total_bytes == actual
+    assert cache.fetch_value('aa01') == {'box': [0, 0, 4, 4]}
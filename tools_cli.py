@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多功能工具箱 - 命令行批处理
+三个工具共用一个入口，不弹窗、不等待按键，适合在脚本和构建服务器上运行
+进度以JSON行输出到标准输出，每处理完一个文件输出一行，包含该文件的用时
+
+用法:
+  python tools_cli.py labels 1.txt -o output.pdf
+  python tools_cli.py crop-pdf 要处理的文件夹 -o 处理好的文件夹 --workers 8
+  python tools_cli.py images 图片文件夹 -o 输出文件夹
+  python tools_cli.py images a.jpg b.png --merge -o 合并.pdf
+  python tools_cli.py watch 收件文件夹 -o 处理好的文件夹
+  python tools_cli.py serve --port 8765
+
+退出码: 0 全部成功，1 有文件处理失败，2 参数错误，3 找不到输入
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import label_engine
+import pdf_crop_tool
+import crop_images_to_pdf
+import folder_watcher
+import job_server
+import stage_timer
+from crop_engine import allow_large_images
+from output_profiles import parse_profile
+from result_cache import ResultCache
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_INPUT = 3
+
+
+class ProgressWriter:
+    """
+    以JSON行输出进度事件
+    每行是一个对象，event 字段为事件类型: start、file、log、error、end
+    verbose 为False时不输出各工具的详细日志（log事件）
+    """
+
+    def __init__(self, stream=None, verbose=False):
+        self.stream = stream or sys.stdout
+        self.verbose = verbose
+        self.start_time = time.perf_counter()
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'elapsed': round(time.perf_counter() - self.start_time, 3)}
+        record.update(fields)
+        self.stream.write(json.dumps(record) + '\n')
+        self.stream.flush()
+
+    def log(self, message):
+        if self.verbose:
+            self.emit('log', message=message)
+
+    def file(self, path, status, seconds, **fields):
+        self.emit('file', path=path, status=status, seconds=round(seconds, 3), **fields)
+
+    def end(self, counts, cache=None):
+        """输出汇总并返回退出码"""
+        fields = dict(counts)
+        if cache is not None:
+            fields.update(cache_hits=cache.hits, cache_misses=cache.misses)
+        self.emit('end', **fields)
+        return EXIT_FAILED if counts.get('failed') else EXIT_OK
+
+
+def run_labels(args, progress, cache):
+    """根据文本文件生成标签PDF"""
+    if not os.path.isfile(args.input):
+        progress.emit('error', message=f"找不到输入文件: {args.input}")
+        return EXIT_NO_INPUT
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        groups = label_engine.parse_label_groups(f.read())
+    if not groups:
+        progress.emit('error', message=f"输入文件中没有标签数据: {args.input}")
+        return EXIT_NO_INPUT
+
+    output = args.output or os.path.splitext(args.input)[0] + '.pdf'
+    progress.emit('start', tool='labels', files=1, groups=len(groups))
+
+    start_time = time.perf_counter()
+    try:
+        label_engine.create_label_pdf(groups, output, log=progress.log, cache=cache)
+        progress.file(args.input, 'done', time.perf_counter() - start_time, output=output)
+        counts = {'processed': 1, 'failed': 0}
+    except Exception as e:
+        progress.file(args.input, 'failed', time.perf_counter() - start_time, error=str(e))
+        counts = {'processed': 0, 'failed': 1}
+    return progress.end(counts, cache)
+
+
+def run_crop_pdf(args, progress, cache):
+    """裁剪单个PDF或整个文件夹中的PDF"""
+    if os.path.isfile(args.input):
+        input_folder = os.path.dirname(os.path.abspath(args.input))
+        pdf_files = [os.path.abspath(args.input)]
+        output_folder = os.path.dirname(os.path.abspath(args.output)) or '.'
+        # 单个文件时输出路径就是文件名
+        target_name = os.path.basename(args.output)
+    elif os.path.isdir(args.input):
+        input_folder = args.input
+        pdf_files = pdf_crop_tool.find_pdf_files(input_folder)
+        output_folder = args.output
+        target_name = None
+    else:
+        progress.emit('error', message=f"找不到输入: {args.input}")
+        return EXIT_NO_INPUT
+
+    os.makedirs(output_folder, exist_ok=True)
+    progress.emit('start', tool='crop-pdf', files=len(pdf_files), mode=args.mode, profile=args.profile,
+                  workers=args.workers)
+
+    if target_name is not None:
+        start_time = time.perf_counter()
+        try:
+            success = pdf_crop_tool.crop_pdf_pages(
+                pdf_files[0], os.path.join(output_folder, target_name), args.mode, log=progress.log,
+                workers=args.page_workers, profile=args.profile, cache=cache
+            )
+        except BrokenProcessPool:
+            progress.log("    ❌ 处理PDF失败: 工作进程意外退出")
+            success = False
+        progress.file(args.input, 'done' if success else 'failed', time.perf_counter() - start_time)
+        return progress.end({'processed': int(success), 'failed': int(not success)}, cache)
+
+    counts = {'processed': 0, 'failed': 0, 'skipped': 0, 'removed': 0}
+    results = pdf_crop_tool.sync_pdf_folder(
+        input_folder, output_folder, pdf_files, args.mode, args.workers, args.page_workers,
+        log=progress.log, profile=args.profile, incremental=args.incremental,
+        prune=args.incremental and args.prune, cache=cache
+    )
+    for rel_path, status, seconds in results:
+        counts['processed' if status == 'done' else status] += 1
+        progress.file(rel_path, status, seconds)
+    return progress.end(counts, cache)
+
+
+def _image_file_job(img_path, output_pdf, profile, cache):
+    """在线程中把一张图片转换为PDF，返回 (错误信息, 秒数)"""
+    start_time = time.perf_counter()
+    try:
+        crop_images_to_pdf.image_file_to_pdf(img_path, output_pdf, profile=profile, cache=cache)
+        return None, time.perf_counter() - start_time
+    except Exception as e:
+        return str(e), time.perf_counter() - start_time
+
+
+def run_images(args, progress, cache):
+    """图片裁剪转PDF，分别转换或合并为一个PDF"""
+    allow_large_images()
+    img_paths = []
+    for path in args.inputs:
+        if os.path.isdir(path):
+            img_paths.extend(crop_images_to_pdf.find_images_in_folder(path))
+        elif os.path.isfile(path):
+            img_paths.append(path)
+        else:
+            progress.emit('error', message=f"找不到输入: {path}")
+            return EXIT_NO_INPUT
+    if not img_paths:
+        progress.emit('error', message="没有找到图片文件")
+        return EXIT_NO_INPUT
+
+    progress.emit('start', tool='images', files=len(img_paths), merge=args.merge, profile=args.profile,
+                  workers=args.workers)
+
+    if args.merge:
+        output_dir = os.path.dirname(os.path.abspath(args.output))
+        os.makedirs(output_dir, exist_ok=True)
+        start_time = time.perf_counter()
+        page_count = crop_images_to_pdf.images_to_single_pdf(
+            img_paths, args.output, workers=args.workers, log=progress.log,
+            profile=args.profile, cache=cache
+        )
+        failed = len(img_paths) - page_count
+        progress.file(args.output, 'failed' if failed else 'done', time.perf_counter() - start_time,
+                      pages=page_count)
+        return progress.end({'processed': page_count, 'failed': failed}, cache)
+
+    os.makedirs(args.output, exist_ok=True)
+    counts = {'processed': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = []
+        for img_path in img_paths:
+            base_name = os.path.splitext(os.path.basename(img_path))[0]
+            output_pdf = os.path.join(args.output, f"{base_name}.pdf")
+            futures.append(executor.submit(stage_timer.bind(_image_file_job), img_path, output_pdf,
+                                          args.profile, cache))
+        # 按输入顺序输出
+        for img_path, future in zip(img_paths, futures):
+            error, seconds = future.result()
+            if error is None:
+                counts['processed'] += 1
+                progress.file(img_path, 'done', seconds)
+            else:
+                counts['failed'] += 1
+                progress.file(img_path, 'failed', seconds, error=error)
+    return progress.end(counts, cache)
+
+
+def run_watch(args, progress, cache):
+    """监视文件夹，新文件写完后立即处理，按 Ctrl+C 停止"""
+    if not os.path.isdir(args.input):
+        progress.emit('error', message=f"找不到输入文件夹: {args.input}")
+        return EXIT_NO_INPUT
+
+    counts = {'processed': 0, 'failed': 0}
+
+    def on_result(rel_path, status, seconds, latency):
+        counts['processed' if status == 'done' else status] += 1
+        progress.file(rel_path, status, seconds, latency=round(latency, 3))
+
+    # 工作进程各自创建缓存，这里只决定是否启用
+    watcher = folder_watcher.FolderWatcher(args.input, args.output, mode=args.mode, profile=args.profile,
+                                           workers=args.workers, log=progress.log, on_result=on_result,
+                                           use_cache=cache is not None, poll_interval=args.poll_interval)
+    progress.emit('start', tool='watch', mode=args.mode, profile=args.profile, workers=watcher.workers)
+    watcher.run()
+    return progress.end(counts)
+
+
+def run_serve(args, progress, cache):
+    """启动本机HTTP任务服务，按 Ctrl+C 停止"""
+    server = job_server.create_server(args.host, args.port, args.workers, use_cache=cache is not None,
+                                      log=progress.log)
+    progress.emit('start', tool='serve', url=job_server.server_url(server), workers=server.service.workers)
+    job_server.serve(server, log=progress.log)
+    return progress.end(server.service.status())
+
+
+def build_parser():
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="多功能工具箱命令行批处理，进度以JSON行输出")
+    parser.add_argument('--verbose', action='store_true', help="同时输出各工具的详细日志")
+    parser.add_argument('--no-cache', action='store_true', help="不使用结果缓存")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="记录各阶段耗时，结束时输出 timing 事件并导出Chrome跟踪格式的文件")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    labels = subparsers.add_parser('labels', help="根据文本文件生成标签PDF（空行分组）")
+    labels.add_argument('input', help="标签文本文件（UTF-8）")
+    labels.add_argument('-o', '--output', help="输出PDF，默认与输入同名")
+
+    crop_pdf = subparsers.add_parser('crop-pdf', help="裁剪PDF空白边缘")
+    crop_pdf.add_argument('input', help="PDF文件或文件夹（递归处理子文件夹）")
+    crop_pdf.add_argument('-o', '--output', required=True, help="输出文件夹（输入为单个文件时为输出文件）")
+    crop_pdf.add_argument('--mode', choices=pdf_crop_tool.PDF_CROP_MODES, default='raster', help="裁剪模式")
+    crop_pdf.add_argument('--workers', type=int, default=cpu_count, help="同时处理的文件数")
+    crop_pdf.add_argument('--page-workers', type=int, default=1, help="每个PDF内按页并行的进程数")
+    crop_pdf.add_argument('--profile', default='lossless', help="输出编码配置")
+    crop_pdf.add_argument('--incremental', action='store_true', help="跳过上次处理后没有变化的文件")
+    crop_pdf.add_argument('--prune', action='store_true', help="增量处理时删除源文件已不存在的输出")
+
+    images = subparsers.add_parser('images', help="图片裁剪转PDF")
+    images.add_argument('inputs', nargs='+', help="图片文件或文件夹")
+    images.add_argument('-o', '--output', required=True, help="输出文件夹（合并时为输出PDF）")
+    images.add_argument('--merge', action='store_true', help="合并为一个PDF")
+    images.add_argument('--workers', type=int, default=cpu_count, help="同时处理的图片数")
+    images.add_argument('--profile', default='lossless', help="输出编码配置")
+
+    watch = subparsers.add_parser('watch', help="监视文件夹，新的PDF和图片到达后自动处理")
+    watch.add_argument('input', help="监视的文件夹（包括子文件夹）")
+    watch.add_argument('-o', '--output', required=True, help="输出文件夹")
+    watch.add_argument('--mode', choices=pdf_crop_tool.PDF_CROP_MODES, default='raster', help="PDF裁剪模式")
+    watch.add_argument('--workers', type=int, default=cpu_count, help="常驻工作进程数")
+    watch.add_argument('--profile', default='lossless', help="输出编码配置")
+    watch.add_argument('--poll-interval', type=float, default=folder_watcher.POLL_INTERVAL,
+                       help="扫描间隔（秒）")
+
+    serve = subparsers.add_parser('serve', help="启动本机HTTP任务服务，供其他程序提交任务")
+    serve.add_argument('--host', default=job_server.DEFAULT_HOST, choices=job_server.LOCAL_HOSTS,
+                       help="监听地址（仅限本机）")
+    serve.add_argument('--port', type=int, default=job_server.DEFAULT_PORT, help="端口，0为自动选择")
+    serve.add_argument('--workers', type=int, default=cpu_count, help="常驻工作进程数")
+    return parser
+
+
+def main(argv=None):
+    """主函数，返回退出码"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'profile', None) is not None:
+        try:
+            parse_profile(args.profile)
+        except ValueError as e:
+            parser.error(str(e))
+    if getattr(args, 'workers', 1) < 1 or getattr(args, 'page_workers', 1) < 1:
+        parser.error("并行数必须大于0")
+
+    progress = ProgressWriter(sys.stdout, verbose=args.verbose)
+    cache = None if args.no_cache else ResultCache()
+    handlers = {'labels': run_labels, 'crop-pdf': run_crop_pdf, 'images': run_images, 'watch': run_watch,
+                'serve': run_serve}
+    if args.trace:
+        stage_timer.enable()
+    # 标准输出只留给JSON进度，各工具和第三方库直接print的内容转到标准错误
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return handlers[args.command](args, progress, cache)
+        except Exception as e:
+            progress.emit('error', message=str(e))
+            return EXIT_FAILED
+        finally:
+            if args.trace:
+                write_trace(progress, args.trace)
+
+
+def write_trace(progress, path):
+    """输出各阶段耗时汇总（timing事件）并导出跟踪文件"""
+    records = stage_timer.disable()
+    stages, files = stage_timer.summarize(records)
+    progress.emit('timing', trace=path,
+                  stages=[{key: round(value, 6) if isinstance(value, float) else value
+                           for key, value in item.items()} for item in stages],
+                  slowest_files=[{'file': file, 'seconds': round(seconds, 3)} for file, seconds in files])
+    stage_timer.write_chrome_trace(records, path)
+
+
+if __name__ == "__main__":
+    # 打包后的exe使用多进程时需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -7,24 +7,80 @@
 
 import os
 import sys
-import threading
-import tempfile
-from io import BytesIO
+import time
+import multiprocessing
 import tkinter as tk
+from collections import deque
+from contextlib import closing
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 
 # 导入所需库
 try:
-    from PIL import Image
-    import fitz  # PyMuPDF
-    from reportlab.pdfgen import canvas
-    from reportlab.pdfbase import pdfmetrics
-    from reportlab.pdfbase.ttfonts import TTFont
+    import label_engine
+    import pdf_crop_tool
+    import crop_images_to_pdf
+    from crop_engine import allow_large_images
+    from output_profiles import PRESET_PROFILES
+    from result_cache import ResultCache
+    import stage_timer
+    from job_scheduler import JobScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
 except ImportError as e:
     print(f"缺少依赖库: {e}")
-    print("请安装: pip install Pillow PyMuPDF reportlab")
+    print("请安装: pip install Pillow PyMuPDF reportlab numpy")
     sys.exit(1)
 
+# 分阶段计时的跟踪文件名（输出为文件夹时）
+TRACE_FILE_NAME = 'stage_trace.json'
+# 日志和进度条的刷新间隔（毫秒）
+UI_REFRESH_MS = 100
+# 日志框最多保留的行数，超出时删除最早的行
+LOG_MAX_LINES = 2000
+# 各页提交的任务名，取消按钮按任务名取消本页的任务
+LABEL_JOB = '标签生成'
+IMAGE_JOB = '图片转PDF'
+PDF_JOB = 'PDF裁剪'
+
+
+class JobProgress:
+    """
+    任务进度，后台线程只更新计数，界面定时器读取后刷新进度条和说明文字
+    total 为0时进度条显示为空，说明文字只显示计数
+    """
+
+    def __init__(self, bar, label):
+        self.bar = bar
+        self.label = label
+        self.start(0, '')
+
+    def start(self, total, unit):
+        self.done = 0
+        self.total = total
+        self.unit = unit
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def update(self, done, total=None):
+        """可直接作为各工具的 progress(已完成数, 总数) 回调"""
+        if total is not None:
+            self.total = total
+        self.done = done
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    def refresh(self):
+        """在界面线程中调用"""
+        if not self.unit:
+            return
+        total = max(self.total, self.done)
+        self.bar.configure(maximum=max(total, 1), value=self.done)
+        elapsed = (self.end_time or time.perf_counter()) - self.start_time
+        text = f"{self.done}/{total} {self.unit}" if total else f"{self.done} {self.unit}"
+        if elapsed > 0 and self.done:
+            text += f" · {self.done / elapsed:.1f} {self.unit}/秒"
+        text += f" · 用时 {elapsed:.1f} 秒"
+        self.label.configure(text=text)
+
 
 class ToolsApp:
     def __init__(self, root):
@@ -37,9 +93,25 @@ class ToolsApp:
         # 设置样式
         self.setup_styles()
         
+        self.progress_bars = []
+        # 各页的开始按钮，本页的任务排队或执行时禁用，同一页不会同时有两个任务共用日志框和进度条
+        self.run_buttons = {}
+        self.active_tabs = set()
+        
         # 创建主框架
         self.create_ui()
         
+        # 后台线程写入的日志，由定时器成批写入日志框
+        self.log_queues = {widget: deque() for widget in (self.label_log, self.img_log, self.pdf_log)}
+        self.root.after(UI_REFRESH_MS, self.refresh_ui)
+        
+        # 各页的任务按优先级排队，共用常驻的工作进程
+        self.scheduler = JobScheduler()
+        self.scheduler.warm_up()
+        # 标签字体较大，在后台提前加载
+        label_engine.preload_label_font()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
     def setup_styles(self):
         """设置界面样式"""
         style = ttk.Style()
@@ -125,6 +197,18 @@ class ToolsApp:
         self.label_text.pack(fill=tk.BOTH, expand=True, padx=2, pady=2)
         self.label_text.insert(tk.END, "标签1第一行\n标签1第二行\n\n标签2第一行\n标签2第二行")
         
+        # 大文件直接从文件逐组生成，不读入输入框
+        file_frame = ttk.LabelFrame(frame, text="📄 或从标签文件生成（逐组读取、逐页写出，适合几十万组标签）", padding=10)
+        file_frame.pack(fill=tk.X, pady=5)
+        
+        self.label_file_var = tk.StringVar()
+        ttk.Entry(file_frame, textvariable=self.label_file_var, 
+                 font=('微软雅黑', 10)).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(file_frame, text="浏览...", 
+                  command=self.browse_label_file).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(file_frame, text="清除", 
+                  command=lambda: self.label_file_var.set('')).pack(side=tk.LEFT, padx=(5, 0))
+        
         # 输出文件选择
         output_frame = ttk.LabelFrame(frame, text="📁 输出文件", padding=10)
         output_frame.pack(fill=tk.X, pady=5)
@@ -135,16 +219,19 @@ class ToolsApp:
         ttk.Button(output_frame, text="浏览...", 
                   command=self.browse_label_output).pack(side=tk.LEFT, padx=(10, 0))
         
+        self.label_timing_var = self.create_timing_option(frame)
+        
         # 执行按钮
         btn_frame = ttk.Frame(frame)
         btn_frame.pack(pady=15)
-        ttk.Button(btn_frame, text="🚀 生成PDF标签", style='Action.TButton',
-                  command=self.run_label_generator).pack()
+        self.create_run_button(btn_frame, "🚀 生成PDF标签", self.run_label_generator, LABEL_JOB)
+        self.create_cancel_button(btn_frame, LABEL_JOB, lambda: self.label_log)
         
         # 日志区域
         log_frame = ttk.LabelFrame(frame, text="📜 运行日志", padding=5)
         log_frame.pack(fill=tk.X)
         
+        self.label_progress = self.create_progress_bar(log_frame)
         self.label_log = scrolledtext.ScrolledText(log_frame, height=4, state='disabled',
                                                    font=('Consolas', 9))
         self.label_log.pack(fill=tk.X)
@@ -228,6 +315,9 @@ class ToolsApp:
             ttk.Radiobutton(mode_frame, text=text, variable=self.img_mode_var,
                            value=value).pack(anchor=tk.W, pady=2)
         
+        self.img_profile_var = self.create_profile_selector(mode_frame)
+        self.img_timing_var = self.create_timing_option(mode_frame)
+        
         # 输出设置
         output_frame = ttk.LabelFrame(frame, text="📁 输出设置", padding=10)
         output_frame.pack(fill=tk.X, pady=5)
@@ -246,13 +336,14 @@ class ToolsApp:
         # 执行按钮
         btn_frame = ttk.Frame(frame)
         btn_frame.pack(pady=15)
-        ttk.Button(btn_frame, text="🚀 开始转换", style='Action.TButton',
-                  command=self.run_image_to_pdf).pack()
+        self.create_run_button(btn_frame, "🚀 开始转换", self.run_image_to_pdf, IMAGE_JOB)
+        self.create_cancel_button(btn_frame, IMAGE_JOB, lambda: self.img_log)
         
         # 日志区域
         log_frame = ttk.LabelFrame(frame, text="📜 运行日志", padding=5)
         log_frame.pack(fill=tk.BOTH, expand=True)
         
+        self.img_progress = self.create_progress_bar(log_frame)
         self.img_log = scrolledtext.ScrolledText(log_frame, height=6, state='disabled',
                                                  font=('Consolas', 9))
         self.img_log.pack(fill=tk.BOTH, expand=True)
@@ -323,16 +414,65 @@ class ToolsApp:
         ttk.Button(output_row, text="浏览...", 
                   command=self.browse_pdf_output).pack(side=tk.LEFT, padx=(10, 0))
         
+        # 裁剪模式选择
+        mode_frame = ttk.LabelFrame(frame, text="⚙️ 裁剪模式", padding=10)
+        mode_frame.pack(fill=tk.X, pady=5)
+        
+        self.pdf_mode_var = tk.StringVar(value="raster")
+        
+        modes = [
+            ("raster", "🖼️ 转为图片裁剪（适合扫描件）"),
+            ("clip", "✂️ 转为图片裁剪 - 快速（先低分辨率探测，只渲染内容区域）"),
+            ("vector", "📐 保留文字和矢量（只调整页面边框，文件小、速度快）"),
+        ]
+        
+        for value, text in modes:
+            ttk.Radiobutton(mode_frame, text=text, variable=self.pdf_mode_var,
+                           value=value).pack(anchor=tk.W, pady=2)
+        
+        self.pdf_profile_var = self.create_profile_selector(mode_frame)
+        
+        # 同时处理的文件数
+        cpu_count = os.cpu_count() or 1
+        file_workers_row = ttk.Frame(mode_frame)
+        file_workers_row.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(file_workers_row, text="同时处理文件数:").pack(side=tk.LEFT)
+        self.pdf_file_workers_var = tk.IntVar(value=cpu_count)
+        ttk.Spinbox(file_workers_row, from_=1, to=cpu_count * 2, width=5,
+                    textvariable=self.pdf_file_workers_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(file_workers_row, text="（文件多时使用；大于1时每个PDF内不再按页并行）",
+                 foreground='gray').pack(side=tk.LEFT)
+        
+        # 单个PDF内按页并行的进程数
+        workers_row = ttk.Frame(mode_frame)
+        workers_row.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(workers_row, text="每个PDF并行进程数:").pack(side=tk.LEFT)
+        self.pdf_page_workers_var = tk.IntVar(value=1)
+        ttk.Spinbox(workers_row, from_=1, to=cpu_count, width=5,
+                    textvariable=self.pdf_page_workers_var).pack(side=tk.LEFT, padx=5)
+        ttk.Label(workers_row, text=f"（本机 {cpu_count} 核，页数多的PDF建议调大）",
+                 foreground='gray').pack(side=tk.LEFT)
+        
+        # 增量处理
+        self.pdf_incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text="增量处理（跳过上次处理后没有变化的文件）",
+                       variable=self.pdf_incremental_var).pack(anchor=tk.W, pady=(5, 0))
+        self.pdf_prune_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(mode_frame, text="增量处理时删除源文件已不存在的输出",
+                       variable=self.pdf_prune_var).pack(anchor=tk.W, pady=2)
+        self.pdf_timing_var = self.create_timing_option(mode_frame)
+        
         # 执行按钮
         btn_frame = ttk.Frame(frame)
         btn_frame.pack(pady=15)
-        ttk.Button(btn_frame, text="🚀 开始裁剪", style='Action.TButton',
-                  command=self.run_pdf_crop).pack()
+        self.create_run_button(btn_frame, "🚀 开始裁剪", self.run_pdf_crop, PDF_JOB)
+        self.create_cancel_button(btn_frame, PDF_JOB, lambda: self.pdf_log)
         
         # 日志区域
         log_frame = ttk.LabelFrame(frame, text="📜 运行日志", padding=5)
         log_frame.pack(fill=tk.BOTH, expand=True)
         
+        self.pdf_progress = self.create_progress_bar(log_frame)
         self.pdf_log = scrolledtext.ScrolledText(log_frame, height=8, state='disabled',
                                                  font=('Consolas', 9))
         self.pdf_log.pack(fill=tk.BOTH, expand=True)
@@ -343,7 +483,69 @@ class ToolsApp:
         ttk.Button(open_btn_frame, text="📂 打开输出文件夹", 
                   command=self.open_pdf_output_folder).pack(side=tk.LEFT, padx=2)
 
+    def create_profile_selector(self, parent):
+        """创建输出编码配置下拉框，返回保存所选配置说明的变量"""
+        row = ttk.Frame(parent)
+        row.pack(fill=tk.X, pady=(5, 0))
+        ttk.Label(row, text="输出编码:").pack(side=tk.LEFT)
+        var = tk.StringVar(value=PRESET_PROFILES[0][1])
+        ttk.Combobox(row, textvariable=var, state='readonly', width=36,
+                     values=[text for _, text in PRESET_PROFILES]).pack(side=tk.LEFT, padx=5)
+        return var
+        
+    def create_progress_bar(self, parent):
+        """创建进度条和说明文字，返回 JobProgress"""
+        row = ttk.Frame(parent)
+        row.pack(fill=tk.X, pady=(0, 5))
+        bar = ttk.Progressbar(row, mode='determinate')
+        bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        label = ttk.Label(row, width=36, foreground='gray')
+        label.pack(side=tk.LEFT, padx=(10, 0))
+        progress = JobProgress(bar, label)
+        self.progress_bars.append(progress)
+        return progress
+        
+    def create_run_button(self, parent, text, command, job_name):
+        """创建开始按钮，本页已有任务时不响应"""
+        def run():
+            if job_name not in self.active_tabs:
+                command()
+        button = ttk.Button(parent, text=text, style='Action.TButton', command=run)
+        button.pack(side=tk.LEFT, padx=5)
+        self.run_buttons[job_name] = button
+        
+    def create_cancel_button(self, parent, job_name, get_log):
+        """创建取消按钮，取消本页排队和执行中的任务；日志框在按钮之后创建，所以传入取得日志框的函数"""
+        def cancel():
+            count = self.scheduler.cancel_all(lambda job: job.name == job_name)
+            if count:
+                self.log_to_widget(get_log(), f"正在取消 {count} 个任务（当前页或文件完成后停止）...")
+        ttk.Button(parent, text="⏹ 取消", style='Action.TButton', command=cancel).pack(side=tk.LEFT, padx=5)
+        
+    def create_timing_option(self, parent):
+        """创建分阶段计时选项，返回对应的变量"""
+        var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(parent, text="记录各阶段耗时（结束时在日志中汇总，并保存跟踪文件）",
+                       variable=var).pack(anchor=tk.W, pady=2)
+        return var
+        
+    def get_profile(self, var):
+        """把下拉框中的配置说明换回配置名"""
+        for name, text in PRESET_PROFILES:
+            if text == var.get():
+                return name
+        return 'lossless'
+
     # ============ 文件浏览方法 ============
+    def browse_label_file(self):
+        """选择标签文件，选择后从文件生成，不使用输入框中的内容"""
+        filename = filedialog.askopenfilename(
+            title="选择标签文件",
+            filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")]
+        )
+        if filename:
+            self.label_file_var.set(filename)
+            
     def browse_label_output(self):
         filename = filedialog.asksaveasfilename(
             title="保存PDF文件",
@@ -474,24 +676,93 @@ class ToolsApp:
         else:
             messagebox.showwarning("提示", "输出文件夹不存在")
             
+    # ============ 任务调度 ============
+    def submit_job(self, name, priority, task, widget):
+        """
+        把任务交给调度器排队，task(job) 在任务线程中执行
+        前面有其他任务时在日志中提示排队位置，任务被取消时写入日志
+        """
+        def finished():
+            self.active_tabs.discard(name)
+            self.run_buttons[name].config(state='normal')
+            
+        def on_done(job):
+            if job.status == 'cancelled':
+                self.log_to_widget(widget, "⏹ 已取消")
+            # 在任务线程中调用，按钮交给界面线程恢复；窗口已关闭时忽略
+            try:
+                self.root.after(0, finished)
+            except (tk.TclError, RuntimeError):
+                pass
+                
+        self.active_tabs.add(name)
+        self.run_buttons[name].config(state='disabled')
+        job = self.scheduler.submit(name, task, priority, on_done)
+        ahead = self.scheduler.position(job)
+        if ahead:
+            self.log_to_widget(widget, f"已加入队列，前面还有 {ahead} 个任务")
+        return job
+        
+    def on_close(self):
+        """关闭窗口时取消所有任务并结束工作进程"""
+        self.scheduler.shutdown()
+        self.root.destroy()
+        
     # ============ 日志方法 ============
     def log_to_widget(self, widget, message):
-        """线程安全的日志输出"""
-        def _log():
+        """线程安全的日志输出，只放入队列，由 refresh_ui 成批写入"""
+        self.log_queues[widget].append(message)
+        
+    def refresh_ui(self):
+        """
+        定时把各日志队列中的消息一次写入日志框并刷新进度条
+        每次最多写入 LOG_MAX_LINES 行，日志框超出 LOG_MAX_LINES 行时删除最早的行，
+        不论任务多大，界面线程每次刷新的工作量都有上限
+        """
+        for widget, queue in self.log_queues.items():
+            if not queue:
+                continue
+            count = len(queue)
+            lines = [queue.popleft() for _ in range(count)]
+            if count > LOG_MAX_LINES:
+                keep = LOG_MAX_LINES - 1
+                lines = [f"……省略 {count - keep} 行……"] + lines[-keep:]
             widget.config(state='normal')
-            widget.insert(tk.END, message + "\n")
+            widget.insert(tk.END, "\n".join(lines) + "\n")
+            line_count = int(widget.index('end-1c').split('.')[0]) - 1
+            if line_count > LOG_MAX_LINES:
+                widget.delete('1.0', f'{line_count - LOG_MAX_LINES + 1}.0')
             widget.see(tk.END)
             widget.config(state='disabled')
-        self.root.after(0, _log)
+        for progress in self.progress_bars:
+            progress.refresh()
+        self.root.after(UI_REFRESH_MS, self.refresh_ui)
+        
+    def finish_timing(self, widget, trace_path):
+        """停止分阶段计时，把汇总表格写入日志并导出跟踪文件"""
+        records = stage_timer.disable()
+        for line in stage_timer.summary_lines(records):
+            self.log_to_widget(widget, line)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(trace_path)), exist_ok=True)
+            stage_timer.write_chrome_trace(records, trace_path)
+            self.log_to_widget(widget, f"跟踪文件: {trace_path}（可用 chrome://tracing 或 ui.perfetto.dev 打开）")
+        except OSError as e:
+            self.log_to_widget(widget, f"保存跟踪文件失败: {e}")
         
     def clear_log(self, widget):
         """清空日志"""
+        self.log_queues[widget].clear()
         widget.config(state='normal')
         widget.delete(1.0, tk.END)
         widget.config(state='disabled')
 
     # ============ 标签生成器功能 ============
     def run_label_generator(self):
+        label_file = self.label_file_var.get()
+        if label_file:
+            self.run_label_file(label_file)
+            return
         content = self.label_text.get("1.0", tk.END).strip()
         output_file = self.label_output_var.get()
         
@@ -502,117 +773,83 @@ class ToolsApp:
             messagebox.showerror("错误", "请指定输出的PDF文件")
             return
             
+        timing = self.label_timing_var.get()
         self.clear_log(self.label_log)
         
-        def task():
+        def task(job):
+            if timing:
+                stage_timer.enable()
             try:
                 # 按空行分组
-                groups = [g.strip() for g in content.split('\n\n') if g.strip()]
+                groups = label_engine.parse_label_groups(content)
                 self.log_to_widget(self.label_log, f"找到 {len(groups)} 组标签数据")
+                self.label_progress.start(len(groups), '页')
                 
                 self.log_to_widget(self.label_log, "开始生成PDF...")
-                self.create_label_pdf(groups, output_file)
+                cache = ResultCache()
+                self.create_label_pdf(groups, output_file, cache, job.progress(self.label_progress.update))
+                self.log_to_widget(self.label_log, cache.summary())
                 
                 self.log_to_widget(self.label_log, f"✓ PDF生成成功: {output_file}")
                 self.root.after(0, lambda: messagebox.showinfo("完成", f"PDF生成成功!\n{output_file}"))
             except Exception as e:
                 self.log_to_widget(self.label_log, f"✗ 错误: {e}")
                 self.root.after(0, lambda: messagebox.showerror("错误", str(e)))
+            finally:
+                self.label_progress.finish()
+                if timing:
+                    self.finish_timing(self.label_log, os.path.splitext(output_file)[0] + '_trace.json')
                 
-        threading.Thread(target=task, daemon=True).start()
-        
-    def create_label_pdf(self, groups, output_filename):
-        """创建PDF文件"""
-        base_width = 1000
-        margin = 20
-        
-        # 设置中文字体
-        font_name = 'Helvetica'
-        font_paths = [
-            'C:/Windows/Fonts/simsun.ttc',
-            'C:/Windows/Fonts/simhei.ttf',
-            'C:/Windows/Fonts/msyh.ttc',
-        ]
-        
-        for font_path in font_paths:
-            if os.path.exists(font_path):
-                try:
-                    pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                    font_name = 'ChineseFont'
-                    self.log_to_widget(self.label_log, f"加载字体: {os.path.basename(font_path)}")
-                    break
-                except:
-                    continue
-        
-        # 创建临时canvas用于测量
-        temp_file = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
-        temp_file.close()
-        temp_canvas = canvas.Canvas(temp_file.name, pagesize=(base_width, 1000))
-        
-        layouts = []
-        for group in groups:
-            lines = [line for line in group.strip().split('\n') if line.strip()]
-            font_size, line_height, required_height = self.calculate_optimal_layout(
-                temp_canvas, lines, font_name, base_width, margin
-            )
-            layouts.append({
-                'lines': lines,
-                'font_size': font_size,
-                'line_height': line_height,
-                'page_height': max(required_height, 200)
-            })
+        # 标签任务很短，排在图片和PDF任务前面
+        self.submit_job(LABEL_JOB, PRIORITY_HIGH, task, self.label_log)
         
-        try:
-            os.unlink(temp_file.name)
-        except:
-            pass
-        
-        c = None
-        for i, layout in enumerate(layouts):
-            page_size = (base_width, int(layout['page_height']))
-            
-            if c is None:
-                c = canvas.Canvas(output_filename, pagesize=page_size)
-            else:
-                c.setPageSize(page_size)
-                c.showPage()
-            
-            c.setFont(font_name, layout['font_size'])
-            
-            page_width, page_height = page_size
-            start_y = page_height - margin - layout['font_size'] * 0.8
-            start_x = margin
+    def run_label_file(self, label_file):
+        """从标签文件逐组生成，内存占用与文件大小无关"""
+        output_file = self.label_output_var.get()
+        if not os.path.isfile(label_file):
+            messagebox.showerror("错误", f"找不到标签文件: {label_file}")
+            return
+        if not output_file:
+            messagebox.showerror("错误", "请指定输出的PDF文件")
+            return
             
-            for j, line in enumerate(layout['lines']):
-                y_position = start_y - (j * layout['line_height'])
-                c.drawString(start_x, y_position, line)
+        timing = self.label_timing_var.get()
+        self.clear_log(self.label_log)
         
-        if c:
-            c.save()
-            
-    def calculate_optimal_layout(self, canvas_obj, lines, font_name, page_width, margin):
-        """计算最优布局"""
-        available_width = page_width - 2 * margin
+        def task(job):
+            if timing:
+                stage_timer.enable()
+            try:
+                self.log_to_widget(self.label_log, f"逐组读取: {label_file}")
+                self.label_progress.start(0, '页')
+                pages = label_engine.create_label_pdf_streaming(
+                    label_engine.iter_label_file(label_file), output_file,
+                    log=lambda message: self.log_to_widget(self.label_log, message),
+                    progress=job.progress(self.label_progress.update)
+                )
+                if not pages:
+                    self.log_to_widget(self.label_log, "标签文件中没有标签数据")
+                    return
+                self.log_to_widget(self.label_log, f"✓ PDF生成成功: {output_file}（{pages} 页）")
+                self.root.after(0, lambda: messagebox.showinfo("完成", f"PDF生成成功!\n{output_file}"))
+            except Exception as e:
+                self.log_to_widget(self.label_log, f"✗ 错误: {e}")
+                self.root.after(0, lambda: messagebox.showerror("错误", str(e)))
+            finally:
+                self.label_progress.finish()
+                if timing:
+                    self.finish_timing(self.label_log, os.path.splitext(output_file)[0] + '_trace.json')
+                
+        # 大文件耗时较长，不占用标签任务的优先级
+        self.submit_job(LABEL_JOB, PRIORITY_NORMAL, task, self.label_log)
         
-        for font_size in range(80, 12, -2):
-            line_height = font_size * 1.1
-            
-            max_width = 0
-            for line in lines:
-                if line.strip():
-                    text_width = canvas_obj.stringWidth(line, font_name, font_size)
-                    max_width = max(max_width, text_width)
-            
-            if max_width <= available_width * 0.95:
-                total_text_height = len(lines) * line_height
-                required_height = total_text_height + margin * 2 + font_size * 0.3
-                return font_size, line_height, required_height
-        
-        font_size = 14
-        line_height = font_size * 1.1
-        total_text_height = len(lines) * line_height
-        required_height = total_text_height + margin * 2 + font_size * 0.3
-        return font_size, line_height, required_height
+    def create_label_pdf(self, groups, output_filename, cache=None, progress=None):
+        """创建PDF文件"""
+        label_engine.create_label_pdf(
+            groups, output_filename,
+            log=lambda message: self.log_to_widget(self.label_log, message),
+            cache=cache, progress=progress or self.label_progress.update
+        )
 
     # ============ 图片裁剪转PDF功能 ============
     def run_image_to_pdf(self):
@@ -626,17 +863,29 @@ class ToolsApp:
             return
             
         mode = self.img_mode_var.get()
+        img_files = list(self.img_files)
+        profile = self.get_profile(self.img_profile_var)
+        timing = self.img_timing_var.get()
+        if output.lower().endswith('.pdf'):
+            trace_path = os.path.splitext(output)[0] + '_trace.json'
+        else:
+            trace_path = os.path.join(output, TRACE_FILE_NAME)
         self.clear_log(self.img_log)
         
-        def task():
+        def task(job):
+            if timing:
+                stage_timer.enable()
             try:
-                self.log_to_widget(self.img_log, f"准备处理 {len(self.img_files)} 张图片")
+                cache = ResultCache()
+                self.log_to_widget(self.img_log, f"准备处理 {len(img_files)} 张图片")
                 self.log_to_widget(self.img_log, f"模式: {'合并为一个PDF' if mode == 'merge' else '分别转换'}")
+                self.img_progress.start(len(img_files), '张')
                 
                 if mode == "merge":
                     # 合并模式
                     output_file = output if output.lower().endswith('.pdf') else os.path.join(output, "merged.pdf")
-                    self.images_to_single_pdf(self.img_files, output_file)
+                    self.images_to_single_pdf(img_files, output_file, profile, cache,
+                                              job.progress(self.img_progress.update))
                     self.log_to_widget(self.img_log, f"✓ 合并完成: {output_file}")
                 else:
                     # 分别转换模式
@@ -644,181 +893,52 @@ class ToolsApp:
                     os.makedirs(output_folder, exist_ok=True)
                     
                     processed = 0
-                    for i, img_path in enumerate(self.img_files):
-                        self.log_to_widget(self.img_log, f"处理 {i+1}/{len(self.img_files)}: {os.path.basename(img_path)}")
-                        if self.image_to_pdf(img_path, output_folder):
+                    for i, img_path in enumerate(img_files):
+                        job.check()
+                        self.log_to_widget(self.img_log, f"处理 {i+1}/{len(img_files)}: {os.path.basename(img_path)}")
+                        if self.image_to_pdf(img_path, output_folder, profile, cache):
                             processed += 1
+                        self.img_progress.update(i + 1)
                             
-                    self.log_to_widget(self.img_log, f"✓ 完成! 成功处理 {processed}/{len(self.img_files)} 张图片")
+                    self.log_to_widget(self.img_log, cache.summary())
+                    self.log_to_widget(self.img_log, f"✓ 完成! 成功处理 {processed}/{len(img_files)} 张图片")
                 
                 self.root.after(0, lambda: messagebox.showinfo("完成", "图片处理完成!"))
             except Exception as e:
                 self.log_to_widget(self.img_log, f"✗ 错误: {e}")
                 self.root.after(0, lambda: messagebox.showerror("错误", str(e)))
+            finally:
+                self.img_progress.finish()
+                if timing:
+                    self.finish_timing(self.img_log, trace_path)
                 
-        threading.Thread(target=task, daemon=True).start()
-        
-    def crop_whitespace(self, image_path):
-        """裁剪图片周围的空白区域"""
-        img = Image.open(image_path)
-        
-        if img.mode == 'RGBA':
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[3] if len(img.split()) == 4 else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        pixels = img.load()
-        width, height = img.size
-        white_threshold = 250
-        
-        # 找边界
-        top, bottom, left, right = 0, height - 1, 0, width - 1
-        
-        for y in range(height):
-            if any(pixels[x, y][c] < white_threshold for x in range(width) for c in range(3)):
-                top = y
-                break
-                
-        for y in range(height - 1, -1, -1):
-            if any(pixels[x, y][c] < white_threshold for x in range(width) for c in range(3)):
-                bottom = y
-                break
-                
-        for x in range(width):
-            if any(pixels[x, y][c] < white_threshold for y in range(height) for c in range(3)):
-                left = x
-                break
-                
-        for x in range(width - 1, -1, -1):
-            if any(pixels[x, y][c] < white_threshold for y in range(height) for c in range(3)):
-                right = x
-                break
-        
-        if left < right and top < bottom:
-            return img.crop((left, top, right + 1, bottom + 1))
-        return img
-        
-    def crop_whitespace_from_img(self, img):
-        """裁剪PIL Image对象的空白区域"""
-        if img.mode == 'RGBA':
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[3] if len(img.split()) == 4 else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        pixels = img.load()
-        width, height = img.size
-        white_threshold = 250
-        
-        top, bottom, left, right = 0, height - 1, 0, width - 1
-        
-        for y in range(height):
-            if any(pixels[x, y][c] < white_threshold for x in range(width) for c in range(3)):
-                top = y
-                break
-                
-        for y in range(height - 1, -1, -1):
-            if any(pixels[x, y][c] < white_threshold for x in range(width) for c in range(3)):
-                bottom = y
-                break
-                
-        for x in range(width):
-            if any(pixels[x, y][c] < white_threshold for y in range(height) for c in range(3)):
-                left = x
-                break
-                
-        for x in range(width - 1, -1, -1):
-            if any(pixels[x, y][c] < white_threshold for y in range(height) for c in range(3)):
-                right = x
-                break
-        
-        if left < right and top < bottom:
-            return img.crop((left, top, right + 1, bottom + 1))
-        return img
+        self.submit_job(IMAGE_JOB, PRIORITY_NORMAL, task, self.img_log)
         
-    def image_to_pdf(self, img_path, output_dir):
+    def image_to_pdf(self, img_path, output_dir, profile='lossless', cache=None):
         """将单张图片转换为PDF"""
-        temp_file_path = None
         try:
-            cropped_img = self.crop_whitespace(img_path)
-            
             base_name = os.path.splitext(os.path.basename(img_path))[0]
             output_pdf = os.path.join(output_dir, f"{base_name}.pdf")
             
-            # 创建临时文件
-            temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-            temp_file_path = temp_file.name
-            temp_file.close()
-            
-            # 保存图片到临时文件
-            cropped_img.save(temp_file_path, 'PNG')
-            
-            # 创建PDF
-            c = canvas.Canvas(output_pdf, pagesize=cropped_img.size)
-            c.drawImage(temp_file_path, 0, 0, 
-                      width=cropped_img.size[0], 
-                      height=cropped_img.size[1])
-            c.save()
+            # 图片在内存中交给PDF写入，JPEG不重新编码
+            crop_images_to_pdf.image_file_to_pdf(
+                img_path, output_pdf,
+                log=lambda message: self.log_to_widget(self.img_log, message),
+                profile=profile, cache=cache
+            )
             
             return True
         except Exception as e:
             self.log_to_widget(self.img_log, f"  处理失败: {e}")
             return False
-        finally:
-            # 确保删除临时文件
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except:
-                    pass
             
-    def images_to_single_pdf(self, img_paths, output_pdf):
+    def images_to_single_pdf(self, img_paths, output_pdf, profile='lossless', cache=None, progress=None):
         """将多张图片合并为一个PDF"""
-        c = None
-        temp_files = []
-        
-        try:
-            for i, img_path in enumerate(img_paths):
-                self.log_to_widget(self.img_log, f"处理 {i+1}/{len(img_paths)}: {os.path.basename(img_path)}")
-                
-                try:
-                    img = Image.open(img_path)
-                    cropped_img = self.crop_whitespace_from_img(img)
-                    
-                    if c is None:
-                        c = canvas.Canvas(output_pdf, pagesize=cropped_img.size)
-                    else:
-                        c.setPageSize(cropped_img.size)
-                        c.showPage()
-                    
-                    # 创建临时文件
-                    temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
-                    temp_file_path = temp_file.name
-                    temp_file.close()
-                    temp_files.append(temp_file_path)
-                    
-                    # 保存图片到临时文件
-                    cropped_img.save(temp_file_path, 'PNG')
-                    c.drawImage(temp_file_path, 0, 0, 
-                              width=cropped_img.size[0], 
-                              height=cropped_img.size[1])
-                        
-                except Exception as e:
-                    self.log_to_widget(self.img_log, f"  处理失败: {e}")
-            
-            if c:
-                c.save()
-        finally:
-            # 清理所有临时文件
-            for temp_file_path in temp_files:
-                if os.path.exists(temp_file_path):
-                    try:
-                        os.unlink(temp_file_path)
-                    except:
-                        pass
+        return crop_images_to_pdf.images_to_single_pdf(
+            img_paths, output_pdf,
+            log=lambda message: self.log_to_widget(self.img_log, message),
+            profile=profile, cache=cache, progress=progress or self.img_progress.update
+        )
 
     # ============ PDF空白裁剪功能 ============
     def run_pdf_crop(self):
@@ -832,9 +952,18 @@ class ToolsApp:
             messagebox.showerror("错误", "请指定输出文件夹")
             return
             
+        mode = self.pdf_mode_var.get()
+        file_workers = self.pdf_file_workers_var.get()
+        page_workers = self.pdf_page_workers_var.get()
+        profile = self.get_profile(self.pdf_profile_var)
+        incremental = self.pdf_incremental_var.get()
+        prune = self.pdf_prune_var.get()
+        timing = self.pdf_timing_var.get()
         self.clear_log(self.pdf_log)
         
-        def task():
+        def task(job):
+            if timing:
+                stage_timer.enable()
             try:
                 self.log_to_widget(self.pdf_log, f"扫描文件夹: {input_folder}")
                 pdf_files = self.find_pdf_files(input_folder)
@@ -846,25 +975,51 @@ class ToolsApp:
                 self.log_to_widget(self.pdf_log, f"找到 {len(pdf_files)} 个PDF文件")
                 
                 os.makedirs(output_folder, exist_ok=True)
+                # 只有一个PDF时按页显示进度，否则按文件
+                single = len(pdf_files) == 1
+                self.pdf_progress.start(0 if single else len(pdf_files), '页' if single else '个')
                 processed = 0
+                skipped = 0
+                finished = 0
+                results = pdf_crop_tool.sync_pdf_folder(
+                    input_folder, output_folder, pdf_files, mode, file_workers, page_workers,
+                    log=lambda message: self.log_to_widget(self.pdf_log, message),
+                    profile=profile, incremental=incremental, prune=incremental and prune,
+                    cache=ResultCache(),
+                    # 每页完成后检查是否已取消，只有一个PDF时同时更新进度
+                    page_progress=job.progress(self.pdf_progress.update if single else None),
+                    executor=self.scheduler.pool
+                )
+                # 被取消时关闭结果生成器，还没开始的文件随之取消，清单照常保存
+                with closing(results):
+                    for rel_path, status, _ in results:
+                        if status != 'removed':
+                            finished += 1
+                            if not single:
+                                self.pdf_progress.update(finished)
+                        if status == 'done':
+                            processed += 1
+                        elif status == 'failed':
+                            self.log_to_widget(self.pdf_log, f"  ✗ 处理失败: {rel_path}")
+                        elif status == 'skipped':
+                            skipped += 1
+                        elif status == 'removed':
+                            self.log_to_widget(self.pdf_log, f"  🗑 源文件已删除，移除输出: {rel_path}")
+                        job.check()
                 
-                for i, pdf_path in enumerate(pdf_files):
-                    rel_path = os.path.relpath(pdf_path, input_folder)
-                    self.log_to_widget(self.pdf_log, f"处理 {i+1}/{len(pdf_files)}: {rel_path}")
-                    
-                    output_pdf_path = os.path.join(output_folder, rel_path)
-                    os.makedirs(os.path.dirname(output_pdf_path), exist_ok=True)
-                    
-                    if self.crop_pdf_pages(pdf_path, output_pdf_path):
-                        processed += 1
-                        
+                if incremental:
+                    self.log_to_widget(self.pdf_log, f"未变化跳过 {skipped} 个PDF")
                 self.log_to_widget(self.pdf_log, f"✓ 完成! 成功处理 {processed}/{len(pdf_files)} 个PDF")
                 self.root.after(0, lambda: messagebox.showinfo("完成", f"成功处理 {processed} 个PDF文件"))
             except Exception as e:
                 self.log_to_widget(self.pdf_log, f"✗ 错误: {e}")
                 self.root.after(0, lambda: messagebox.showerror("错误", str(e)))
+            finally:
+                self.pdf_progress.finish()
+                if timing:
+                    self.finish_timing(self.pdf_log, os.path.join(output_folder, TRACE_FILE_NAME))
                 
-        threading.Thread(target=task, daemon=True).start()
+        self.submit_job(PDF_JOB, PRIORITY_LOW, task, self.pdf_log)
         
     def find_pdf_files(self, folder_path):
         """递归查找所有PDF文件"""
@@ -874,82 +1029,14 @@ class ToolsApp:
                 if file.lower().endswith('.pdf'):
                     pdf_files.append(os.path.join(root, file))
         return pdf_files
-        
-    def crop_pdf_pages(self, input_pdf_path, output_pdf_path):
-        """裁剪PDF每一页的空白区域"""
-        try:
-            pdf_document = fitz.open(input_pdf_path)
-            new_pdf = fitz.open()
-            
-            total_pages = len(pdf_document)
-            
-            for page_num in range(total_pages):
-                page = pdf_document[page_num]
-                
-                mat = fitz.Matrix(2.0, 2.0)
-                pix = page.get_pixmap(matrix=mat)
-                img_data = pix.tobytes("png")
-                img_stream = BytesIO(img_data)
-                
-                with Image.open(img_stream) as img:
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    pixels = img.load()
-                    width, height = img.size
-                    white_threshold = 240
-                    
-                    # 找边界
-                    top, bottom, left, right = 0, height - 1, 0, width - 1
-                    
-                    for y in range(height):
-                        if any(pixels[x, y][c] < white_threshold for x in range(width) for c in range(3)):
-                            top = y
-                            break
-                            
-                    for y in range(height - 1, -1, -1):
-                        if any(pixels[x, y][c] < white_threshold for x in range(width) for c in range(3)):
-                            bottom = y
-                            break
-                            
-                    for x in range(width):
-                        if any(pixels[x, y][c] < white_threshold for y in range(height) for c in range(3)):
-                            left = x
-                            break
-                            
-                    for x in range(width - 1, -1, -1):
-                        if any(pixels[x, y][c] < white_threshold for y in range(height) for c in range(3)):
-                            right = x
-                            break
-                    
-                    if left < right and top < bottom:
-                        cropped = img.crop((left, top, right + 1, bottom + 1))
-                    else:
-                        cropped = img
-                    
-                    if cropped.mode != 'RGB':
-                        cropped = cropped.convert('RGB')
-                    
-                    output_stream = BytesIO()
-                    cropped.save(output_stream, format='PNG', dpi=(300, 300))
-                    output_stream.seek(0)
-                    
-                    img_rect = fitz.Rect(0, 0, cropped.width, cropped.height)
-                    new_page = new_pdf.new_page(width=cropped.width, height=cropped.height)
-                    new_page.insert_image(img_rect, stream=output_stream.getvalue())
-            
-            new_pdf.save(output_pdf_path)
-            new_pdf.close()
-            pdf_document.close()
-            
-            return True
-            
-        except Exception as e:
-            self.log_to_widget(self.pdf_log, f"  处理失败: {e}")
-            return False
 
 
 def main():
+    # 打包后的exe使用多进程时需要
+    multiprocessing.freeze_support()
+    # 界面只处理本机文件，允许打开超大扫描图片
+    allow_large_images()
+    
     # 设置高DPI支持
     try:
         from ctypes import windll
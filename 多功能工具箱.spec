@@ -20,6 +20,18 @@ a = Analysis(
         'reportlab.pdfbase.ttfonts',
         'reportlab.pdfbase.pdfmetrics',
         'reportlab.lib.colors',
+        'numpy',
+        'crop_engine',
+        'pdf_crop_tool',
+        'crop_images_to_pdf',
+        'pdf_writer',
+        'output_profiles',
+        'folder_manifest',
+        'result_cache',
+        'label_engine',
+        'font_registry',
+        'stage_timer',
+        'job_scheduler',
     ],
     hookspath=[],
     hooksconfig={},